@@ -0,0 +1,5 @@
+"""Todoアプリケーションのベンチマーク。
+
+各モジュールはリポジトリのルートから ``python -m benchmarks.<name>`` で
+実行できます。データベースは既定でインメモリのSQLiteを使用します。
+"""
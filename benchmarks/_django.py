@@ -0,0 +1,30 @@
+"""ベンチマーク用のDjango初期化ヘルパー。"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+
+def setup(migrate: bool = True) -> None:
+    """Djangoを初期化し、必要であればマイグレーションを適用する。
+
+    ``DJANGO_SETTINGS_MODULE`` が未設定の場合は ``todoproject.settings`` を
+    使用し、PostgreSQLが指定されていなければインメモリのSQLiteを使用します。
+
+    Args:
+        migrate: Trueの場合はマイグレーションを適用する。
+    """
+    root = Path(__file__).resolve().parent.parent
+    if str(root) not in sys.path:
+        sys.path.insert(0, str(root))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoproject.settings')
+    os.environ.setdefault('USE_SQLITE_FOR_TESTS', 'true')
+
+    import django
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0, interactive=False)
@@ -0,0 +1,198 @@
+"""WSGI（同期ビュー）とASGI（非同期ビュー）のスループット比較ベンチマーク。
+
+同じデータに対して、一覧ページ・JSON一覧API・完了切り替えへ
+一定の同時実行数でリクエストを送り、1秒あたりのリクエスト数と
+p50/p99レイテンシを計測します。
+
+- ``wsgi``: 同期ビューを同期ハンドラーで処理し、スレッドで同時実行する
+  （gunicornのgthreadワーカー相当）。
+- ``asgi-sync``: 同期ビューを非同期ハンドラーで処理する（ASGIで
+  ``TODO_ASYNC_VIEWS`` を有効にしない場合）。
+- ``asgi``: ``TODO_ASYNC_VIEWS`` を有効にし、非同期ビューを
+  1つのイベントループ上のコルーチンで同時実行する。
+
+URL設定は ``TODO_ASYNC_VIEWS`` で起動時に決まるため、モードごとに
+子プロセスを起動し、複数スレッドから共有できるファイルのSQLiteを使用します。
+リクエストはDjangoのテストクライアントのハンドラー（ミドルウェアを含む）で
+プロセス内から送るため、HTTPサーバーやネットワークのコストは含みません。
+
+使い方::
+
+    python -m benchmarks.asgi_load --todos 200 --requests 2000 --concurrency 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks import _django
+
+
+MODES = ['wsgi', 'asgi-sync', 'asgi']
+SCENARIOS = ['list', 'api', 'toggle']
+
+
+def _summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    """レイテンシ（秒）の一覧から結果の辞書を作る。"""
+    ordered = sorted(latencies)
+    quantiles = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': len(ordered) / elapsed if elapsed else 0.0,
+        'p50_ms': quantiles[49] * 1000,
+        'p99_ms': quantiles[98] * 1000,
+    }
+
+
+def _seed(todos: int) -> tuple[Any, list[int]]:
+    """ベンチマーク用のユーザーとTodoを作成する。"""
+    from django.contrib.auth.models import User
+    from todo.models import Todo
+
+    user = User.objects.create_user(username='bench', password='bench-pass-123')
+    Todo.objects.bulk_create(
+        Todo(title=f'Todo {i}', description='ベンチマーク', user=user) for i in range(todos)
+    )
+    return user, list(Todo.objects.filter(user=user).values_list('pk', flat=True)[:50])
+
+
+def _request_args(scenario: str, ids: list[int], index: int) -> tuple[str, str]:
+    """シナリオに応じたHTTPメソッドとパスを返す。"""
+    from django.urls import reverse
+
+    if scenario == 'list':
+        return 'get', reverse('todo_list')
+    if scenario == 'api':
+        return 'get', reverse('api_todo_list')
+    return 'post', reverse('todo_toggle', args=[ids[index % len(ids)]])
+
+
+def _run_threads(user: Any, ids: list[int], scenario: str, requests: int, concurrency: int) -> dict[str, Any]:
+    """同期ハンドラーをスレッドで同時実行する。"""
+    from django.db import connections
+    from django.test import Client
+
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker() -> None:
+        nonlocal errors
+        client = Client()
+        client.force_login(user)
+        for index in counter:
+            method, path = _request_args(scenario, ids, index)
+            started = time.perf_counter()
+            response = getattr(client, method)(path)
+            latency = time.perf_counter() - started
+            with lock:
+                latencies.append(latency)
+                errors += response.status_code >= 400
+        connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def _run_coroutines(user: Any, ids: list[int], scenario: str, requests: int, concurrency: int) -> dict[str, Any]:
+    """非同期ハンドラーを1つのイベントループ上で同時実行する。"""
+    from asgiref.sync import sync_to_async
+    from django.test import AsyncClient
+
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        client = AsyncClient()
+        await client.aforce_login(user)
+        for index in counter:
+            method, path = await sync_to_async(_request_args)(scenario, ids, index)
+            started = time.perf_counter()
+            response = await getattr(client, method)(path)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_mode(mode: str, todos: int, requests: int, concurrency: int) -> dict[str, Any]:
+    """子プロセス内で1つのモードの全シナリオを計測する。"""
+    _django.setup()
+    from django.conf import settings
+
+    # テストクライアントが送るホスト名を許可する
+    settings.ALLOWED_HOSTS.append('testserver')
+    user, ids = _seed(todos)
+    results = {}
+    for scenario in SCENARIOS:
+        if mode == 'wsgi':
+            results[scenario] = _run_threads(user, ids, scenario, requests, concurrency)
+        else:
+            results[scenario] = asyncio.run(_run_coroutines(user, ids, scenario, requests, concurrency))
+    return results
+
+
+def _spawn(mode: str, args: argparse.Namespace) -> dict[str, Any]:
+    """モードごとに環境変数を設定した子プロセスでベンチマークを実行する。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            USE_SQLITE_FOR_TESTS='true',
+            SQLITE_PATH=str(Path(tmp) / 'bench.sqlite3'),
+            TODO_ASYNC_VIEWS='true' if mode == 'asgi' else 'false',
+        )
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.asgi_load', '--child', mode,
+             '--todos', str(args.todos), '--requests', str(args.requests),
+             '--concurrency', str(args.concurrency)],
+            env=env, check=True, capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent.parent,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--todos', type=int, default=200, help='ユーザーのTodo件数')
+    parser.add_argument('--requests', type=int, default=2000, help='シナリオごとのリクエスト数')
+    parser.add_argument('--concurrency', type=int, default=16, help='同時実行数')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.todos, args.requests, args.concurrency)))
+        return
+
+    print(f'todos={args.todos} requests={args.requests} concurrency={args.concurrency}')
+    print(f"{'mode':>10} {'scenario':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for mode in args.modes:
+        for scenario, result in _spawn(mode, args).items():
+            print(f"{mode:>10} {scenario:>8} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
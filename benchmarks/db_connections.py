@@ -0,0 +1,89 @@
+"""データベース接続の再利用によるリクエストごとのレイテンシの比較。
+
+本番用設定のgunicornを次の設定で順に起動し、``benchmarks.hot_paths`` の
+HTTPモードでリクエストを送ってp50/p95レイテンシを比較します。計測後に
+サーバーの ``/metrics`` から、そのワーカーが新しく開いた接続の数も取得します。
+
+- ``per-request``: ``DB_CONN_MAX_AGE=0``（リクエストごとに接続し直す）。
+- ``persistent``: ``DB_CONN_MAX_AGE=60``、ヘルスチェックあり。
+- ``pool``: ``DB_POOL=true``（psycopg 3のコネクションプール。PostgreSQLのみ）。
+
+接続にかかる時間を見るため、既定ではワーカー1個・同時実行数1で計測します。
+PostgreSQLで計測する場合は ``POSTGRES_*`` を設定し、``--keep-env`` を
+指定してください（既定は一時ファイルのSQLiteで、接続のコストは小さくなります）。
+
+使い方::
+
+    python -m benchmarks.db_connections --keep-env --requests 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import tempfile
+import urllib.request
+from pathlib import Path
+
+from benchmarks import _django
+from benchmarks.serving import free_port, gunicorn_command, server
+
+
+MODES = {
+    'per-request': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'false'},
+    'persistent': {'DB_CONN_MAX_AGE': '60', 'DB_CONN_HEALTH_CHECKS': 'true', 'DB_POOL': 'false'},
+    'pool': {'DB_POOL': 'true'},
+}
+
+
+def _connections_opened(base_url: str) -> int:
+    """サーバーのメトリクスから新しく開いた接続の数を読み取る。"""
+    with urllib.request.urlopen(f'{base_url}/metrics') as response:
+        body = response.read().decode()
+    return sum(int(value) for value in re.findall(r'^todo_db_connections_opened_total\{[^}]*\} (\d+)$',
+                                                   body, re.MULTILINE))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--workers', type=int, default=1, help='gunicornのワーカー数')
+    parser.add_argument('--concurrency', type=int, default=1, help='同時に送るリクエスト数')
+    parser.add_argument('--requests', type=int, default=500, help='シナリオごとのリクエスト数')
+    parser.add_argument('--todos', type=int, default=200, help='ユーザーごとのTodo件数')
+    parser.add_argument('--scenarios', nargs='+', default=['list', 'toggle'])
+    parser.add_argument('--keep-env', action='store_true',
+                        help='一時SQLiteを使わず、現在の環境変数のデータベースを使用する')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.keep_env:
+            os.environ['USE_SQLITE_FOR_TESTS'] = 'true'
+            os.environ['SQLITE_PATH'] = str(Path(tmp) / 'connections.sqlite3')
+        _django.setup()
+        from django.db import connection
+        from benchmarks import hot_paths
+
+        print(f'database={connection.vendor} workers={args.workers} concurrency={args.concurrency} '
+              f'requests={args.requests}')
+        print(f"{'mode':>12} {'scenario':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'opened':>7}")
+        for mode in args.modes:
+            if mode == 'pool' and connection.vendor != 'postgresql':
+                print(f"{mode:>12}  （PostgreSQL以外では使用できないためスキップ）")
+                continue
+            port = free_port()
+            command, env = gunicorn_command(port, args.workers)
+            with server(mode, command, dict(env, **MODES[mode]), port) as base_url:
+                result = hot_paths.run(
+                    users=1, todos=args.todos, requests=args.requests, scenarios=args.scenarios,
+                    base_url=base_url, concurrency=args.concurrency,
+                )
+                opened = _connections_opened(base_url)
+            for scenario, summary in result['scenarios'].items():
+                print(f"{mode:>12} {scenario:>8} {summary['throughput']:>9.1f} {summary['p50_ms']:>9.2f} "
+                      f"{summary['p95_ms']:>9.2f} {opened:>7}")
+
+
+if __name__ == '__main__':
+    main()
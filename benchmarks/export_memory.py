@@ -0,0 +1,66 @@
+"""エクスポートのメモリ使用量ベンチマーク。
+
+ユーザーのTodo件数を変えながら、ストリーミングエクスポート
+（``todo.export``）と、全件をモデルインスタンスとして読み込む
+素朴な実装のピークメモリを ``tracemalloc`` で比較します。
+
+使い方::
+
+    python -m benchmarks.export_memory --sizes 1000 10000 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+from typing import Callable
+
+from benchmarks import _django
+
+
+def _measure(func: Callable[[], int]) -> tuple[int, float, float]:
+    """関数実行中のピークメモリ（KiB）と経過時間（秒）を測定する。"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1024, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    args = parser.parse_args()
+
+    _django.setup()
+    from django.contrib.auth.models import User
+    from todo.export import EXPORTERS
+    from todo.models import Todo
+
+    print(f"{'rows':>8} {'stream KiB':>12} {'stream s':>9} {'naive KiB':>12} {'naive s':>9}")
+    for size in args.sizes:
+        user = User.objects.create_user(username=f'export-bench-{size}')
+        Todo.objects.bulk_create(
+            (Todo(title=f'Todo {i}', description='説明' * 20, user=user) for i in range(size)),
+            batch_size=2000,
+        )
+        exporter = EXPORTERS[args.format]
+
+        def stream() -> int:
+            return sum(len(chunk) for chunk in exporter(user.pk))
+
+        def naive() -> int:
+            todos = list(Todo.objects.filter(user=user))
+            return sum(len(f'{t.pk},{t.title},{t.description},{t.completed}') for t in todos)
+
+        _, stream_kib, stream_s = _measure(stream)
+        _, naive_kib, naive_s = _measure(naive)
+        print(f'{size:>8} {stream_kib:>12.0f} {stream_s:>9.3f} {naive_kib:>12.0f} {naive_s:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
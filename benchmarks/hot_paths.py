@@ -0,0 +1,475 @@
+"""Todoの主要な操作（一覧・切り替え・作成・更新・削除）のベンチマーク。
+
+ユーザーとTodoを作成し、各シナリオのリクエストを送って
+p50/p95/p99レイテンシとスループットを計測します。結果はJSONで保存でき、
+以前の結果と比較して性能の劣化（リグレッション）を検出できます。
+
+リクエストは次のいずれかで送ります。
+
+- Djangoのテストクライアント（既定）: ミドルウェアを含むハンドラーを
+  プロセス内から呼び出します。データの作成から計測までを1つの
+  トランザクションで行い、最後にロールバックするため、データベースに
+  データは残りません。ビュー内の ``transaction.atomic`` はセーブポイントになります。
+- 実際のHTTPサーバー（``base_url`` を指定した場合）: gunicornやuvicornで
+  起動したサーバーへurllibでリクエストを送ります。サーバーが同じ
+  データベースを読めるよう、作成したデータはコミットし、計測後に削除します。
+
+通常は管理コマンドから実行します::
+
+    python manage.py benchmark_todos --users 5 --todos 1000 --output after.json --compare before.json
+
+``python -m benchmarks.hot_paths`` で実行した場合は、インメモリのSQLiteに
+マイグレーションを適用してから同じ管理コマンドを実行します。
+"""
+
+from __future__ import annotations
+
+import http.cookiejar
+import math
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Optional
+
+from benchmarks import _django
+
+
+SCENARIOS = ['list', 'toggle', 'create', 'update', 'delete']
+
+# シナリオごとに成功とみなすステータスコード。作成・更新はフォームの検証エラーでも
+# 200を返すため、リダイレクト（302）以外はエラーとして数える
+EXPECTED_STATUS = {
+    'list': 200,
+    'toggle': 200,
+    'create': 302,
+    'update': 302,
+    'delete': 200,
+}
+
+USERNAME_PREFIX = 'todo-bench-'
+PASSWORD = 'bench-pass-123'
+
+# 期限の分布（重み, 種類）。完了済みの割合は COMPLETED_RATIO
+DUE_DATE_DISTRIBUTION = [
+    (35, 'none'),
+    (15, 'overdue'),
+    (15, 'due_soon'),
+    (35, 'upcoming'),
+]
+COMPLETED_RATIO = 0.3
+
+# 比較する指標と、値が大きいほど悪いかどうか
+COMPARED_METRICS = {
+    'p50_ms': True,
+    'p95_ms': True,
+    'throughput': False,
+    'errors': True,
+}
+# 同じデータ・同じ環境でも実行ごとに1〜2割程度ばらつくため、既定のしきい値は20%
+DEFAULT_THRESHOLD = 0.2
+
+
+@dataclass
+class BenchmarkUser:
+    """ベンチマーク用のユーザーと、操作対象のTodoのID。
+
+    Attributes:
+        user: ユーザー。
+        todo_ids: 切り替え・更新の対象にするTodoのID。
+        deletable_ids: 削除シナリオで使用するTodoのID（1回ずつ使用）。
+    """
+
+    user: Any
+    todo_ids: list[int]
+    deletable_ids: list[int]
+
+
+def due_date_for(rng: random.Random, now: datetime, allow_overdue: bool = True) -> Optional[datetime]:
+    """:data:`DUE_DATE_DISTRIBUTION` に従って期限を1つ選ぶ。
+
+    Args:
+        rng: 乱数生成器。
+        now: 基準時刻。
+        allow_overdue: 期限切れの期限を選ぶかどうか。フォームは過去の期限を
+            受け付けないため、作成・更新のリクエストではFalseにします。
+
+    Returns:
+        期限（期限なしの場合はNone）。
+    """
+    weights, kinds = zip(*(
+        (weight, kind) for weight, kind in DUE_DATE_DISTRIBUTION if allow_overdue or kind != 'overdue'
+    ))
+    kind = rng.choices(kinds, weights)[0]
+    if kind == 'overdue':
+        return now - timedelta(minutes=rng.randint(60, 30 * 24 * 60))
+    if kind == 'due_soon':
+        return now + timedelta(minutes=rng.randint(5, 24 * 60))
+    if kind == 'upcoming':
+        return now + timedelta(minutes=rng.randint(24 * 60, 60 * 24 * 60))
+    return None
+
+
+def seed(users: int, todos: int, deletable: int, rng: random.Random) -> list[BenchmarkUser]:
+    """ベンチマーク用のユーザーとTodoを作成する。
+
+    Todoは ``bulk_create`` で作成し、通常の作成と同じく ``todos_changed``
+    を送信して検索インデックスと変更履歴も更新します。
+
+    Args:
+        users: 作成するユーザー数。
+        todos: ユーザーごとのTodo件数。
+        deletable: ユーザーごとに追加で作成する削除シナリオ用のTodo件数。
+        rng: 乱数生成器。
+
+    Returns:
+        作成したユーザーのリスト。
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from todo.models import Todo
+    from todo.signals import ACTION_CREATED, send_todos_changed
+
+    now = timezone.now()
+    seeded = []
+    for index in range(users):
+        user = User.objects.create_user(username=f'{USERNAME_PREFIX}{index}', password=PASSWORD)
+        rows = [
+            Todo(
+                title=f'Todo {i}',
+                description='ベンチマーク用のTodo',
+                user=user,
+                completed=rng.random() < COMPLETED_RATIO,
+                due_date=due_date_for(rng, now),
+            )
+            for i in range(todos + deletable)
+        ]
+        Todo.objects.bulk_create(rows, batch_size=2000)
+        ids = [todo.pk for todo in rows]
+        send_todos_changed(user.pk, ids, ACTION_CREATED)
+        seeded.append(BenchmarkUser(user, ids[:todos], ids[todos:]))
+    return seeded
+
+
+def cleanup() -> int:
+    """ベンチマーク用のユーザーとそのTodoを削除する。
+
+    Returns:
+        削除したユーザー数。
+    """
+    from django.contrib.auth.models import User
+
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    count = users.count()
+    users.delete()
+    return count
+
+
+class ClientTarget:
+    """Djangoのテストクライアントでリクエストを送る。"""
+
+    def __init__(self, bench_user: BenchmarkUser) -> None:
+        from django.test import Client
+
+        self.client = Client()
+        self.client.force_login(bench_user.user)
+
+    def request(self, method: str, path: str, data: Optional[dict[str, Any]] = None,
+                headers: Optional[dict[str, str]] = None) -> int:
+        """リクエストを送り、ステータスコードを返す。"""
+        response = getattr(self.client, method)(path, data or {}, headers=headers)
+        if response.streaming:
+            # ストリーミングレスポンスは最後まで読んだ時点を完了とする
+            b''.join(response.streaming_content)
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """リダイレクトをたどらない（テストクライアントと同じく302を結果とする）。"""
+
+    def redirect_request(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+
+class HttpTarget:
+    """実際のHTTPサーバーへurllibでリクエストを送る。
+
+    ログインページからCSRFトークンを取得してログインし、
+    以降のリクエストではセッションCookieとCSRFトークンを送ります。
+    リダイレクトはたどらないため、作成・更新の時間に一覧の描画は含みません。
+    """
+
+    def __init__(self, bench_user: BenchmarkUser, base_url: str) -> None:
+        from django.conf import settings
+        from django.urls import reverse
+
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+        self.csrf_cookie = settings.CSRF_COOKIE_NAME
+        self.request('get', reverse('login'))
+        status = self.request('post', reverse('login'), {
+            'username': bench_user.user.username,
+            'password': PASSWORD,
+        })
+        if not self._cookie(settings.SESSION_COOKIE_NAME):
+            raise RuntimeError(f'{bench_user.user.username} でログインできませんでした（{status}）。')
+
+    def _cookie(self, name: str) -> Optional[str]:
+        return next((cookie.value for cookie in self.cookies if cookie.name == name), None)
+
+    def request(self, method: str, path: str, data: Optional[dict[str, Any]] = None,
+                headers: Optional[dict[str, str]] = None) -> int:
+        """リクエストを送り、ステータスコードを返す。"""
+        url = self.base_url + path
+        body = None
+        headers = dict(headers or {}, Referer=self.base_url + '/')
+        if method == 'post':
+            token = self._cookie(self.csrf_cookie)
+            if token:
+                headers['X-CSRFToken'] = token
+            body = urllib.parse.urlencode(data or {}).encode()
+        elif data:
+            url += '?' + urllib.parse.urlencode(data)
+        request = urllib.request.Request(url, data=body, headers=headers, method=method.upper())
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            exc.close()
+            return exc.code
+
+
+def _request_args(scenario: str, bench_user: BenchmarkUser, index: int,
+                  rng: random.Random) -> tuple[str, str, Optional[dict[str, Any]], Optional[dict[str, str]]]:
+    """シナリオのindex番目のリクエストのメソッド・パス・データ・ヘッダーを返す。"""
+    from django.urls import reverse
+    from django.utils import timezone
+
+    def form_data() -> dict[str, Any]:
+        due_date = due_date_for(rng, timezone.now(), allow_overdue=False)
+        return {
+            'title': f'ベンチマーク {index}',
+            'description': 'ベンチマークで作成・更新したTodo',
+            'due_date': timezone.localtime(due_date).strftime('%Y-%m-%dT%H:%M') if due_date else '',
+        }
+
+    todo_id = bench_user.todo_ids[index % len(bench_user.todo_ids)]
+    if scenario == 'list':
+        return 'get', reverse('todo_list'), None, None
+    if scenario == 'toggle':
+        return 'post', reverse('todo_toggle', args=[todo_id]), None, None
+    if scenario == 'create':
+        return 'post', reverse('todo_create'), form_data(), None
+    if scenario == 'update':
+        return 'post', reverse('todo_update', args=[todo_id]), form_data(), None
+    return ('post', reverse('todo_delete', args=[bench_user.deletable_ids[index]]), None,
+            {'X-Requested-With': 'XMLHttpRequest'})
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    """レイテンシ（秒）の一覧から結果の辞書を作る。
+
+    Returns:
+        リクエスト数・エラー数・スループット（リクエスト/秒）と、
+        平均・p50・p95・p99のレイテンシ（ミリ秒）。
+    """
+    ordered = sorted(latencies)
+    quantiles = statistics.quantiles(ordered, n=100, method='inclusive') if len(ordered) > 1 else ordered * 99
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': len(ordered) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': quantiles[49] * 1000 if ordered else 0.0,
+        'p95_ms': quantiles[94] * 1000 if ordered else 0.0,
+        'p99_ms': quantiles[98] * 1000 if ordered else 0.0,
+    }
+
+
+def run_scenario(scenario: str, users: list[BenchmarkUser], targets: list[list[Any]],
+                 requests: int, warmup: int, rng: random.Random) -> dict[str, Any]:
+    """1つのシナリオを計測する。
+
+    i番目のリクエストは ``users[i % len(users)]`` のユーザーで送ります。
+    ウォームアップのリクエストは計測に含めません。
+
+    Args:
+        scenario: シナリオ名（:data:`SCENARIOS` のいずれか）。
+        users: ベンチマーク用のユーザー。
+        targets: 同時実行するワーカーごとの、ユーザーごとの送信先。
+        requests: 計測するリクエスト数。
+        warmup: 計測前に送るリクエスト数。
+        rng: 乱数生成器。
+
+    Returns:
+        :func:`summarize` の結果。
+    """
+    # 削除シナリオでは同じTodoを2回削除しないよう、ユーザーごとの通し番号を使う
+    def plan(start: int, stop: int) -> Iterator[tuple[int, tuple[Any, ...]]]:
+        for i in range(start, stop):
+            bench_user = users[i % len(users)]
+            yield i % len(users), _request_args(scenario, bench_user, i // len(users), rng)
+
+    for user_index, args in plan(0, warmup):
+        targets[0][user_index].request(*args)
+
+    planned = iter(list(plan(warmup, warmup + requests)))
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(worker_targets: list[Any]) -> None:
+        nonlocal errors
+        for user_index, args in planned:
+            started = time.perf_counter()
+            status = worker_targets[user_index].request(*args)
+            latency = time.perf_counter() - started
+            with lock:
+                latencies.append(latency)
+                errors += status != EXPECTED_STATUS[scenario]
+
+    started = time.perf_counter()
+    if len(targets) == 1:
+        worker(targets[0])
+    else:
+        threads = [threading.Thread(target=worker, args=(worker_targets,)) for worker_targets in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run(users: int = 5, todos: int = 1000, requests: int = 200, warmup: int = 20,
+        scenarios: Optional[list[str]] = None, base_url: Optional[str] = None,
+        concurrency: int = 1, seed_value: int = 0) -> dict[str, Any]:
+    """データを作成して全シナリオを計測する。
+
+    Args:
+        users: 作成するユーザー数。
+        todos: ユーザーごとのTodo件数。
+        requests: シナリオごとの計測するリクエスト数。
+        warmup: シナリオごとのウォームアップのリクエスト数。
+        scenarios: 計測するシナリオ。省略時は :data:`SCENARIOS` のすべて。
+        base_url: HTTPサーバーのURL。省略時はテストクライアントを使用します。
+        concurrency: 同時実行するワーカー数（HTTPサーバーを使う場合のみ2以上を指定できます）。
+        seed_value: 乱数のシード。同じ値なら同じデータとリクエストになります。
+
+    Returns:
+        ``meta`` （実行条件）と ``scenarios`` （シナリオごとの結果）を含む辞書。
+
+    Raises:
+        ValueError: 引数が不正な場合。
+    """
+    import django
+    from django.conf import settings
+    from django.db import connection, transaction
+    from django.test.utils import override_settings
+
+    scenarios = scenarios or SCENARIOS
+    if users < 1 or todos < 1 or requests < 1:
+        raise ValueError('ユーザー数・Todo件数・リクエスト数は1以上を指定してください。')
+    if concurrency > 1 and not base_url:
+        raise ValueError('テストクライアントでは同時実行できません。--base-url を指定してください。')
+
+    rng = random.Random(seed_value)
+    deletable = math.ceil((warmup + requests) / users) if 'delete' in scenarios else 0
+    meta = {
+        'created_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'users': users,
+        'todos_per_user': todos,
+        'requests': requests,
+        'warmup': warmup,
+        'concurrency': concurrency,
+        'seed': seed_value,
+        'target': base_url or 'test-client',
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+    }
+
+    def measure() -> dict[str, Any]:
+        bench_users = seed(users, todos, deletable, rng)
+        if base_url:
+            targets = [[HttpTarget(bench_user, base_url) for bench_user in bench_users]
+                       for _ in range(concurrency)]
+        else:
+            targets = [[ClientTarget(bench_user) for bench_user in bench_users]]
+        return {
+            scenario: run_scenario(scenario, bench_users, targets, requests, warmup, rng)
+            for scenario in scenarios
+        }
+
+    if base_url:
+        # サーバーから読めるようにコミットし、計測後に削除する
+        cleanup()
+        try:
+            results = measure()
+        finally:
+            cleanup()
+    else:
+        # テストクライアントが送るホスト名を許可する
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+            results = measure()
+            transaction.set_rollback(True)
+    return {'meta': meta, 'scenarios': results}
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> list[dict[str, Any]]:
+    """2回の実行結果を比較する。
+
+    両方に含まれるシナリオの :data:`COMPARED_METRICS` の各指標について、
+    変化率と、しきい値を超えて悪化したかどうかを返します。
+
+    Args:
+        baseline: 基準となる結果（:func:`run` の戻り値）。
+        current: 比較する結果。
+        threshold: リグレッションとみなす悪化率（0.2なら20%）。
+
+    Returns:
+        ``scenario``・``metric``・``baseline``・``current``・``change``・
+        ``regression`` を含む辞書のリスト。
+    """
+    rows = []
+    for scenario, result in current['scenarios'].items():
+        base = baseline['scenarios'].get(scenario)
+        if base is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            before, after = base[metric], result[metric]
+            if before:
+                change = (after - before) / before
+            else:
+                # エラーが0件から増えた場合など、基準が0の指標は増えただけで悪化とみなす
+                change = math.inf if after > before else 0.0
+            worse = change if higher_is_worse else -change
+            rows.append({
+                'scenario': scenario,
+                'metric': metric,
+                'baseline': before,
+                'current': after,
+                'change': change,
+                'regression': worse > threshold,
+            })
+    return rows
+
+
+def main() -> None:
+    _django.setup()
+    from django.core.management import call_command
+
+    call_command('benchmark_todos', *sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
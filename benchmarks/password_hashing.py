@@ -0,0 +1,110 @@
+"""パスワードハッシュのプロファイルごとの、コアあたりのログイン数のベンチマーク。
+
+``TODO_PASSWORD_HASHER`` の各プロファイル（``pbkdf2``・``scrypt``・``argon2``）について
+次を計測します。``argon2`` は ``argon2-cffi`` がインストールされていない場合は
+スキップします。
+
+- ``login/s``: テストクライアントから ``/login/`` にPOSTしたログインの数
+  （1プロセス・1コア、セッションの保存などを含む）。
+- ``verify/s``: パスワードの検証だけの1コアあたりの回数。
+- ``pool/s``: :mod:`todo.hashers` と同じ ``spawn`` のプロセスプール
+  （``--workers`` 個）で並列に検証した合計の回数と、コアあたりの回数。
+
+使い方::
+
+    python -m benchmarks.password_hashing --logins 50 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import _django
+
+
+PASSWORD = 'bench-pass-123'
+
+
+def _rate(count: int, elapsed: float) -> float:
+    return count / elapsed if elapsed else 0.0
+
+
+def _verify(encoded: str) -> bool:
+    """プールのプロセスでパスワードを検証する。"""
+    from django.contrib.auth.hashers import check_password
+    return check_password(PASSWORD, encoded)
+
+
+def measure(profile: str, logins: int, workers: int) -> dict[str, float]:
+    """1つのプロファイルのログイン・検証の回数を計測する。"""
+    from django.conf import settings
+    from django.contrib.auth.hashers import check_password, make_password
+    from django.contrib.auth.models import User
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    with override_settings(PASSWORD_HASHERS=[settings.TODO_PASSWORD_HASHER_PROFILES[profile]],
+                           ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        encoded = make_password(PASSWORD)
+        user = User.objects.create(username=f'hash-bench-{profile}', password=encoded)
+        try:
+            client = Client()
+            started = time.perf_counter()
+            for _ in range(logins):
+                response = client.post(reverse('login'), {'username': user.username, 'password': PASSWORD})
+                if response.status_code != 302:
+                    raise RuntimeError(f'{profile}: ログインに失敗しました（{response.status_code}）')
+            login_rate = _rate(logins, time.perf_counter() - started)
+        finally:
+            user.delete()
+
+        started = time.perf_counter()
+        for _ in range(logins):
+            check_password(PASSWORD, encoded)
+        verify_rate = _rate(logins, time.perf_counter() - started)
+
+    # プールのプロセスは起動時の環境変数から設定を読むため、プロファイルを環境変数で渡す
+    os.environ['TODO_PASSWORD_HASHER'] = profile
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        list(pool.map(_verify, [encoded] * workers))  # プロセスの起動と初期化を除く
+        jobs = logins * workers
+        started = time.perf_counter()
+        list(pool.map(_verify, [encoded] * jobs))
+        pool_rate = _rate(jobs, time.perf_counter() - started)
+
+    return {
+        'login': login_rate,
+        'verify': verify_rate,
+        'pool': pool_rate,
+        'pool_per_core': pool_rate / min(workers, os.cpu_count() or 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=['pbkdf2', 'scrypt', 'argon2'])
+    parser.add_argument('--logins', type=int, default=20, help='プロファイルごとのログイン・検証の回数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='プロセスプールのプロセス数')
+    args = parser.parse_args()
+
+    _django.setup()
+    print(f'cpus={os.cpu_count()} workers={args.workers} logins={args.logins}')
+    print(f"{'profile':>8} {'login/s':>9} {'verify/s':>9} {'pool/s':>9} {'per core':>9}")
+    baseline = None
+    for profile in args.profiles:
+        if profile == 'argon2' and importlib.util.find_spec('argon2') is None:
+            print(f"{profile:>8}  （argon2-cffi がインストールされていないためスキップ）")
+            continue
+        result = measure(profile, args.logins, args.workers)
+        baseline = baseline or result['login']
+        print(f"{profile:>8} {result['login']:>9.1f} {result['verify']:>9.1f} {result['pool']:>9.1f} "
+              f"{result['pool_per_core']:>9.1f}  x{result['login'] / baseline:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""全文検索のスケーリングベンチマーク。
+
+ユーザーのTodo件数を変えながら、``todo.search.search_todos``
+（SQLiteではFTS5、PostgreSQLではGINインデックス）と、
+``icontains`` による全件走査の検索時間を比較します。
+検索語は一定件数（``--matches``）のTodoにだけ含まれるため、
+インデックスを使った検索時間は総件数にほぼ依存しません。
+
+使い方::
+
+    python -m benchmarks.search_scaling --sizes 1000 10000 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from typing import Callable
+
+from benchmarks import _django
+
+
+WORDS = ['買い物', '掃除', '洗濯', 'レポート', '会議', '電話', 'メール', '支払い', '予約', '片付け',
+         'review', 'deploy', 'invoice', 'meeting', 'backup']
+NEEDLE = 'ペンギン観察'
+
+
+def _time(func: Callable[[], object], repeat: int) -> float:
+    """関数を繰り返し実行し、中央値（ミリ秒）を返す。"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--matches', type=int, default=20, help='検索語を含むTodoの件数')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    _django.setup()
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+    from todo.importer import import_todos
+    from todo.models import Todo
+    from todo.search import search_todos
+
+    rng = random.Random(0)
+    print(f"{'rows':>8} {'indexed ms':>11} {'icontains ms':>13}")
+    for size in args.sizes:
+        user = User.objects.create_user(username=f'search-bench-{size}')
+        needles = set(rng.sample(range(size), min(args.matches, size)))
+        records = (
+            (i, {
+                'title': ' '.join(rng.choices(WORDS, k=3)),
+                'description': ' '.join(rng.choices(WORDS, k=8)) + (f' {NEEDLE}' if i in needles else ''),
+            })
+            for i in range(size)
+        )
+        # インポート経由で登録し、検索インデックスも同期する
+        import_todos(user, records, batch_size=2000)
+
+        indexed = _time(lambda: list(search_todos(user.pk, NEEDLE)), args.repeat)
+        scan = _time(
+            lambda: list(Todo.objects.filter(user=user).filter(
+                Q(title__icontains=NEEDLE) | Q(description__icontains=NEEDLE)
+            )[:50]),
+            args.repeat,
+        )
+        print(f'{size:>8} {indexed:>11.2f} {scan:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
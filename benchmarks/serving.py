@@ -0,0 +1,159 @@
+"""開発サーバーと本番用アプリケーションサーバーのスループット比較（負荷試験）。
+
+同じデータベースに対して次のサーバーを順に起動し、
+``benchmarks.hot_paths`` のHTTPモードで同時にリクエストを送って
+スループットとp50/p95/p99レイテンシを比較します。
+
+- ``runserver``: 開発用設定（DEBUG有効）の ``manage.py runserver``。
+- ``gunicorn-sync``: 本番用設定で、同期ワーカーを ``--workers`` 個。
+- ``gunicorn-gthread``: 本番用設定で、gthreadワーカーを ``--workers`` 個
+  （ワーカーあたり ``--threads`` スレッド）。
+- ``uvicorn``: 本番用設定で、ASGIアプリケーションと非同期ビューを
+  uvicornワーカー ``--workers`` 個で動かす。
+
+データベースは既定で一時ファイルのSQLiteを使用します。``--keep-env`` を
+指定すると、現在の環境変数で設定されたデータベース（PostgreSQLなど）を使用します。
+SQLiteは書き込みを直列化するため、既定では読み取りのシナリオだけを計測します。
+負荷をかける側も同じマシンで動くため、ワーカー数の効果を見るにはCPUコア数が
+ワーカー数と同時実行数に対して十分にある環境で実行してください。
+
+使い方::
+
+    python -m benchmarks.serving --workers 4 --threads 4 --concurrency 16 --requests 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from benchmarks import _django
+
+
+ROOT = Path(__file__).resolve().parent.parent
+PROFILES = ['runserver', 'gunicorn-sync', 'gunicorn-gthread', 'uvicorn']
+
+
+def free_port() -> int:
+    """空いているTCPポート番号を返す。"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def gunicorn_command(port: int, workers: int, threads: int = 1,
+                     app_server: str = 'wsgi') -> tuple[list[str], dict[str, str]]:
+    """本番用設定でgunicornを起動するコマンドと環境変数を返す。"""
+    env = {
+        'DJANGO_ENV': 'prod',
+        'DJANGO_SECRET_KEY': 'serving-benchmark',
+        'DJANGO_ALLOWED_HOSTS': '127.0.0.1,localhost',
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_ACCESSLOG': '',
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'APP_SERVER': app_server,
+        'TODO_ASYNC_VIEWS': 'true' if app_server == 'asgi' else 'false',
+    }
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env
+
+
+def _command(profile: str, port: int, args: argparse.Namespace) -> tuple[list[str], dict[str, str]]:
+    """プロファイルに応じたサーバーの起動コマンドと環境変数を返す。"""
+    if profile == 'runserver':
+        return ([sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+                {'DJANGO_ENV': 'dev'})
+    if profile == 'uvicorn':
+        return gunicorn_command(port, args.workers, app_server='asgi')
+    return gunicorn_command(port, args.workers, args.threads if profile == 'gunicorn-gthread' else 1)
+
+
+@contextmanager
+def server(name: str, command: list[str], env: dict[str, str], port: int) -> Iterator[str]:
+    """サーバーを起動し、応答するようになったらベースURLを返す。
+
+    Args:
+        name: エラーメッセージに表示するサーバーの名前。
+        command: 起動コマンド。
+        env: 現在の環境変数に追加する環境変数。
+        port: サーバーが待ち受けるポート番号。
+    """
+    # パイプは読み出さないと詰まるため、ログは一時ファイルに書き出す
+    log = tempfile.TemporaryFile('w+')
+    process = subprocess.Popen(command, cwd=ROOT, env=dict(os.environ, **env),
+                               stdout=subprocess.DEVNULL, stderr=log, text=True)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                log.seek(0)
+                raise RuntimeError(f'{name} が起動できませんでした:\n{log.read()}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'{name} が30秒以内に応答しませんでした。')
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=PROFILES)
+    parser.add_argument('--workers', type=int, default=4, help='gunicornのワーカー数')
+    parser.add_argument('--threads', type=int, default=4, help='gthreadワーカーのスレッド数')
+    parser.add_argument('--concurrency', type=int, default=16, help='同時に送るリクエスト数')
+    parser.add_argument('--requests', type=int, default=2000, help='シナリオごとのリクエスト数')
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--todos', type=int, default=500, help='ユーザーごとのTodo件数')
+    parser.add_argument('--scenarios', nargs='+', default=['list'])
+    parser.add_argument('--keep-env', action='store_true',
+                        help='一時SQLiteを使わず、現在の環境変数のデータベースを使用する')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.keep_env:
+            os.environ['USE_SQLITE_FOR_TESTS'] = 'true'
+            os.environ['SQLITE_PATH'] = str(Path(tmp) / 'serving.sqlite3')
+        _django.setup()
+        from benchmarks import hot_paths
+
+        print(f'workers={args.workers} threads={args.threads} concurrency={args.concurrency} '
+              f'requests={args.requests} users={args.users} todos={args.todos}')
+        print(f"{'profile':>16} {'scenario':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'errors':>7}")
+        baseline = {}
+        for profile in args.profiles:
+            port = free_port()
+            with server(profile, *_command(profile, port, args), port) as base_url:
+                result = hot_paths.run(
+                    users=args.users, todos=args.todos, requests=args.requests,
+                    scenarios=args.scenarios, base_url=base_url, concurrency=args.concurrency,
+                )
+            for scenario, summary in result['scenarios'].items():
+                baseline.setdefault(scenario, summary['throughput'])
+                gain = summary['throughput'] / baseline[scenario] if baseline[scenario] else 0.0
+                print(f"{profile:>16} {scenario:>8} {summary['throughput']:>9.1f} {summary['p50_ms']:>9.2f} "
+                      f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['errors']:>7}"
+                      f"  x{gain:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""本番用のgunicorn設定。
+
+``gunicorn -c gunicorn.conf.py`` で起動します。各値は環境変数で調整できます。
+
+- ``APP_SERVER``: ``wsgi``（既定）は ``todoproject.wsgi`` を同期ワーカーで、
+  ``asgi`` は ``todoproject.asgi`` をuvicornワーカーで動かします。
+  ASGIでは ``TODO_ASYNC_VIEWS=true`` を合わせて指定すると、一覧などに
+  非同期ビューを使用し、ライブ更新（Server-Sent Events）も有効になります。
+- ``WEB_CONCURRENCY``: ワーカープロセス数（既定はCPU数×2+1）。
+- ``GUNICORN_THREADS``: WSGIのワーカーあたりのスレッド数（既定は1）。
+  2以上の場合はgthreadワーカーになり、データベース待ちの間も他の
+  リクエストを処理できます。ASGIでは使用しません。
+- ``GUNICORN_BIND``・``GUNICORN_TIMEOUT``・``GUNICORN_KEEPALIVE``・
+  ``GUNICORN_MAX_REQUESTS``: 待ち受けアドレス、タイムアウト秒数、
+  Keep-Aliveの秒数、ワーカーを再起動するまでのリクエスト数。
+- ``GUNICORN_ACCESSLOG``: アクセスログの出力先（既定は標準出力、空文字列で無効）。
+"""
+
+import multiprocessing
+import os
+
+app_server = os.getenv('APP_SERVER', 'wsgi').lower()
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+
+if app_server == 'asgi':
+    wsgi_app = 'todoproject.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'todoproject.wsgi:application'
+    worker_class = 'gthread' if threads > 1 else 'sync'
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# メモリの増加に備えてワーカーを定期的に入れ替える（同時に再起動しないよう揺らぎを加える）
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
@@ -0,0 +1,216 @@
+"""TodoアプリケーションのJSON APIビュー。
+
+このモジュールはJavaScriptやモバイルクライアント向けに、
+TodoをJSON形式で返すビュー関数を含みます。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError
+from django.http import HttpRequest, JsonResponse
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.views.decorators.vary import vary_on_cookie
+
+from .batch import BatchError, apply_batch, parse_operations
+from .bulk import BulkActionError, apply_bulk_action
+from .conditional import list_etag, list_last_modified
+from .filters import InvalidFilter, parse_filters
+from .models import Todo
+from .search import parse_page_number, search_todos
+from .stats import get_stats
+from .sync import sync_changes
+
+
+def serialize_todo(todo: Todo) -> dict[str, Any]:
+    """TodoをJSONに変換可能な辞書へ変換する。
+
+    Args:
+        todo: 変換するTodo。``with_due_status`` でアノテーション済みであれば
+            その期限ステータスを使用します。
+
+    Returns:
+        Todoの各フィールドと期限ステータスを含む辞書。
+    """
+    return {
+        'id': todo.pk,
+        'title': todo.title,
+        'description': todo.description,
+        'completed': todo.completed,
+        'due_date': todo.due_date.isoformat() if todo.due_date else None,
+        'due_status': todo.get_due_status(),
+        'created_at': todo.created_at.isoformat(),
+        'updated_at': todo.updated_at.isoformat(),
+    }
+
+
+@login_required
+@require_GET
+@vary_on_cookie
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
+def todo_list_api(request: HttpRequest) -> JsonResponse:
+    """ログイン中のユーザーのTodo一覧をJSONで返すビュー。
+    
+    ``todo_list`` と同じキーセットページネーションと絞り込み・並び替え
+    （:mod:`todo.filters`）を使用し、``cursor`` クエリパラメータでページを指定します。
+    ETag・Last-Modifiedによる条件付きGETに対応しており、
+    変更がなければ ``304 Not Modified`` を返します。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        Todoのリストと前後ページのカーソルを含むJSONレスポンス。
+        例: {'todos': [...], 'next_cursor': '...', 'previous_cursor': None}
+        絞り込みの条件が不正な場合は ``{'error': '...'}`` （ステータス400）。
+    """
+    try:
+        filters = parse_filters(request.GET)
+    except InvalidFilter as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    page = filters.paginator(Todo.objects.filter(user=request.user)).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'todos': [serialize_todo(todo) for todo in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+@login_required
+@require_POST
+def todo_bulk_api(request: HttpRequest) -> JsonResponse:
+    """複数のTodoをまとめて完了・未完了・削除するビュー。
+    
+    リクエストボディは次の形式のJSONです::
+    
+        {"action": "complete", "ids": [1, 2, 3]}
+    
+    ``action`` には 'complete'、'reopen'、'delete' を指定できます。
+    現在のユーザーが所有していないTodoは ``not_found`` として扱います。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        IDごとの結果を含むJSONレスポンス。
+        例: {'results': {'1': 'updated', '2': 'not_found'}}
+        リクエストが不正な場合はステータス400と ``error`` を含むJSONレスポンス。
+    """
+    try:
+        payload = json.loads(request.body)
+        action = payload['action']
+        ids = [int(pk) for pk in payload['ids']]
+        results = apply_bulk_action(request.user.pk, action, ids)
+    except (ValueError, KeyError, TypeError) as exc:
+        message = str(exc) if isinstance(exc, BulkActionError) else 'リクエストの形式が正しくありません。'
+        return JsonResponse({'error': message}, status=400)
+    return JsonResponse({'results': {str(pk): result for pk, result in results.items()}})
+
+
+@login_required
+@require_POST
+def todo_batch_api(request: HttpRequest) -> JsonResponse:
+    """オフラインで溜めた複数の変更を1回のリクエストで適用するビュー。
+    
+    リクエストボディは操作のリストを含む次の形式のJSONです::
+    
+        {"operations": [
+            {"op": "create", "key": "c1", "data": {"title": "牛乳を買う"}},
+            {"op": "update", "key": "u1", "id": 3, "data": {"title": "卵を買う", "completed": true}},
+            {"op": "toggle", "key": "t1", "id": 4},
+            {"op": "delete", "key": "d1", "id": 5}
+        ]}
+    
+    操作は順番どおりに1つのトランザクションで適用されます。``key`` を
+    付けた操作は、同じキーで再送されても再適用されません。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        操作ごとの結果を含むJSONレスポンス。
+        例: {'results': [{'status': 'created', 'id': 10}, {'status': 'not_found', 'id': 5}]}
+        リクエストが不正な場合はステータス400、同じキーの操作が同時に
+        適用された場合はステータス409と ``error`` を含むJSONレスポンス。
+    """
+    try:
+        operations = parse_operations(json.loads(request.body))
+    except ValueError as exc:
+        message = str(exc) if isinstance(exc, BatchError) else 'リクエストの形式が正しくありません。'
+        return JsonResponse({'error': message}, status=400)
+    try:
+        results = apply_batch(request.user.pk, operations)
+    except IntegrityError:
+        return JsonResponse({'error': '同じキーの操作が処理中です。再送してください。'}, status=409)
+    return JsonResponse({'results': results})
+
+
+@login_required
+@require_GET
+def todo_search_api(request: HttpRequest) -> JsonResponse:
+    """ログイン中のユーザーのTodoをタイトルと詳細で全文検索するビュー。
+    
+    ``q`` クエリパラメータに検索語、``page`` にページ番号を指定します。
+    結果は関連度の高い順に並び、各Todoには ``rank`` が含まれます。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        検索結果を含むJSONレスポンス。
+        例: {'todos': [...], 'page': 1, 'has_next': False}
+    """
+    page = search_todos(request.user.pk, request.GET.get('q', ''), parse_page_number(request.GET.get('page')))
+    return JsonResponse({
+        'todos': [dict(serialize_todo(todo), rank=todo.rank) for todo in page],
+        'page': page.number,
+        'has_next': page.has_next,
+    })
+
+
+@login_required
+@require_GET
+def todo_stats_api(request: HttpRequest) -> JsonResponse:
+    """ログイン中のユーザーのTodoの件数の集計をJSONで返すビュー。
+    
+    集計済みの :class:`~todo.models.TodoStats` を主キーで1回読み込むだけで、
+    Todoの件数に関係なく一定のコストで応答します。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        件数を含むJSONレスポンス。
+        例: {'total': 10, 'open': 4, 'overdue': 1, 'due_today': 2}
+    """
+    return JsonResponse(get_stats(request.user.pk).as_dict())
+
+
+@login_required
+@require_GET
+def todo_sync_api(request: HttpRequest) -> JsonResponse:
+    """前回の同期以降に変更されたTodoだけを返す差分同期ビュー。
+    
+    ``since`` クエリパラメータに前回のレスポンスの ``token`` を指定します。
+    初回、またはトークンが不正・期限切れの場合は全件を返し、
+    ``reset`` をTrueにします。``has_more`` がTrueの場合は、
+    返された ``token`` ですぐに続きを取得します。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        変更されたTodo、削除されたTodoのID、次回のトークンを含むJSONレスポンス。
+        例: {'todos': [...], 'deleted': [3], 'token': '...', 'has_more': False, 'reset': False}
+    """
+    result = sync_changes(request.user.pk, request.GET.get('since'))
+    return JsonResponse({
+        'todos': [serialize_todo(todo) for todo in result.todos],
+        'deleted': result.deleted,
+        'token': result.token,
+        'has_more': result.has_more,
+        'reset': result.reset,
+    })
@@ -0,0 +1,313 @@
+"""Todoアプリケーションの非同期ビュー関数。
+
+このモジュールは、リクエスト数の多い一覧・完了切り替え・JSON APIとエクスポートについて、
+``views`` と ``api`` の同期ビューと同じ振る舞いを持つ非同期版を提供します。
+ASGIサーバーで動かす場合に ``settings.TODO_ASYNC_VIEWS`` を有効にすると、
+``todo.urls`` は同じURL名でこれらのビューを使用します。
+
+非同期ビューでは ``request.user`` を同期的に評価できないため、
+``await request.auser()`` で取得したユーザーを ``request.user`` に
+設定してからテンプレートを描画します。Django の非同期ORMで表現できない
+処理（``UPDATE ... RETURNING`` による切り替えや全文検索の生SQL）は、
+``sync_to_async`` で1回のスレッド切り替えにまとめて実行します。
+
+ライブ更新用のServer-Sent Eventsビュー（:func:`todo_events`）は
+接続を保持し続けるため、ASGIサーバーでのみ動作します。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, AsyncIterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import aauthenticate, alogin
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import (
+    Http404, HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_GET
+from django.views.decorators.vary import vary_on_cookie
+
+from . import cache as list_cache
+from .api import serialize_todo
+from .broker import get_broker
+from .conditional import aget_list_validators, get_conditional_response_for, set_validator_headers
+from .export import AEXPORTERS, CONTENT_TYPES, FORMAT_CSV
+from .filters import InvalidFilter, parse_filters
+from .models import Todo
+from .search import parse_page_number, search_todos
+from .signals import ACTION_TOGGLED, send_todos_changed
+from .stats import aget_stats
+
+
+async def _auser(request: HttpRequest):
+    """リクエストユーザーを非同期に取得し、``request.user`` に設定する。
+
+    テンプレートのコンテキストプロセッサが ``request.user`` を参照しても
+    同期的なデータベースアクセスが発生しないようにします。
+    """
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+def _toggle_and_notify(pk: int, user_id: int) -> Optional[bool]:
+    """完了状態を切り替え、成功した場合は同じトランザクションで変更を通知する。"""
+    with transaction.atomic():
+        completed = Todo.objects.toggle_completed(pk, user_id)
+        if completed is not None:
+            send_todos_changed(user_id, [pk], ACTION_TOGGLED)
+    return completed
+
+
+def format_event(event: dict[str, Any]) -> str:
+    """イベントをServer-Sent Eventsの1メッセージに変換する。
+
+    Args:
+        event: ``action`` と ``ids`` を含むイベント。
+
+    Returns:
+        ``event:`` 行と ``data:`` 行からなるメッセージ。
+    """
+    return f"event: {event['action']}\ndata: {json.dumps({'ids': event['ids']})}\n\n"
+
+
+async def login_view(request: HttpRequest) -> HttpResponse:
+    """:func:`todo.views.login_view` の非同期版。
+
+    パスワードの検証は認証バックエンドの ``aauthenticate()`` で行い、
+    ``TODO_PASSWORD_HASH_WORKERS`` を指定した場合はプロセスプールで
+    ハッシュを計算するため、ログインが集中してもイベントループを塞ぎません。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        ログインフォームのレンダリング結果、
+        または成功時はTodo一覧ページへのリダイレクト。
+    """
+    if request.method == 'POST':
+        user = await aauthenticate(
+            request, username=request.POST.get('username'), password=request.POST.get('password')
+        )
+        if user is not None:
+            await alogin(request, user)
+            return redirect('todo_list')
+        messages.error(request, 'ユーザー名またはパスワードが正しくありません。')
+    await _auser(request)
+    return render(request, 'registration/login.html')
+
+
+@login_required
+@vary_on_cookie
+async def todo_list(request: HttpRequest) -> HttpResponse:
+    """:func:`todo.views.todo_list` の非同期版。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        Todo一覧ページのレンダリング結果、
+        またはバリデータが一致した場合は ``304 Not Modified``。
+        絞り込みの条件が不正な場合は ``400 Bad Request``。
+    """
+    user = await _auser(request)
+    try:
+        filters = parse_filters(request.GET)
+    except InvalidFilter as exc:
+        return HttpResponseBadRequest(str(exc))
+    validators = await aget_list_validators(request, user.pk)
+    response = get_conditional_response_for(request, validators)
+    if response is not None:
+        return response
+
+    async def render_items() -> str:
+        paginator = filters.paginator(Todo.objects.filter(user_id=user.pk))
+        page = await paginator.aget_page(request.GET.get('cursor'))
+        return render_to_string('todo/todo_list_items.html', {'todos': page, 'page': page, 'filters': filters},
+                                request)
+
+    list_html = await list_cache.aget_or_render(user.pk, request.GET.urlencode(), render_items)
+    response = render(request, 'todo/todo_list.html', {
+        'list_html': mark_safe(list_html),
+        'stats': await aget_stats(user.pk),
+        'filters': filters,
+    })
+    return set_validator_headers(request, response, validators)
+
+
+@login_required
+async def todo_toggle(request: HttpRequest, pk: int) -> JsonResponse:
+    """:func:`todo.views.todo_toggle` の非同期版。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+        pk: 状態を切り替えるTodoの主キー。
+
+    Returns:
+        新しい完了状態を含むJSONレスポンス。
+        例: {'completed': True}
+
+    Raises:
+        Http404: 指定されたTodoが存在しない、または現在のユーザーが所有していない場合。
+    """
+    if request.method == 'POST':
+        user = await _auser(request)
+        completed = await sync_to_async(_toggle_and_notify)(pk, user.pk)
+        if completed is None:
+            raise Http404('Todoが見つかりません。')
+        return JsonResponse({'completed': completed})
+
+
+@login_required
+async def todo_card(request: HttpRequest, pk: int) -> HttpResponse:
+    """:func:`todo.views.todo_card` の非同期版。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+        pk: 描画するTodoの主キー。
+
+    Returns:
+        Todoカードの部分テンプレートのレンダリング結果。
+
+    Raises:
+        Http404: 指定されたTodoが存在しない、または現在のユーザーが所有していない場合。
+    """
+    user = await _auser(request)
+    try:
+        todo = await Todo.objects.with_due_status().aget(pk=pk, user_id=user.pk)
+    except Todo.DoesNotExist:
+        raise Http404('Todoが見つかりません。')
+    return render(request, 'todo/todo_card.html', {'todo': todo})
+
+
+@login_required
+@require_GET
+@vary_on_cookie
+async def todo_list_api(request: HttpRequest) -> JsonResponse:
+    """:func:`todo.api.todo_list_api` の非同期版。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        Todoのリストと前後ページのカーソルを含むJSONレスポンス、
+        またはバリデータが一致した場合は ``304 Not Modified``。
+    """
+    user = await _auser(request)
+    try:
+        filters = parse_filters(request.GET)
+    except InvalidFilter as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    validators = await aget_list_validators(request, user.pk)
+    response = get_conditional_response_for(request, validators)
+    if response is not None:
+        return response
+
+    page = await filters.paginator(Todo.objects.filter(user_id=user.pk)).aget_page(request.GET.get('cursor'))
+    response = JsonResponse({
+        'todos': [serialize_todo(todo) for todo in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+    return set_validator_headers(request, response, validators)
+
+
+@login_required
+@require_GET
+async def todo_search_api(request: HttpRequest) -> JsonResponse:
+    """:func:`todo.api.todo_search_api` の非同期版。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        検索結果を含むJSONレスポンス。
+        例: {'todos': [...], 'page': 1, 'has_next': False}
+    """
+    user = await _auser(request)
+    page = await sync_to_async(search_todos)(
+        user.pk, request.GET.get('q', ''), parse_page_number(request.GET.get('page'))
+    )
+    return JsonResponse({
+        'todos': [dict(serialize_todo(todo), rank=todo.rank) for todo in page],
+        'page': page.number,
+        'has_next': page.has_next,
+    })
+
+
+@login_required
+async def todo_export(request: HttpRequest) -> HttpResponse:
+    """:func:`todo.views.todo_export` の非同期版。
+
+    ASGIでは同期のイテレーターを渡したストリーミングレスポンスは送信前に
+    すべて読み込まれるため、チャンクごとに読み出す非同期のジェネレーターを渡し、
+    Todoの件数に関わらずメモリ使用量を一定に保ちます。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        エクスポートファイルのストリーミングレスポンス。
+        不正な形式が指定された場合はステータス400のレスポンス。
+    """
+    export_format = request.GET.get('format', FORMAT_CSV)
+    if export_format not in AEXPORTERS:
+        return HttpResponseBadRequest('不正なエクスポート形式です。')
+    user = await _auser(request)
+    response = StreamingHttpResponse(AEXPORTERS[export_format](user.pk), content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="todos.{export_format}"'
+    return response
+
+
+@login_required
+async def todo_events(request: HttpRequest) -> HttpResponse:
+    """ログイン中のユーザーのTodoの変更をServer-Sent Eventsで配信するビュー。
+
+    Todoの作成・更新・完了切り替え・削除のたびに、変更の種類を
+    イベント名、変更されたTodoのIDを ``data`` とするメッセージを送信します::
+
+        event: toggled
+        data: {"ids": [42]}
+
+    受け取りが追いつかずイベントを取りこぼした場合は ``reset`` を送信します。
+    接続を維持するため、``settings.TODO_EVENTS_HEARTBEAT`` 秒ごとに
+    コメント行を送信します。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        ``text/event-stream`` のストリーミングレスポンス。
+        ASGI以外で呼び出された場合、または ``settings.TODO_EVENTS_ENABLED`` が
+        偽の場合は、EventSourceに再接続をやめさせる ``204 No Content``。
+    """
+    if not isinstance(request, ASGIRequest) or not settings.TODO_EVENTS_ENABLED:
+        return HttpResponse(status=204)
+    user = await _auser(request)
+    heartbeat = settings.TODO_EVENTS_HEARTBEAT
+
+    async def stream() -> AsyncIterator[str]:
+        # 購読はストリームの送信開始時に行い、切断時に確実に解除する
+        subscription = get_broker().subscribe(user.pk)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = await subscription.get(timeout=heartbeat)
+                yield ': keep-alive\n\n' if event is None else format_event(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # リバースプロキシにバッファリングさせない
+    response['X-Accel-Buffering'] = 'no'
+    return response
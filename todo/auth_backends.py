@@ -0,0 +1,167 @@
+"""ログイン中のユーザーをプロセス内にキャッシュする認証バックエンド。
+
+``AuthenticationMiddleware`` は ``@login_required`` のビューごとに
+``auth_user`` を1回読み込みます。:class:`CachedModelBackend` は読み込んだ
+ユーザーを ``TODO_AUTH_USER_CACHE_TTL`` 秒だけプロセス内に保持し、
+同じユーザーの後続のリクエストではデータベースを参照しません。
+
+ユーザーの保存（パスワードの変更を含む）・削除・ログアウトの時点で
+そのプロセスのキャッシュから取り除きます。他のプロセスのキャッシュは
+TTLが切れるまで残るため、パスワードの変更や無効化が全プロセスに
+反映されるまで最大でTTL秒かかります。``QuerySet.update()`` で直接
+更新した場合もシグナルが送られないため、同様にTTLまで反映されません。
+
+非同期の認証（``aauthenticate()``）では、パスワードの検証を
+:mod:`todo.hashers` のプロセスプールで行います。
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from typing import Any
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import AbstractBaseUser
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import hashers
+
+
+class UserCache:
+    """ユーザーIDをキーとする、TTLと件数上限付きのユーザーのキャッシュ。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users: dict[Any, tuple[float, AbstractBaseUser]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, user_id: Any) -> AbstractBaseUser | None:
+        """キャッシュ済みのユーザーの複製を返す（期限切れ・未登録なら ``None``）。
+
+        リクエストごとに属性を書き換えても他のリクエストに影響しないよう、
+        キャッシュしたインスタンスそのものではなく複製を返します。
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._users[user_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.copy(entry[1])
+
+    def set(self, user: AbstractBaseUser, ttl: float) -> None:
+        """ユーザーを ``ttl`` 秒間キャッシュする。
+
+        件数が ``TODO_AUTH_USER_CACHE_MAX_ENTRIES`` に達している場合は、
+        最も古く登録されたユーザーを取り除きます。
+        """
+        with self._lock:
+            self._users.pop(user.pk, None)
+            while self._users and len(self._users) >= settings.TODO_AUTH_USER_CACHE_MAX_ENTRIES:
+                del self._users[next(iter(self._users))]
+            self._users[user.pk] = (time.monotonic() + ttl, copy.copy(user))
+
+    def invalidate(self, user_id: Any) -> None:
+        """ユーザーをキャッシュから取り除く。"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        """キャッシュを空にする。"""
+        with self._lock:
+            self._users.clear()
+            self.hits = self.misses = 0
+
+
+user_cache = UserCache()
+
+
+class CachedModelBackend(ModelBackend):
+    """``get_user()`` の結果をプロセス内にキャッシュする ``ModelBackend``。
+
+    ``TODO_AUTH_USER_CACHE_TTL`` が0の場合は ``ModelBackend`` と同じく
+    毎回データベースから読み込みます。セッションの検証（パスワードの
+    ハッシュとの照合）はキャッシュしたユーザーに対しても毎回行われます。
+    """
+
+    def get_user(self, user_id: Any) -> AbstractBaseUser | None:
+        ttl = settings.TODO_AUTH_USER_CACHE_TTL
+        if ttl <= 0:
+            return super().get_user(user_id)
+        # セッションにはIDが文字列で保存されているため、主キーの型にそろえる
+        user_id = get_user_model()._meta.pk.to_python(user_id)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache.set(user, ttl)
+        return user
+
+    async def aauthenticate(self, request: Any, username: str | None = None, password: str | None = None,
+                            **kwargs: Any) -> AbstractBaseUser | None:
+        """パスワードの検証を :mod:`todo.hashers` のプロセスプールで行う非同期の認証。
+
+        ``TODO_PASSWORD_HASH_WORKERS`` が0の場合は ``ModelBackend`` と同じく
+        スレッドで同期版の ``authenticate()`` を実行します。
+        """
+        if settings.TODO_PASSWORD_HASH_WORKERS <= 0:
+            return await super().aauthenticate(request, username=username, password=password, **kwargs)
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # 存在するユーザーとの応答時間の差を小さくするため、ハッシュを1回計算する
+            await hashers.amake_password(password)
+            return None
+        if await hashers.acheck_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='todo_invalidate_user_on_save')
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid='todo_invalidate_user_on_delete')
+def invalidate_user(sender: type[AbstractBaseUser], instance: AbstractBaseUser, **kwargs: Any) -> None:
+    """ユーザーの保存・削除時にキャッシュから取り除く（パスワードの変更を含む）。"""
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(user_logged_out, dispatch_uid='todo_invalidate_user_on_logout')
+def invalidate_logged_out_user(sender: Any, user: AbstractBaseUser | None, **kwargs: Any) -> None:
+    """ログアウトしたユーザーをキャッシュから取り除く。"""
+    if user is not None:
+        user_cache.invalidate(user.pk)
+
+
+def collect_metrics() -> list[str]:
+    """ユーザーキャッシュのカウンタをPrometheusのテキスト形式で返す。
+
+    ``settings.TODO_METRICS_COLLECTORS`` に登録して使用します。
+
+    Returns:
+        メトリクスの行のリスト。
+    """
+    return [
+        '# TYPE todo_auth_user_cache_hits_total counter',
+        f'todo_auth_user_cache_hits_total {user_cache.hits}',
+        '# TYPE todo_auth_user_cache_misses_total counter',
+        f'todo_auth_user_cache_misses_total {user_cache.misses}',
+        '# TYPE todo_auth_user_cache_entries gauge',
+        f'todo_auth_user_cache_entries {len(user_cache)}',
+    ]
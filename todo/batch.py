@@ -0,0 +1,279 @@
+"""オフラインで溜めた変更をまとめて適用するバッチ書き込み。
+
+クライアントは作成・更新・完了切り替え・削除の操作を順番どおりに
+1つのリクエストで送ります。操作は1つのトランザクションで適用し、
+対象のTodoを1回のSELECTで読み込んだうえで、メモリ上で順番に
+適用した最終状態を ``bulk_create``・値ごとにまとめたUPDATE・DELETEの
+集合に対するSQLで書き込みます。
+
+各操作には冪等性キー（``key``）を付けられます。処理済みのキーを
+持つ操作は再適用せず、最初に適用したときの結果を返すため、
+応答を受け取れずに再送しても同じ変更が二重に適用されません。
+"""
+
+from __future__ import annotations
+
+import copy
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .forms import TodoForm
+from .models import Todo, TodoIdempotencyKey
+from .signals import ACTION_CREATED, ACTION_UPDATED, coalesce_todos_changed, send_todos_changed
+from .sync import get_retention
+
+
+OP_CREATE = 'create'
+OP_UPDATE = 'update'
+OP_TOGGLE = 'toggle'
+OP_DELETE = 'delete'
+OPS = (OP_CREATE, OP_UPDATE, OP_TOGGLE, OP_DELETE)
+
+RESULT_CREATED = 'created'
+RESULT_UPDATED = 'updated'
+RESULT_DELETED = 'deleted'
+RESULT_NOT_FOUND = 'not_found'
+RESULT_INVALID = 'invalid'
+
+DEFAULT_MAX_OPERATIONS = 1000
+MAX_KEY_LENGTH = 64
+
+EDITABLE_FIELDS = ('title', 'description', 'due_date')
+WRITABLE_FIELDS = EDITABLE_FIELDS + ('completed',)
+
+
+class BatchError(ValueError):
+    """バッチのリクエストが不正な場合に送出される例外。"""
+
+
+@dataclass
+class Operation:
+    """検証済みの1件の操作。
+
+    Attributes:
+        index: リクエスト内での位置。
+        op: 操作の種類。
+        pk: 対象のTodoのID（作成の場合はNone）。
+        data: 作成・更新するフィールドの値。
+        key: 冪等性キー（省略時はNone）。
+    """
+
+    index: int
+    op: str
+    pk: Optional[int] = None
+    data: dict[str, Any] = field(default_factory=dict)
+    key: Optional[str] = None
+
+
+def get_max_operations() -> int:
+    """1回のバッチで指定できる操作数の上限を返す。"""
+    return getattr(settings, 'TODO_BATCH_MAX_OPERATIONS', DEFAULT_MAX_OPERATIONS)
+
+
+def parse_operations(payload: Any) -> list[Operation]:
+    """リクエストボディの ``operations`` を検証して操作のリストにする。
+
+    Args:
+        payload: JSONとして読み込んだリクエストボディ。
+
+    Returns:
+        操作のリスト。
+
+    Raises:
+        BatchError: 形式が不正な場合、または操作数が上限を超える場合。
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('operations'), list):
+        raise BatchError('operationsにはリストを指定してください。')
+    items = payload['operations']
+    if len(items) > get_max_operations():
+        raise BatchError(f'一度に送信できる操作は{get_max_operations()}件までです。')
+
+    operations = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or item.get('op') not in OPS:
+            raise BatchError(f'{index}番目の操作が不正です。')
+        key = item.get('key')
+        if key is not None and (not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH):
+            raise BatchError(f'{index}番目の操作のkeyが不正です。')
+        data = item.get('data', {})
+        if not isinstance(data, dict):
+            raise BatchError(f'{index}番目の操作のdataが不正です。')
+        pk = None
+        if item['op'] != OP_CREATE:
+            try:
+                pk = int(item['id'])
+            except (KeyError, TypeError, ValueError):
+                raise BatchError(f'{index}番目の操作のidが不正です。')
+        operations.append(Operation(index, item['op'], pk, data, key))
+    return operations
+
+
+def _validate(todo: Todo, data: dict[str, Any]) -> dict[str, list[str]]:
+    """フィールドの値をTodoFormで検証し、成功した場合だけTodoに反映する。
+
+    Returns:
+        エラーの辞書（成功した場合は空）。
+    """
+    completed = data.get('completed')
+    if completed is not None and not isinstance(completed, bool):
+        return {'completed': ['真偽値を指定してください。']}
+    values = {name: getattr(todo, name) for name in EDITABLE_FIELDS}
+    values.update({name: data[name] for name in EDITABLE_FIELDS if name in data})
+    # 検証に失敗した値が後続の操作に残らないよう、複製に対して検証する
+    candidate = copy.copy(todo)
+    form = TodoForm(data={name: '' if value is None else value for name, value in values.items()},
+                    instance=candidate)
+    if not form.is_valid():
+        return {name: list(messages) for name, messages in form.errors.items()}
+    for name in EDITABLE_FIELDS:
+        setattr(todo, name, getattr(candidate, name))
+    if completed is not None:
+        todo.completed = completed
+    return {}
+
+
+def apply_batch(user_id: int, operations: list[Operation]) -> list[dict[str, Any]]:
+    """操作を順番どおりに1つのトランザクションで適用する。
+
+    同じTodoに対する複数の操作は順番に畳み込み、最終状態だけを書き込みます。
+    存在しない（または他のユーザーの）Todoへの操作は ``not_found``、
+    検証に失敗した操作は ``invalid`` になり、他の操作はそのまま適用されます。
+
+    Args:
+        user_id: 操作するユーザーのID。
+        operations: :func:`parse_operations` で検証した操作。
+
+    Returns:
+        操作ごとの結果のリスト（リクエストと同じ順番）。各結果は
+        ``status`` と、必要に応じて ``id``・``errors`` を含みます。
+        処理済みの冪等性キーを持つ操作には、最初の結果に ``replayed: True`` を加えて返します。
+    """
+    now = timezone.now()
+    results: list[Optional[dict[str, Any]]] = [None] * len(operations)
+
+    with transaction.atomic(), coalesce_todos_changed():
+        keys = {op.key for op in operations if op.key is not None}
+        replayed = dict(
+            TodoIdempotencyKey.objects
+            .filter(user_id=user_id, key__in=keys)
+            .values_list('key', 'result')
+        ) if keys else {}
+
+        pending = []
+        seen_keys = set(replayed)
+        for op in operations:
+            if op.key in seen_keys:
+                continue
+            if op.key is not None:
+                seen_keys.add(op.key)
+            pending.append(op)
+
+        # 対象のTodoは1回のSELECTでロックして読み込む
+        todos = Todo.objects.select_for_update().filter(user_id=user_id).in_bulk(
+            {op.pk for op in pending if op.pk is not None}
+        )
+        originals = {pk: _snapshot(todo) for pk, todo in todos.items()}
+        created: list[tuple[Operation, Todo]] = []
+        changed: dict[int, Todo] = {}
+        deleted: set[int] = set()
+
+        for op in pending:
+            if op.op == OP_CREATE:
+                todo = Todo(user_id=user_id)
+                errors = _validate(todo, op.data)
+                if errors:
+                    results[op.index] = {'status': RESULT_INVALID, 'errors': errors}
+                else:
+                    created.append((op, todo))
+                continue
+
+            todo = todos.get(op.pk)
+            if todo is None or op.pk in deleted:
+                results[op.index] = {'status': RESULT_NOT_FOUND, 'id': op.pk}
+                continue
+            if op.op == OP_DELETE:
+                deleted.add(op.pk)
+                changed.pop(op.pk, None)
+                results[op.index] = {'status': RESULT_DELETED, 'id': op.pk}
+                continue
+            if op.op == OP_TOGGLE:
+                todo.completed = not todo.completed
+                errors = {}
+            else:
+                errors = _validate(todo, op.data)
+            if errors:
+                results[op.index] = {'status': RESULT_INVALID, 'id': op.pk, 'errors': errors}
+                continue
+            changed[op.pk] = todo
+            results[op.index] = {'status': RESULT_UPDATED, 'id': op.pk}
+
+        _write(user_id, created, changed, originals, deleted, now)
+        for op, todo in created:
+            results[op.index] = {'status': RESULT_CREATED, 'id': todo.pk}
+
+        TodoIdempotencyKey.objects.bulk_create([
+            TodoIdempotencyKey(user_id=user_id, key=op.key, result=results[op.index])
+            for op in pending if op.key is not None
+        ])
+
+    stored = {op.key: results[op.index] for op in pending if op.key is not None}
+    for op in operations:
+        if results[op.index] is None:
+            original = replayed.get(op.key, stored.get(op.key))
+            results[op.index] = dict(original, replayed=True)
+    return results
+
+
+def _write(user_id: int, created: list[tuple[Operation, Todo]], changed: dict[int, Todo],
+           originals: dict[int, tuple[Any, ...]], deleted: set[int], now: datetime) -> None:
+    """畳み込んだ最終状態を集合に対するSQLで書き込む。
+
+    更新は変わったフィールドとその値が同じTodoをまとめ、グループごとに
+    1回の ``UPDATE ... WHERE id IN (...)`` を発行します（完了切り替えなら
+    完了・未完了の高々2回）。``bulk_update`` のCASE式は行数×フィールド数に
+    比例して組み立てが重くなるため使用しません。
+    """
+    if created:
+        Todo.objects.bulk_create([todo for _, todo in created])
+        send_todos_changed(user_id, [todo.pk for _, todo in created], ACTION_CREATED)
+
+    groups: dict[tuple[tuple[str, Any], ...], list[int]] = {}
+    for pk, todo in changed.items():
+        dirty = tuple(
+            (name, value)
+            for name, value, original in zip(WRITABLE_FIELDS, _snapshot(todo), originals[pk])
+            if value != original
+        )
+        if dirty:
+            groups.setdefault(dirty, []).append(pk)
+    for dirty, pks in groups.items():
+        Todo.objects.filter(pk__in=pks).update(updated_at=now, **dict(dirty))
+    if groups:
+        send_todos_changed(user_id, [pk for pks in groups.values() for pk in pks], ACTION_UPDATED)
+
+    if deleted:
+        # post_deleteシグナルは coalesce_todos_changed により1回の通知にまとまる
+        Todo.objects.filter(user_id=user_id, pk__in=deleted).delete()
+
+
+def _snapshot(todo: Todo) -> tuple[Any, ...]:
+    return tuple(getattr(todo, name) for name in WRITABLE_FIELDS)
+
+
+def prune_idempotency_keys(now: Optional[datetime] = None) -> int:
+    """保持期間（差分同期の変更履歴と同じ）を過ぎた冪等性キーを削除する。
+
+    Args:
+        now: 判定の基準時刻。省略時は現在時刻。
+
+    Returns:
+        削除した行数。
+    """
+    cutoff = (now or timezone.now()) - get_retention()
+    deleted, _ = TodoIdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
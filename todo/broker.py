@@ -0,0 +1,323 @@
+"""Todoの変更イベントを購読者へ配信するPub/Subブローカー。
+
+``todos_changed`` シグナルの受信側がイベントを :meth:`BaseBroker.publish`
+し、Server-Sent Eventsのビューが :meth:`BaseBroker.subscribe` で
+受け取ってブラウザへ送信します。
+
+使用するブローカーは ``settings.TODO_EVENT_BROKER`` にクラスのパスで
+指定します（既定は :class:`InProcessBroker`）。``InProcessBroker`` は
+同じプロセス内の購読者にしか配信できないため、複数のワーカープロセスで
+運用する場合は、PostgreSQLのLISTEN/NOTIFYでプロセス間に配信する
+:class:`PostgresBroker` を使います。本番用の設定は、複数のASGIワーカーで
+``InProcessBroker`` のままの場合、データベースがPostgreSQLなら
+``PostgresBroker`` に切り替え、それ以外ではライブ更新を無効にします
+（``TODO_EVENTS_ENABLED``）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import select
+import threading
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = 'todo.broker.InProcessBroker'
+DEFAULT_QUEUE_SIZE = 100
+
+# PostgresBrokerが使うNOTIFYのチャンネル
+NOTIFY_CHANNEL = 'todo_events'
+# NOTIFYのペイロードの上限（既定で8000バイト未満）。超えるイベントはresetに置き換える
+MAX_NOTIFY_PAYLOAD = 7900
+# 受信スレッドが停止の要求を確認する間隔と、切断後に再接続するまでの秒数
+LISTEN_POLL_INTERVAL = 1.0
+LISTEN_RECONNECT_DELAY = 1.0
+
+# 購読者のキューがあふれた場合に送るイベント。クライアントは一覧を再読み込みする
+RESET_EVENT = {'action': 'reset', 'ids': []}
+
+
+class Subscription:
+    """1つの購読者が受け取るイベントのキュー。
+
+    イベントは任意のスレッドから :meth:`put` でき、購読者は
+    購読したイベントループ上で :meth:`get` で受け取ります。
+
+    Attributes:
+        user_id: 購読しているユーザーのID。
+    """
+
+    def __init__(self, broker: BaseBroker, user_id: int, maxsize: int) -> None:
+        """購読を初期化する。呼び出し元のイベントループに結び付けます。
+
+        Args:
+            broker: 購読の解除を通知するブローカー。
+            user_id: 購読するユーザーのID。
+            maxsize: 受け取り待ちにできるイベントの最大数。
+        """
+        self.user_id = user_id
+        self._broker = broker
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize)
+        self._overflowed = False
+
+    def put(self, event: dict[str, Any]) -> None:
+        """イベントを購読者のキューへ追加する（スレッドセーフ）。
+
+        購読したイベントループがすでに閉じている場合は、配信元の
+        リクエストに例外を伝えず、購読を解除します。
+
+        Args:
+            event: 配信するイベント。
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._put_nowait, event)
+        except RuntimeError:
+            # 切断処理を経ずにイベントループが閉じた購読者
+            self.close()
+
+    def _put_nowait(self, event: dict[str, Any]) -> None:
+        if self._overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 受け取りが追いつかない購読者には個別のイベントをやめて再読み込みを促す
+            self._overflowed = True
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict[str, Any]]:
+        """次のイベントを待って返す。
+
+        Args:
+            timeout: 待機する最大秒数。Noneの場合は無期限に待つ。
+
+        Returns:
+            受け取ったイベント。タイムアウトした場合はNone。
+            キューがあふれていた場合は :data:`RESET_EVENT`。
+        """
+        if self._overflowed and self._queue.empty():
+            self._overflowed = False
+            return RESET_EVENT
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        """購読を解除する。"""
+        self._broker.unsubscribe(self)
+
+
+class BaseBroker:
+    """Todoの変更イベントを配信するブローカーのインターフェース。"""
+
+    def publish(self, user_id: int, event: dict[str, Any]) -> None:
+        """ユーザーの購読者全員にイベントを配信する。
+
+        Args:
+            user_id: イベントの対象ユーザーID。
+            event: JSONに変換可能なイベント。
+        """
+        raise NotImplementedError
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """ユーザーのイベントを購読する。イベントループ上で呼び出します。
+
+        Args:
+            user_id: 購読するユーザーID。
+
+        Returns:
+            イベントを受け取る購読。
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """購読を解除する。
+
+        Args:
+            subscription: :meth:`subscribe` が返した購読。
+        """
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """同じプロセス内の購読者にイベントを配信するブローカー。"""
+
+    def __init__(self) -> None:
+        """購読者の一覧を空で初期化する。"""
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set[Subscription]] = {}
+
+    def publish(self, user_id: int, event: dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        maxsize = getattr(settings, 'TODO_EVENT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        subscription = Subscription(self, user_id, maxsize)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self, user_id: int) -> int:
+        """ユーザーの購読者数を返す。
+
+        Args:
+            user_id: ユーザーID。
+
+        Returns:
+            購読者数。
+        """
+        with self._lock:
+            return len(self._subscribers.get(user_id, ()))
+
+
+class PostgresBroker(InProcessBroker):
+    """PostgreSQLのLISTEN/NOTIFYでワーカープロセス間にイベントを配信するブローカー。
+
+    :meth:`publish` はイベントを ``pg_notify`` で送信し、各プロセスの受信スレッドが
+    専用の接続でLISTENした通知を、そのプロセスの購読者へ配信します。受信スレッドは
+    最初の購読で起動します。接続が切れた場合は再接続し、その間の通知は失われるため、
+    購読者には :data:`RESET_EVENT` を送って一覧の再読み込みを促します。
+
+    Attributes:
+        using: 通知の送受信に使うデータベースのエイリアス。
+    """
+
+    def __init__(self, using: str = DEFAULT_DB_ALIAS) -> None:
+        """ブローカーを初期化する。受信スレッドはまだ起動しません。
+
+        Args:
+            using: 通知の送受信に使うデータベースのエイリアス。
+        """
+        super().__init__()
+        self.using = using
+        self._listener: Optional[threading.Thread] = None
+        self._listening = threading.Event()
+        self._stopped = threading.Event()
+
+    def publish(self, user_id: int, event: dict[str, Any]) -> None:
+        payload = json.dumps({'user_id': user_id, 'event': event}, separators=(',', ':'))
+        if len(payload) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({'user_id': user_id, 'event': RESET_EVENT}, separators=(',', ':'))
+        self._notify(payload)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        self._start_listener()
+        return super().subscribe(user_id)
+
+    def dispatch(self, payload: str) -> None:
+        """受信した通知をこのプロセスの購読者へ配信する。
+
+        Args:
+            payload: :meth:`publish` が送信したペイロード。
+        """
+        message = json.loads(payload)
+        super().publish(message['user_id'], message['event'])
+
+    def wait_until_listening(self, timeout: Optional[float] = None) -> bool:
+        """受信スレッドがLISTENを開始するまで待つ。
+
+        Args:
+            timeout: 待機する最大秒数。Noneの場合は無期限に待つ。
+
+        Returns:
+            LISTENを開始していればTrue。
+        """
+        return self._listening.wait(timeout)
+
+    def close(self) -> None:
+        """受信スレッドを停止する。"""
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.join()
+
+    def _notify(self, payload: str) -> None:
+        # 呼び出し元のトランザクション内では、通知はコミット時に配信される
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, payload])
+
+    def _start_listener(self) -> None:
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._stopped.clear()
+                self._listener = threading.Thread(target=self._listen, name='todo-event-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._listen_on_new_connection()
+            except Exception:
+                logger.warning('イベントの受信が切断されました。再接続します', exc_info=True)
+            if self._listening.is_set():
+                self._listening.clear()
+                # 切断中の通知は届かないため、購読者全員に再読み込みを促す
+                with self._lock:
+                    subscribers = [s for group in self._subscribers.values() for s in group]
+                for subscription in subscribers:
+                    subscription.put(RESET_EVENT)
+            self._stopped.wait(LISTEN_RECONNECT_DELAY)
+
+    def _listen_on_new_connection(self) -> None:
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        wrapper = connections[self.using]
+        # コネクションプールを使う設定でも、LISTENし続ける接続はプールから借りずに専用に張る
+        conn = wrapper.Database.connect(**wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            self._listening.set()
+            while not self._stopped.is_set():
+                if is_psycopg3:
+                    payloads = [notify.payload for notify in conn.notifies(timeout=LISTEN_POLL_INTERVAL)]
+                else:
+                    payloads = []
+                    if select.select([conn], [], [], LISTEN_POLL_INTERVAL)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            payloads.append(conn.notifies.pop(0).payload)
+                for payload in payloads:
+                    self.dispatch(payload)
+        finally:
+            conn.close()
+
+
+_broker_lock = threading.Lock()
+_broker: Optional[tuple[str, BaseBroker]] = None
+
+
+def get_broker() -> BaseBroker:
+    """``settings.TODO_EVENT_BROKER`` で指定したブローカーを返す。
+
+    インスタンスはプロセス内で共有し、設定が変わった場合だけ作り直します。
+
+    Returns:
+        ブローカー。
+    """
+    global _broker
+    path = getattr(settings, 'TODO_EVENT_BROKER', DEFAULT_BROKER)
+    with _broker_lock:
+        if _broker is None or _broker[0] != path:
+            _broker = (path, import_string(path)())
+        return _broker[1]
@@ -0,0 +1,100 @@
+"""Todoの一括操作。
+
+このモジュールは複数のTodoに対する完了・未完了・削除を、
+1件ずつではなく集合に対するUPDATE/DELETEで実行します。
+大量の選択で長時間ロックを保持しないよう、IDは一定件数ごとの
+チャンクに分割し、チャンクごとに別のトランザクションで処理します。
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Todo
+from .signals import ACTION_TOGGLED, coalesce_todos_changed, send_todos_changed
+
+
+ACTION_COMPLETE = 'complete'
+ACTION_REOPEN = 'reopen'
+ACTION_DELETE = 'delete'
+ACTIONS = (ACTION_COMPLETE, ACTION_REOPEN, ACTION_DELETE)
+
+RESULT_UPDATED = 'updated'
+RESULT_UNCHANGED = 'unchanged'
+RESULT_DELETED = 'deleted'
+RESULT_NOT_FOUND = 'not_found'
+
+DEFAULT_MAX_IDS = 1000
+DEFAULT_CHUNK_SIZE = 200
+
+
+class BulkActionError(ValueError):
+    """一括操作のリクエストが不正な場合に送出される例外。"""
+
+
+def get_max_ids() -> int:
+    """1回の一括操作で指定できるIDの上限を返す。"""
+    return getattr(settings, 'TODO_BULK_MAX_IDS', DEFAULT_MAX_IDS)
+
+
+def _chunks(ids: list[int], size: int) -> Iterator[list[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def apply_bulk_action(user_id: int, action: str, ids: Iterable[int]) -> dict[int, str]:
+    """複数のTodoに一括操作を適用する。
+
+    各チャンクでは所有ユーザーで絞り込んだ ``SELECT ... FOR UPDATE`` を1回、
+    UPDATEまたはDELETEを1回だけ発行し、``todos_changed`` を1回だけ送信します。
+    完了・未完了の変更では状態が変わる行だけを更新します。削除は
+    ``QuerySet.delete()`` で行うため、``post_delete`` の受信側のために
+    削除する行を読み込むSELECTが1回加わります。
+
+    Args:
+        user_id: 操作するユーザーのID。他のユーザーのTodoは ``not_found`` になります。
+        action: 'complete'、'reopen'、'delete' のいずれか。
+        ids: 対象のTodoのID。
+
+    Returns:
+        TodoのIDと結果（'updated'、'unchanged'、'deleted'、'not_found'）の辞書。
+
+    Raises:
+        BulkActionError: 操作の種類が不正、またはIDの数が上限を超えた場合。
+    """
+    if action not in ACTIONS:
+        raise BulkActionError(f'不正な操作です: {action}')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > get_max_ids():
+        raise BulkActionError(f'一度に操作できるTodoは{get_max_ids()}件までです。')
+
+    chunk_size = getattr(settings, 'TODO_BULK_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    results = {pk: RESULT_NOT_FOUND for pk in ids}
+    for chunk in _chunks(ids, chunk_size):
+        with transaction.atomic():
+            owned = Todo.objects.filter(user_id=user_id, pk__in=chunk)
+            if action == ACTION_DELETE:
+                deleted = list(owned.select_for_update().values_list('pk', flat=True))
+                if deleted:
+                    # 削除のコレクターで1文のDELETEにまとめ（関連するモデルの連鎖削除も行う）、
+                    # 行ごとのpost_deleteはチャンクごとに1回の通知にまとめる
+                    with coalesce_todos_changed():
+                        owned.filter(pk__in=deleted).delete()
+                for pk in deleted:
+                    results[pk] = RESULT_DELETED
+                continue
+
+            completed = action == ACTION_COMPLETE
+            # 読み取りから更新までの間に他のリクエストが切り替えた状態を上書きしないよう、行をロックする
+            current = dict(owned.select_for_update().values_list('pk', 'completed'))
+            changed = {pk for pk, value in current.items() if value != completed}
+            if changed:
+                owned.filter(pk__in=changed).update(completed=completed, updated_at=timezone.now())
+                send_todos_changed(user_id, sorted(changed), ACTION_TOGGLED)
+            for pk in current:
+                results[pk] = RESULT_UPDATED if pk in changed else RESULT_UNCHANGED
+    return results
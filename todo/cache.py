@@ -0,0 +1,248 @@
+"""Todo一覧の描画結果キャッシュ。
+
+このモジュールはユーザーごとに描画済みのTodo一覧フラグメントを
+キャッシュします。キャッシュキーにはユーザーごとのバージョン番号を
+含め、Todoの保存・削除シグナルでバージョンを進めることで、
+古いフラグメントを削除せずに無効化します。
+
+キャッシュバックエンドは ``settings.TODO_LIST_CACHE_ALIAS`` で指定した
+Djangoのキャッシュエイリアス（既定は ``'todo_list'``）を使用するため、
+locmem・ファイル・Redisなど任意のバックエンドに差し替えられます。
+複数プロセスで運用する場合は、バージョン番号を共有できるよう
+プロセス間で共有されるバックエンドを指定してください。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Awaitable, Callable
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.utils import timezone
+
+
+DEFAULT_CACHE_ALIAS = 'todo_list'
+
+
+class ListCacheStats:
+    """一覧キャッシュのヒット・ミス回数を数えるプロセス内カウンタ。
+
+    Attributes:
+        hits: キャッシュヒット回数。
+        misses: キャッシュミス回数。
+        invalidations: バージョンを進めた回数。
+    """
+
+    def __init__(self) -> None:
+        """カウンタを0で初期化する。"""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def record(self, name: str) -> None:
+        """指定したカウンタを1増やす。
+
+        Args:
+            name: 'hits'、'misses'、'invalidations' のいずれか。
+        """
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict[str, float]:
+        """現在のカウンタとヒット率を返す。
+
+        Returns:
+            カウンタ名と値の辞書。
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def reset(self) -> None:
+        """カウンタを0に戻す。"""
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+
+stats = ListCacheStats()
+
+
+def collect_metrics() -> list[str]:
+    """一覧キャッシュのカウンタをPrometheusのテキスト形式で返す。
+
+    ``settings.TODO_METRICS_COLLECTORS`` に登録して使用します。
+
+    Returns:
+        メトリクスの行のリスト。
+    """
+    snapshot = stats.snapshot()
+    lines = []
+    for name in ('hits', 'misses', 'invalidations'):
+        metric = f'todo_list_cache_{name}_total'
+        lines += [f'# TYPE {metric} counter', f'{metric} {snapshot[name]}']
+    return lines
+
+
+def get_cache() -> BaseCache:
+    """一覧キャッシュに使用するキャッシュバックエンドを返す。"""
+    return caches[getattr(settings, 'TODO_LIST_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+
+def _version_key(user_id: int) -> str:
+    return f'todo:list:version:{user_id}'
+
+
+def get_list_version(user_id: int) -> int:
+    """ユーザーの一覧キャッシュのバージョン番号を返す。
+
+    バージョン番号が存在しない（未作成または追い出された）場合は
+    現在時刻のナノ秒値で初期化し、過去のフラグメントと衝突しないようにします。
+
+    Args:
+        user_id: ユーザーID。
+
+    Returns:
+        現在のバージョン番号。
+    """
+    cache = get_cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, time.time_ns())
+    return version
+
+
+def bump_list_version(user_id: int) -> None:
+    """ユーザーの一覧キャッシュのバージョンを進め、既存のフラグメントを無効化する。
+
+    Args:
+        user_id: ユーザーID。
+    """
+    cache = get_cache()
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+    stats.record('invalidations')
+
+
+def _deleted_at_key(user_id: int) -> str:
+    return f'todo:list:deleted-at:{user_id}'
+
+
+def mark_deleted(user_id: int) -> None:
+    """ユーザーのTodoが削除された時刻を記録する。
+
+    Args:
+        user_id: ユーザーID。
+    """
+    get_cache().set(_deleted_at_key(user_id), timezone.now().timestamp(), None)
+
+
+def get_last_deleted_at(user_id: int) -> datetime:
+    """ユーザーのTodoが最後に削除された時刻を返す。
+
+    記録がない場合は、記録が失われた可能性を考慮して現在時刻を
+    記録し、その時刻を返します（実際の削除時刻より前を返すことはありません）。
+
+    Args:
+        user_id: ユーザーID。
+
+    Returns:
+        最後の削除時刻（以降）の日時。
+    """
+    cache = get_cache()
+    key = _deleted_at_key(user_id)
+    timestamp = cache.get(key)
+    if timestamp is None:
+        cache.add(key, timezone.now().timestamp(), None)
+        timestamp = cache.get(key, timezone.now().timestamp())
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _versioned_key(user_id: int, name: str) -> str:
+    return f'todo:list:{name}:{user_id}:{get_list_version(user_id)}'
+
+
+def _lookup(user_id: int, name: str) -> tuple[str, Any]:
+    """現在のバージョンのキーと、そのキーにキャッシュされた値を返す。"""
+    key = _versioned_key(user_id, name)
+    value = get_cache().get(key)
+    stats.record('hits' if value is not None else 'misses')
+    return key, value
+
+
+def get_or_set(user_id: int, name: str, compute: Callable[[], Any]) -> Any:
+    """現在のバージョンでキャッシュされた値を返し、なければ計算して保存する。
+
+    Args:
+        user_id: ユーザーID。
+        name: 同じユーザーの中で値を区別する名前。
+        compute: キャッシュミス時に値を計算する関数。
+
+    Returns:
+        キャッシュ済みまたは計算した値。
+    """
+    key, value = _lookup(user_id, name)
+    if value is None:
+        value = compute()
+        get_cache().set(key, value)
+    return value
+
+
+async def aget_or_set(user_id: int, name: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """:func:`get_or_set` の非同期版。
+
+    バージョン番号と値の読み出しは1回のスレッド切り替えにまとめて行います。
+
+    Args:
+        user_id: ユーザーID。
+        name: 同じユーザーの中で値を区別する名前。
+        compute: キャッシュミス時に値を計算するコルーチン関数。
+
+    Returns:
+        キャッシュ済みまたは計算した値。
+    """
+    key, value = await sync_to_async(_lookup)(user_id, name)
+    if value is None:
+        value = await compute()
+        await get_cache().aset(key, value)
+    return value
+
+
+def _fragment_name(variant: str) -> str:
+    return f'fragment:{hashlib.sha1(variant.encode()).hexdigest()}'
+
+
+def get_or_render(user_id: int, variant: str, render: Callable[[], str]) -> str:
+    """キャッシュ済みの一覧フラグメントを返し、なければ描画して保存する。
+
+    Args:
+        user_id: ユーザーID。
+        variant: 同じユーザーの中でフラグメントを区別する文字列
+            （カーソルなどのクエリ文字列）。
+        render: キャッシュミス時にフラグメントを描画する関数。
+
+    Returns:
+        描画済みのHTMLフラグメント。
+    """
+    return get_or_set(user_id, _fragment_name(variant), render)
+
+
+async def aget_or_render(user_id: int, variant: str, render: Callable[[], Awaitable[str]]) -> str:
+    """:func:`get_or_render` の非同期版。"""
+    return await aget_or_set(user_id, _fragment_name(variant), render)
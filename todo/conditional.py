@@ -0,0 +1,203 @@
+"""Todo一覧の条件付きGET（ETag / Last-Modified）用のバリデータ。
+
+このモジュールはユーザーのTodo件数と ``MAX(updated_at)`` を1回の集計
+クエリで取得し（結果は一覧キャッシュに保持します）、一覧ページやJSON一覧APIのETagとLast-Modifiedを
+計算します。クライアントのバリデータが一致した場合、ビューは
+描画を行わずに ``304 Not Modified`` を返します。
+
+ビューには ``django.views.decorators.http.condition`` と組み合わせて使用します::
+
+    @condition(etag_func=list_etag, last_modified_func=list_last_modified)
+    def todo_list(request): ...
+
+ETagにはセッションとCSRFトークンも含めます。ページにはCSRFトークンが
+埋め込まれているため、ログインし直した後に古いトークンのページを304で
+使い続けないようにします（ビューには ``vary_on_cookie`` も付けます）。
+
+``condition`` はバリデータ関数を同期的に呼び出すため、非同期ビューでは
+:func:`aget_list_validators` と :func:`get_conditional_response_for` を使用します。
+"""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max, QuerySet
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import cache as list_cache
+from .models import Todo
+
+
+DEFAULT_TIME_BUCKET = 60
+
+SUMMARY = {'count': Count('id'), 'last_updated': Max('updated_at')}
+
+
+class ListValidators(NamedTuple):
+    """一覧レスポンスのバリデータ。
+
+    Attributes:
+        etag: ETag値（引用符なし）。
+        last_modified: Last-Modified日時。
+    """
+
+    etag: str
+    last_modified: datetime
+
+
+def _time_bucket_start(now: datetime) -> datetime:
+    """期限ステータスの再計算単位となる時間枠の開始時刻を返す。
+
+    期限ステータスは時刻の経過だけでも変化するため、バリデータに
+    時間枠を含めて一定時間ごとに再描画させます。
+    """
+    bucket = getattr(settings, 'TODO_CONDITIONAL_TIME_BUCKET', DEFAULT_TIME_BUCKET)
+    timestamp = int(now.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % bucket, tz=dt_timezone.utc)
+
+
+def get_list_validators(request: HttpRequest) -> ListValidators:
+    """リクエストユーザーのTodo一覧のバリデータを計算する。
+
+    結果はリクエストオブジェクトに保持し、ETagとLast-Modifiedの
+    計算で集計クエリが1回だけ発行されるようにします。
+
+    Args:
+        request: 認証済みユーザーのHTTPリクエストオブジェクト。
+
+    Returns:
+        一覧のバリデータ。
+    """
+    cached = getattr(request, '_todo_list_validators', None)
+    if cached is not None:
+        return cached
+
+    user_id = request.user.pk
+    # 集計結果は一覧キャッシュと同じバージョンで保持し、変更がない間は再計算しない
+    summary = list_cache.get_or_set(user_id, 'summary', lambda: _summary_queryset(user_id).aggregate(**SUMMARY))
+    validators = _build_validators(request, user_id, summary)
+    request._todo_list_validators = validators
+    return validators
+
+
+async def aget_list_validators(request: HttpRequest, user_id: int) -> ListValidators:
+    """:func:`get_list_validators` の非同期版。
+
+    非同期ビューでは ``request.user`` を同期的に評価できないため、
+    ``await request.auser()`` で取得したユーザーIDを受け取ります。
+
+    Args:
+        request: 認証済みユーザーのHTTPリクエストオブジェクト。
+        user_id: リクエストユーザーのID。
+
+    Returns:
+        一覧のバリデータ。
+    """
+    cached = getattr(request, '_todo_list_validators', None)
+    if cached is not None:
+        return cached
+
+    async def compute() -> dict[str, Any]:
+        return await _summary_queryset(user_id).aaggregate(**SUMMARY)
+
+    summary = await list_cache.aget_or_set(user_id, 'summary', compute)
+    validators = await sync_to_async(_build_validators)(request, user_id, summary)
+    request._todo_list_validators = validators
+    return validators
+
+
+def _summary_queryset(user_id: int) -> QuerySet:
+    return Todo.objects.filter(user_id=user_id)
+
+
+def _credentials(request: HttpRequest) -> str:
+    """リクエストのセッションキーとCSRFトークンの秘密値を連結して返す。
+
+    ログインでセッションキーとCSRFトークンはどちらも作り直されます。
+    CSRFクッキーがまだない場合は ``get_token`` でここで作成し、
+    描画するページと次のリクエストで同じ値を使います。
+    """
+    get_token(request)
+    session = getattr(request, 'session', None)
+    session_key = session.session_key if session is not None else None
+    return f"{session_key or ''}:{request.META.get('CSRF_COOKIE', '')}"
+
+
+def _build_validators(request: HttpRequest, user_id: int, summary: dict[str, Any]) -> ListValidators:
+    """集計結果・時間枠・リクエストのセッションからバリデータを組み立てる。"""
+    bucket_start = _time_bucket_start(timezone.now())
+    # 削除はMAX(updated_at)に現れないため、最後の削除時刻も考慮する
+    candidates = [bucket_start, list_cache.get_last_deleted_at(user_id)]
+    if summary['last_updated'] is not None:
+        candidates.append(summary['last_updated'])
+    last_modified = max(candidates)
+
+    # ETagでは削除を件数の変化で検出する
+    raw = (
+        f"{user_id}:{summary['count']}:{summary['last_updated']}:{bucket_start.isoformat()}:"
+        f"{_credentials(request)}"
+    )
+    return ListValidators(hashlib.sha1(raw.encode()).hexdigest(), last_modified)
+
+
+def list_etag(request: HttpRequest, *args: Any, **kwargs: Any) -> Optional[str]:
+    """``condition`` デコレータ用のETag関数。"""
+    if not request.user.is_authenticated:
+        return None
+    return get_list_validators(request).etag
+
+
+def list_last_modified(request: HttpRequest, *args: Any, **kwargs: Any) -> Optional[datetime]:
+    """``condition`` デコレータ用のLast-Modified関数。"""
+    if not request.user.is_authenticated:
+        return None
+    return get_list_validators(request).last_modified
+
+
+def get_conditional_response_for(request: HttpRequest, validators: ListValidators) -> Optional[HttpResponse]:
+    """バリデータが一致する場合に ``304``（または ``412``）のレスポンスを返す。
+
+    ``condition`` デコレータはバリデータ関数を同期的に呼び出すため、
+    非同期ビューでは :func:`aget_list_validators` の結果を渡して
+    この関数で判定します。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+        validators: 一覧のバリデータ。
+
+    Returns:
+        条件付きリクエストが成立した場合はそのレスポンス、そうでなければNone。
+    """
+    return get_conditional_response(
+        request,
+        etag=quote_etag(validators.etag),
+        last_modified=int(validators.last_modified.timestamp()),
+    )
+
+
+def set_validator_headers(request: HttpRequest, response: HttpResponse, validators: ListValidators) -> HttpResponse:
+    """レスポンスにETagとLast-Modifiedヘッダーを設定する。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+        response: ヘッダーを設定するレスポンス。
+        validators: 一覧のバリデータ。
+
+    Returns:
+        ヘッダーを設定したレスポンス。
+    """
+    if request.method in ('GET', 'HEAD'):
+        if not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(validators.last_modified.timestamp())
+        if not response.has_header('ETag'):
+            response.headers['ETag'] = quote_etag(validators.etag)
+    return response
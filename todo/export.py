@@ -0,0 +1,157 @@
+"""Todoのエクスポート。
+
+このモジュールはユーザーのTodoをCSVまたはNDJSON形式の行として
+逐次生成します。``values_list()`` と ``iterator(chunk_size=...)`` を
+使用してモデルインスタンスを生成せずに読み出すため、Todoの件数に
+関わらずメモリ使用量は一定です。
+
+ASGIでは同期のイテレーターを ``StreamingHttpResponse`` に渡すと
+送信前にすべて読み込まれてしまうため、非同期ビューでは
+チャンクごとに読み出す非同期版（:data:`AEXPORTERS`）を使用します。
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import QuerySet
+
+from .models import Todo
+
+
+EXPORT_FIELDS = ('id', 'title', 'description', 'completed', 'due_date', 'created_at', 'updated_at')
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """``csv.writer`` の書き込み結果をそのまま返す疑似ファイル。"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _format_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _export_queryset(user_id: int) -> QuerySet:
+    """ユーザーのTodoを ``EXPORT_FIELDS`` のタプルとして作成日時順に返すクエリセット。"""
+    return (
+        Todo.objects.filter(user_id=user_id)
+        .order_by('-created_at', '-id')
+        .values_list(*EXPORT_FIELDS)
+    )
+
+
+def _chunk_size(chunk_size: Optional[int]) -> int:
+    if chunk_size is None:
+        return getattr(settings, 'TODO_EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    return chunk_size
+
+
+def _ndjson_line(row: tuple[Any, ...]) -> str:
+    return json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+
+
+def iter_rows(user_id: int, chunk_size: Optional[int] = None) -> Iterator[tuple[Any, ...]]:
+    """ユーザーのTodoをタプルとして作成日時順に逐次返す。
+
+    Args:
+        user_id: エクスポートするユーザーのID。
+        chunk_size: データベースから一度に読み出す行数。
+            省略時は ``settings.TODO_EXPORT_CHUNK_SIZE``（未設定なら2000）。
+
+    Yields:
+        ``EXPORT_FIELDS`` の順に並んだ値のタプル。
+    """
+    for row in _export_queryset(user_id).iterator(chunk_size=_chunk_size(chunk_size)):
+        yield tuple(_format_value(value) for value in row)
+
+
+def iter_csv(user_id: int, chunk_size: Optional[int] = None) -> Iterator[str]:
+    """ユーザーのTodoをヘッダー付きCSVの行として逐次返す。
+
+    Args:
+        user_id: エクスポートするユーザーのID。
+        chunk_size: データベースから一度に読み出す行数。
+
+    Yields:
+        改行を含むCSVの1行。
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in iter_rows(user_id, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_ndjson(user_id: int, chunk_size: Optional[int] = None) -> Iterator[str]:
+    """ユーザーのTodoをNDJSON（1行1オブジェクトのJSON）として逐次返す。
+
+    Args:
+        user_id: エクスポートするユーザーのID。
+        chunk_size: データベースから一度に読み出す行数。
+
+    Yields:
+        改行で終わるJSONオブジェクト1件分の文字列。
+    """
+    for row in iter_rows(user_id, chunk_size):
+        yield _ndjson_line(row)
+
+
+async def aiter_rows(user_id: int, chunk_size: Optional[int] = None) -> AsyncIterator[tuple[Any, ...]]:
+    """:func:`iter_rows` の非同期版。
+
+    ``values_list()`` のクエリセットの ``aiterator()`` は最初のクエリを
+    非同期のコンテキストで実行してしまうため、``iterator()`` のジェネレーターから
+    チャンクごとに ``sync_to_async`` で読み出します（同じスレッド・同じ接続で読む）。
+    """
+    chunk_size = _chunk_size(chunk_size)
+    rows = _export_queryset(user_id).iterator(chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)), thread_sensitive=True)
+    while True:
+        chunk = await next_chunk()
+        if not chunk:
+            return
+        for row in chunk:
+            yield tuple(_format_value(value) for value in row)
+
+
+async def aiter_csv(user_id: int, chunk_size: Optional[int] = None) -> AsyncIterator[str]:
+    """:func:`iter_csv` の非同期版。"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    async for row in aiter_rows(user_id, chunk_size):
+        yield writer.writerow(row)
+
+
+async def aiter_ndjson(user_id: int, chunk_size: Optional[int] = None) -> AsyncIterator[str]:
+    """:func:`iter_ndjson` の非同期版。"""
+    async for row in aiter_rows(user_id, chunk_size):
+        yield _ndjson_line(row)
+
+
+EXPORTERS = {
+    FORMAT_CSV: iter_csv,
+    FORMAT_NDJSON: iter_ndjson,
+}
+
+AEXPORTERS = {
+    FORMAT_CSV: aiter_csv,
+    FORMAT_NDJSON: aiter_ndjson,
+}
@@ -0,0 +1,167 @@
+"""Todo一覧の絞り込みと並び替え。
+
+一覧ページと一覧APIは次のクエリパラメータを受け付けます。絞り込みはすべて
+SQLの条件にし、``(user, completed, created_at, id)``・``(user, completed, due_date)``・
+``(user, due_date)`` の各インデックスで返す行の分だけを辿るようにします
+（期限で絞り込んだ作成日時順の一覧は、範囲に一致した行だけを並び替えます）。
+
+- ``completed``: ``true``（完了済み）または ``false``（未完了）。
+- ``due``: 期限ステータス（``overdue``・``due_today``・``due_soon``・``normal``・
+  ``no_due_date``）。``Todo.get_due_status`` と同じ判定です。
+- ``due_after``: この日時以降が期限のTodo。
+- ``due_before``: この日時より前が期限のTodo。
+- ``sort``: ``created``（既定。作成日時の新しい順）または
+  ``due``（期限の近い順。期限なしは最後）。
+
+``due_after``・``due_before`` にはISO 8601の日時か日付を指定します。
+日付はUTCのその日の0時、タイムゾーンのない日時は ``TIME_ZONE`` の
+日時として扱います（``Todo.is_due_today`` と同じく日付の境界はUTCです）。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, time, timezone as dt_timezone
+from typing import Mapping, Optional
+from urllib.parse import urlencode
+
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .pagination import DueDateKeysetPaginator, KeysetPaginator
+
+
+FILTER_PARAMS = ('completed', 'due', 'due_after', 'due_before', 'sort')
+
+COMPLETED_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+DUE_STATUSES = ('overdue', 'due_today', 'due_soon', 'normal', 'no_due_date')
+
+SORT_CREATED = 'created'
+SORT_DUE = 'due'
+SORTS = (SORT_CREATED, SORT_DUE)
+
+
+class InvalidFilter(ValueError):
+    """絞り込み・並び替えのクエリパラメータが不正な場合に送出される例外。"""
+
+
+@dataclass(frozen=True)
+class TodoFilter:
+    """一覧の絞り込み・並び替えの条件。
+
+    Attributes:
+        completed: 完了状態（Noneなら絞り込まない）。
+        due: 期限ステータス（Noneなら絞り込まない）。
+        due_after: 期限日時の下限（この日時を含む）。
+        due_before: 期限日時の上限（この日時を含まない）。
+        sort: 並び順（``created`` または ``due``）。
+        query: ページ送りのリンクに引き継ぐクエリ文字列（末尾に ``&`` 付き。条件がなければ空）。
+    """
+
+    completed: Optional[bool] = None
+    due: Optional[str] = None
+    due_after: Optional[datetime] = None
+    due_before: Optional[datetime] = None
+    sort: str = SORT_CREATED
+    query: str = ''
+
+    def apply(self, queryset: QuerySet, now: Optional[datetime] = None) -> QuerySet:
+        """条件でクエリセットを絞り込む。
+
+        Args:
+            queryset: ``TodoQuerySet`` のクエリセット。
+            now: 期限ステータスの判定の基準時刻。省略時は現在時刻。
+
+        Returns:
+            絞り込んだクエリセット。
+        """
+        if self.completed is not None:
+            queryset = queryset.filter_completed(self.completed)
+        if self.due is not None:
+            queryset = queryset.filter_due_status(self.due, now)
+        if self.due_after is not None:
+            queryset = queryset.filter(due_date__gte=self.due_after)
+        if self.due_before is not None:
+            queryset = queryset.filter(due_date__lt=self.due_before)
+        return queryset
+
+    def paginator(self, queryset: QuerySet, now: Optional[datetime] = None) -> KeysetPaginator:
+        """絞り込んだクエリセットを並び順に応じてページ分割するページネーターを返す。
+
+        期限ステータスのアノテーション（``with_due_status``）と絞り込みで
+        同じ基準時刻を使用します。
+
+        Args:
+            queryset: ``TodoQuerySet`` のクエリセット。
+            now: 期限ステータスの判定の基準時刻。省略時は現在時刻。
+
+        Returns:
+            キーセット方式のページネーター。
+        """
+        if now is None:
+            now = timezone.now()
+        queryset = self.apply(queryset.with_due_status(now), now)
+        if self.sort == SORT_DUE:
+            return DueDateKeysetPaginator(queryset, include_no_due_date=self.includes_no_due_date)
+        return KeysetPaginator(queryset)
+
+    @property
+    def includes_no_due_date(self) -> bool:
+        """期限なしのTodoが絞り込みの結果に含まれうるかどうか。"""
+        if self.due is not None:
+            return self.due == 'no_due_date'
+        return self.due_after is None and self.due_before is None
+
+
+def _parse_datetime(name: str, value: str) -> datetime:
+    """ISO 8601の日時か日付を、タイムゾーン付きの日時に変換する。"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is not None:
+                return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise InvalidFilter(f'{name} は日時か日付で指定してください: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_filters(params: Mapping[str, str]) -> TodoFilter:
+    """クエリパラメータから絞り込み・並び替えの条件を解釈する。
+
+    空の値は指定しなかったものとして扱います。
+
+    Args:
+        params: ``request.GET`` などのクエリパラメータ。
+
+    Returns:
+        絞り込み・並び替えの条件。
+
+    Raises:
+        InvalidFilter: 値が不正な場合。
+    """
+    values = {name: params.get(name) for name in FILTER_PARAMS if params.get(name)}
+    completed = values.get('completed')
+    if completed is not None and completed.lower() not in COMPLETED_VALUES:
+        raise InvalidFilter(f'completed は true か false で指定してください: {completed}')
+    due = values.get('due')
+    if due is not None and due not in DUE_STATUSES:
+        raise InvalidFilter(f'不正な期限ステータスです: {due}')
+    sort = values.get('sort', SORT_CREATED)
+    if sort not in SORTS:
+        raise InvalidFilter(f'不正な並び順です: {sort}')
+    due_after = _parse_datetime('due_after', values['due_after']) if 'due_after' in values else None
+    due_before = _parse_datetime('due_before', values['due_before']) if 'due_before' in values else None
+    return TodoFilter(
+        completed=None if completed is None else COMPLETED_VALUES[completed.lower()],
+        due=due,
+        due_after=due_after,
+        due_before=due_before,
+        sort=sort,
+        query=urlencode(values) + '&' if values else '',
+    )
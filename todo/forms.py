@@ -45,4 +45,31 @@ class TodoForm(forms.ModelForm):
                 'placeholder': '期限日時を選択してください（任意）',
                 'readonly': True
             }),
-        }
\ No newline at end of file
+        }
+
+
+class TodoImportForm(forms.Form):
+    """TodoのインポートファイルをアップロードするためのFormクラス。
+    
+    Attributes:
+        file: インポートするCSVまたはNDJSONファイル。
+        file_format: ファイル形式（空の場合は拡張子から推定）。
+        encoding: ファイルの文字コード（空の場合はUTF-8）。
+    """
+    
+    file = forms.FileField(
+        label='インポートファイル',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.ndjson,.jsonl'})
+    )
+    file_format = forms.ChoiceField(
+        label='形式',
+        required=False,
+        choices=[('', '拡張子から判定'), ('csv', 'CSV'), ('ndjson', 'NDJSON')],
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    encoding = forms.ChoiceField(
+        label='文字コード',
+        required=False,
+        choices=[('', 'UTF-8'), ('cp932', 'Shift_JIS（CP932）')],
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
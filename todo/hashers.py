@@ -0,0 +1,152 @@
+"""パスワードハッシュのプロファイルと、ハッシュ計算のプロセスプールへのオフロード。
+
+``TODO_PASSWORD_HASHER`` で新しく保存するハッシュの方式を選びます。
+以前の方式のハッシュも ``PASSWORD_HASHERS`` に残しているため検証でき、
+ログインに成功した時点で選んだ方式・パラメータのハッシュに書き換えます
+（Djangoの ``check_password()`` と同じアップグレード）。
+
+- ``argon2``: :class:`Argon2PasswordHasher`。``argon2-cffi`` が必要です
+  （``uv sync --extra argon2``）。既定のパラメータはOWASPの推奨値
+  （Argon2id、19MiB、2回、並列度1）で、Djangoの既定（100MiB、並列度8）より
+  1回あたりのCPU時間とメモリが小さく、コアあたりのログイン数を増やせます。
+- ``scrypt``: :class:`ScryptPasswordHasher`。追加の依存はありません。
+- ``pbkdf2``: Djangoの既定（PBKDF2-SHA256）。
+
+非同期のログインでは、:func:`acheck_password` と :func:`amake_password` が
+ハッシュの計算を ``TODO_PASSWORD_HASH_WORKERS`` 個のプロセスからなるプールで
+行い、イベントループとワーカーのスレッドを塞がないようにします。プールの
+プロセスは最初の呼び出し時に起動し、起動時点の設定（環境変数）で計算します。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+
+if TYPE_CHECKING:
+    # プールのプロセスはアプリケーションを初期化しないため、モデルは型チェック時だけ読み込む
+    from django.contrib.auth.base_user import AbstractBaseUser
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """パラメータを ``TODO_ARGON2_*`` の設定で調整できるArgon2idのハッシャー。
+
+    アルゴリズム名はDjangoの ``Argon2PasswordHasher`` と同じため、既存の
+    ハッシュをそのまま検証できます。パラメータを変更すると、次回のログインで
+    新しいパラメータのハッシュに書き換えられます。
+    """
+
+    @property
+    def time_cost(self) -> int:
+        return settings.TODO_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self) -> int:
+        return settings.TODO_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self) -> int:
+        return settings.TODO_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """パラメータを ``TODO_SCRYPT_*`` の設定で調整できるscryptのハッシャー。"""
+
+    @property
+    def work_factor(self) -> int:
+        return settings.TODO_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self) -> int:
+        return settings.TODO_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self) -> int:
+        return settings.TODO_SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self) -> int:
+        # 必要なメモリ（128 * N * r バイト）に余裕を持たせる。0ではOpenSSLの既定の32MiBが上限になる
+        return 256 * self.work_factor * self.block_size
+
+
+def _verify(password: str, encoded: str) -> tuple[bool, Optional[str]]:
+    """パスワードを検証し、アップグレードが必要なら新しいハッシュも返す（プールで実行）。"""
+    is_correct, must_update = hashers.verify_password(password, encoded)
+    if is_correct and must_update:
+        return True, hashers.make_password(password)
+    return is_correct, None
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """ハッシュ計算用のプロセスプールを返す（``TODO_PASSWORD_HASH_WORKERS`` が0なら ``None``）。
+
+    プロセスはスレッドを持つワーカーから安全に作れるよう ``spawn`` で起動します。
+    """
+    global _pool
+    workers = settings.TODO_PASSWORD_HASH_WORKERS
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """プロセスプールを終了する。次の呼び出しで作り直されます。"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+async def amake_password(password: str) -> str:
+    """:func:`django.contrib.auth.hashers.make_password` をプールで実行する。
+
+    Args:
+        password: ハッシュ化する平文のパスワード。
+
+    Returns:
+        優先するハッシャーで計算したハッシュ。
+    """
+    pool = get_pool()
+    if pool is None:
+        return await sync_to_async(hashers.make_password)(password)
+    return await asyncio.get_running_loop().run_in_executor(pool, hashers.make_password, password)
+
+
+async def acheck_password(user: AbstractBaseUser, password: str) -> bool:
+    """ユーザーのパスワードをプールで検証し、必要ならハッシュをアップグレードする。
+
+    :meth:`AbstractBaseUser.acheck_password` と同じく、検証に成功し、
+    ハッシュが優先する方式・パラメータでない場合は新しいハッシュを保存します。
+
+    Args:
+        user: 検証するユーザー。
+        password: 入力された平文のパスワード。
+
+    Returns:
+        パスワードが正しければ ``True``。
+    """
+    pool = get_pool()
+    if pool is None:
+        return await user.acheck_password(password)
+    is_correct, upgraded = await asyncio.get_running_loop().run_in_executor(
+        pool, _verify, password, user.password)
+    if upgraded is not None:
+        user.password = upgraded
+        await user.asave(update_fields=['password'])
+    return is_correct
@@ -0,0 +1,248 @@
+"""Todoの一括インポート。
+
+このモジュールはCSVまたはNDJSON形式のファイルを1行ずつ読み込み、
+``TodoForm`` と ``Todo.clean`` のルールで検証したうえで、
+``bulk_create`` により一定件数ごとにまとめて登録します。
+各バッチは1つのトランザクションで登録し、一覧キャッシュの
+無効化などの変更通知もバッチごとに1回だけ送信します。
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .forms import TodoForm
+from .models import Todo
+from .signals import ACTION_CREATED, send_todos_changed
+
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMATS = (FORMAT_CSV, FORMAT_NDJSON)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ERRORS = 1000
+
+# BOM付きのUTF-8も読めるよう utf-8-sig を既定の文字コードにする
+DEFAULT_ENCODING = 'utf-8-sig'
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', '完了'}
+
+
+class ImportFormatError(ValueError):
+    """インポートファイルの形式が不正な場合に送出される例外。"""
+
+
+@dataclass
+class RowError:
+    """検証に失敗した行の情報。
+
+    Attributes:
+        line: ファイル内の行番号（1始まり、CSVはヘッダーを1行目とする）。
+        errors: フィールド名とエラーメッセージのリストの辞書。
+    """
+
+    line: int
+    errors: dict[str, list[str]]
+
+
+@dataclass
+class ImportReport:
+    """インポート結果の集計。
+
+    Attributes:
+        total: 読み込んだ行数。
+        created: 登録したTodoの件数。
+        error_count: 検証に失敗した行数。
+        errors: 検証に失敗した行の詳細（先頭から ``max_errors`` 件まで）。
+        elapsed: 処理にかかった秒数。
+        aborted: ファイルを最後まで読み込めなかった理由（読み込めた場合は空）。
+    """
+
+    total: int = 0
+    created: int = 0
+    error_count: int = 0
+    errors: list[RowError] = field(default_factory=list)
+    elapsed: float = 0.0
+    aborted: str = ''
+
+    @property
+    def rows_per_second(self) -> float:
+        """1秒あたりに処理した行数。"""
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """ファイル名の拡張子からインポート形式を推定する。
+
+    Args:
+        filename: ファイル名またはパス。
+
+    Returns:
+        'csv'、'ndjson' のいずれか。推定できない場合はNone。
+    """
+    lowered = filename.lower()
+    if lowered.endswith('.csv'):
+        return FORMAT_CSV
+    if lowered.endswith(('.ndjson', '.jsonl')):
+        return FORMAT_NDJSON
+    return None
+
+
+def iter_records(stream: TextIO, file_format: str) -> Iterator[tuple[int, dict[str, Any]]]:
+    """テキストストリームから1行ずつレコードを読み込む。
+
+    Args:
+        stream: 読み込むテキストストリーム。
+        file_format: 'csv' または 'ndjson'。
+
+    Yields:
+        (行番号, フィールド名と値の辞書) のタプル。
+        NDJSONで解析できない行は値の代わりに ``{'__error__': メッセージ}`` を返します。
+
+    Raises:
+        ImportFormatError: 形式の指定が不正な場合、またはストリームの文字コードで
+            読み込めない・CSVとして解析できない行があり、以降を読み込めない場合。
+    """
+    if file_format == FORMAT_CSV:
+        records = _iter_csv(stream)
+    elif file_format == FORMAT_NDJSON:
+        records = _iter_ndjson(stream)
+    else:
+        raise ImportFormatError(f'不正なインポート形式です: {file_format}')
+    line_number = 0
+    try:
+        for line_number, record in records:
+            yield line_number, record
+    except UnicodeDecodeError as exc:
+        # デコードはまとまった単位で行われるため、正確な行番号は分からない
+        encoding = getattr(stream, 'encoding', None) or DEFAULT_ENCODING
+        raise ImportFormatError(
+            f'{line_number + 1}行目付近: 文字コード {encoding} として読み込めません。'
+            f'ファイルの文字コードを指定してください。'
+        ) from exc
+    except csv.Error as exc:
+        raise ImportFormatError(f'{line_number + 1}行目: CSVとして解析できません: {exc}') from exc
+
+
+def _iter_csv(stream: TextIO) -> Iterator[tuple[int, dict[str, Any]]]:
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _iter_ndjson(stream: TextIO) -> Iterator[tuple[int, dict[str, Any]]]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, {'__error__': f'JSONとして解析できません: {exc}'}
+            continue
+        if not isinstance(record, dict):
+            yield line_number, {'__error__': 'JSONオブジェクトではありません。'}
+            continue
+        yield line_number, record
+
+
+def _parse_completed(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def build_todo(user: User, record: dict[str, Any]) -> tuple[Optional[Todo], dict[str, list[str]]]:
+    """1行分のレコードを検証してTodoを組み立てる（保存はしない）。
+
+    Args:
+        user: Todoを所有するユーザー。
+        record: フィールド名と値の辞書。
+
+    Returns:
+        (Todo, {}) または検証に失敗した場合は (None, エラーの辞書)。
+    """
+    if '__error__' in record:
+        return None, {'__all__': [record['__error__']]}
+    data = {
+        'title': record.get('title') or '',
+        'description': record.get('description') or '',
+        'due_date': record.get('due_date') or '',
+    }
+    form = TodoForm(data=data, instance=Todo(user=user))
+    if not form.is_valid():
+        return None, {name: list(messages) for name, messages in form.errors.items()}
+    todo = form.save(commit=False)
+    todo.completed = _parse_completed(record.get('completed'))
+    return todo, {}
+
+
+def _flush(user: User, batch: list[Todo], report: ImportReport) -> None:
+    """バッチを1トランザクションで登録し、変更通知を1回だけ送信する。
+
+    変更通知の受信側（検索インデックスや統計の更新）も同じトランザクションで
+    実行するため、受信側が失敗した場合はバッチの登録も取り消されます。
+    """
+    if not batch:
+        return
+    with transaction.atomic():
+        created = Todo.objects.bulk_create(batch)
+        send_todos_changed(user.pk, [todo.pk for todo in created if todo.pk is not None], ACTION_CREATED)
+    report.created += len(created)
+    batch.clear()
+
+
+def import_todos(
+    user: User,
+    records: Iterable[tuple[int, dict[str, Any]]],
+    batch_size: Optional[int] = None,
+    max_errors: Optional[int] = None,
+) -> ImportReport:
+    """レコードを検証し、有効な行をバッチ単位で登録する。
+
+    Args:
+        user: Todoを所有するユーザー。
+        records: :func:`iter_records` が返す (行番号, レコード) の列。
+        batch_size: 1回の ``bulk_create`` で登録する件数。
+            省略時は ``settings.TODO_IMPORT_BATCH_SIZE``（未設定なら1000）。
+        max_errors: レポートに詳細を残すエラー行の上限。
+            省略時は ``settings.TODO_IMPORT_MAX_ERRORS``（未設定なら1000）。
+
+    Returns:
+        インポート結果の集計。ファイルを途中までしか読み込めなかった場合は
+        ``aborted`` に理由を設定し、それまでに読み込んだ有効な行は登録します。
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'TODO_IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    if max_errors is None:
+        max_errors = getattr(settings, 'TODO_IMPORT_MAX_ERRORS', DEFAULT_MAX_ERRORS)
+    batch_size = max(1, batch_size)
+
+    report = ImportReport()
+    batch: list[Todo] = []
+    started = time.perf_counter()
+    try:
+        for line, record in records:
+            report.total += 1
+            todo, errors = build_todo(user, record)
+            if todo is None:
+                report.error_count += 1
+                if len(report.errors) < max_errors:
+                    report.errors.append(RowError(line, errors))
+                continue
+            batch.append(todo)
+            if len(batch) >= batch_size:
+                _flush(user, batch, report)
+    except ImportFormatError as exc:
+        report.aborted = str(exc)
+    _flush(user, batch, report)
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,97 @@
+"""Todoの主要な操作のベンチマークを実行する管理コマンド。
+
+使い方::
+
+    python manage.py benchmark_todos [--users 5] [--todos 1000] [--requests 200]
+        [--scenarios list toggle ...] [--base-url http://127.0.0.1:8000 --concurrency 8]
+        [--output result.json] [--compare baseline.json --threshold 0.2]
+
+``--compare`` を指定した場合、基準の結果よりしきい値を超えて悪化した
+指標があればエラー終了するため、CIで性能の劣化を検出できます。
+計測の詳細は ``benchmarks.hot_paths`` を参照してください。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from benchmarks import hot_paths
+
+
+class Command(BaseCommand):
+    help = 'Todoの一覧・切り替え・作成・更新・削除のレイテンシとスループットを計測します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--users', type=int, default=5, help='作成するユーザー数')
+        parser.add_argument('--todos', type=int, default=1000, help='ユーザーごとのTodo件数')
+        parser.add_argument('--requests', type=int, default=200, help='シナリオごとの計測するリクエスト数')
+        parser.add_argument('--warmup', type=int, default=20, help='シナリオごとのウォームアップのリクエスト数')
+        parser.add_argument('--scenarios', nargs='+', choices=hot_paths.SCENARIOS, help='計測するシナリオ')
+        parser.add_argument('--base-url', help='HTTPサーバーのURL（省略時はテストクライアントを使用）')
+        parser.add_argument('--concurrency', type=int, default=1, help='同時実行数（--base-url 指定時のみ）')
+        parser.add_argument('--seed', type=int, default=0, help='データとリクエストを決める乱数のシード')
+        parser.add_argument('--output', help='結果を保存するJSONファイルのパス')
+        parser.add_argument('--compare', help='比較する基準の結果のJSONファイルのパス')
+        parser.add_argument('--threshold', type=float, default=hot_paths.DEFAULT_THRESHOLD,
+                            help='リグレッションとみなす悪化率（0.2なら20%%）')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        baseline = self._load(options['compare']) if options['compare'] else None
+        try:
+            result = hot_paths.run(
+                users=options['users'],
+                todos=options['todos'],
+                requests=options['requests'],
+                warmup=options['warmup'],
+                scenarios=options['scenarios'],
+                base_url=options['base_url'],
+                concurrency=options['concurrency'],
+                seed_value=options['seed'],
+            )
+        except (ValueError, RuntimeError) as exc:
+            raise CommandError(str(exc))
+
+        meta = result['meta']
+        self.stdout.write(
+            f"users={meta['users']} todos={meta['todos_per_user']} requests={meta['requests']} "
+            f"concurrency={meta['concurrency']} target={meta['target']} database={meta['database']}"
+        )
+        self.stdout.write(f"{'scenario':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for scenario, summary in result['scenarios'].items():
+            self.stdout.write(
+                f"{scenario:>8} {summary['throughput']:>9.1f} {summary['p50_ms']:>9.2f} "
+                f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['errors']:>7}"
+            )
+
+        if options['output']:
+            try:
+                with open(options['output'], 'w', encoding='utf-8') as stream:
+                    json.dump(result, stream, ensure_ascii=False, indent=2)
+            except OSError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"結果を {options['output']} に保存しました")
+
+        if baseline is not None:
+            self._report(hot_paths.compare(baseline, result, options['threshold']), options['threshold'])
+
+    def _load(self, path: str) -> dict[str, Any]:
+        try:
+            with open(path, encoding='utf-8') as stream:
+                return json.load(stream)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'基準の結果を読み込めません: {exc}')
+
+    def _report(self, rows: list[dict[str, Any]], threshold: float) -> None:
+        self.stdout.write(f"{'scenario':>8} {'metric':>10} {'baseline':>10} {'current':>10} {'change':>8}")
+        for row in rows:
+            line = (f"{row['scenario']:>8} {row['metric']:>10} {row['baseline']:>10.2f} "
+                    f"{row['current']:>10.2f} {row['change']:>+8.1%}")
+            self.stdout.write(self.style.ERROR(line) if row['regression'] else line)
+
+        regressions = [f"{row['scenario']}.{row['metric']}" for row in rows if row['regression']]
+        if regressions:
+            raise CommandError(f"{threshold:.0%}を超えて悪化した指標があります: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS('リグレッションはありません'))
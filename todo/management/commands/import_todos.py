@@ -0,0 +1,64 @@
+"""CSV/NDJSONファイルからTodoを一括インポートする管理コマンド。
+
+使い方::
+
+    python manage.py import_todos <username> <path> [--format csv|ndjson] [--encoding cp932] [--batch-size 1000]
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from todo.importer import DEFAULT_ENCODING, FORMATS, detect_format, import_todos, iter_records
+
+
+class Command(BaseCommand):
+    help = 'CSVまたはNDJSONファイルからユーザーのTodoを一括インポートします。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('username', help='Todoを登録するユーザー名')
+        parser.add_argument('path', help='インポートするファイルのパス')
+        parser.add_argument('--format', choices=FORMATS, help='ファイル形式（省略時は拡張子から推定）')
+        parser.add_argument('--encoding', default=DEFAULT_ENCODING,
+                            help=f'ファイルの文字コード（既定は {DEFAULT_ENCODING}。Shift_JISは cp932）')
+        parser.add_argument('--batch-size', type=int, help='1回のbulk_createで登録する件数')
+        parser.add_argument('--max-errors', type=int, help='表示するエラー行の上限')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['username']}")
+
+        file_format = options['format'] or detect_format(options['path'])
+        if file_format is None:
+            raise CommandError('ファイル形式を推定できません。--format を指定してください。')
+
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as stream:
+                report = import_todos(
+                    user,
+                    iter_records(stream, file_format),
+                    batch_size=options['batch_size'],
+                    max_errors=options['max_errors'],
+                )
+        except LookupError:
+            raise CommandError(f"不明な文字コードです: {options['encoding']}")
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for row_error in report.errors:
+            messages = '; '.join(f'{name}: {" ".join(errors)}' for name, errors in row_error.errors.items())
+            self.stderr.write(f'{row_error.line}行目: {messages}')
+        if report.error_count > len(report.errors):
+            self.stderr.write(f'...ほか{report.error_count - len(report.errors)}件のエラー')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.total}行中{report.created}件を登録しました'
+            f'（エラー{report.error_count}件, {report.elapsed:.2f}秒, {report.rows_per_second:.0f}行/秒）'
+        ))
+        if report.aborted:
+            raise CommandError(f'ファイルを最後まで読み込めませんでした: {report.aborted}')
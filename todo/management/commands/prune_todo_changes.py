@@ -0,0 +1,29 @@
+"""保持期間を過ぎた差分同期用の変更履歴とバッチ書き込みの冪等性キーを削除する管理コマンド。
+
+使い方::
+
+    python manage.py prune_todo_changes
+
+cronなどで1日1回程度実行してください。保持期間は
+``settings.TODO_SYNC_RETENTION_DAYS`` で指定します。
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from todo.batch import prune_idempotency_keys
+from todo.sync import get_retention, prune_changes
+
+
+class Command(BaseCommand):
+    help = '保持期間を過ぎた差分同期用の変更履歴と冪等性キーを削除します。'
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        deleted = prune_changes()
+        keys = prune_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(
+            f'{get_retention().days}日より古い変更履歴を{deleted}件、冪等性キーを{keys}件削除しました'
+        ))
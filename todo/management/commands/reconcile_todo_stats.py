@@ -0,0 +1,31 @@
+"""時刻の経過で古くなったユーザーごとのTodoの集計を再集計する管理コマンド。
+
+使い方::
+
+    python manage.py reconcile_todo_stats
+    python manage.py reconcile_todo_stats --all
+
+cronなどで数分ごとに実行すると、期限切れ・今日期限の件数が変わった
+ユーザーの集計を、一覧ページやAPIで読み込まれる前に再集計できます。
+``--all`` はすべてのユーザーを再集計し、``QuerySet.update()`` などの
+シグナルを送らない変更による集計のずれも修正します。
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from todo.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = '時刻の経過で古くなったユーザーごとのTodoの集計を再集計します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--all', action='store_true', help='すべてのユーザーの集計を再集計する')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        count = reconcile_stats(all_users=options['all'])
+        self.stdout.write(self.style.SUCCESS(f'{count}人のユーザーの集計を再集計しました'))
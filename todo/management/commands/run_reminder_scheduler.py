@@ -0,0 +1,68 @@
+"""期限が近づいた・過ぎたTodoのリマインダーを定期的に送信する管理コマンド。
+
+使い方::
+
+    python manage.py run_reminder_scheduler
+    python manage.py run_reminder_scheduler --once
+
+Webのプロセスとは別に1つだけ起動します。``--interval`` 秒（既定は
+``settings.TODO_REMINDER_INTERVAL``）ごとに :func:`todo.reminders.run_tick`
+を実行し、SIGTERM・Ctrl-Cで実行中の送信を終えてから終了します。
+送信に失敗した場合はログに記録し、次の実行で再試行します。
+``--once`` は1回だけ実行して終了するため、cronから起動することもできます。
+"""
+
+from __future__ import annotations
+
+import logging
+import signal
+import threading
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import close_old_connections
+
+from todo.reminders import run_tick
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '期限が近づいた・過ぎたTodoのリマインダーを定期的に送信します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--interval', type=float, default=settings.TODO_REMINDER_INTERVAL,
+                            help='実行の間隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=settings.TODO_REMINDER_BATCH_SIZE,
+                            help='1回に送信するリマインダーの件数')
+        parser.add_argument('--once', action='store_true', help='1回だけ実行して終了する')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        stop = threading.Event()
+        if not options['once'] and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            while not stop.is_set():
+                started = time.monotonic()
+                try:
+                    counts = run_tick(batch_size=options['batch_size'])
+                except Exception:
+                    # データベースや送信先の障害でスケジューラーを止めず、送信できなかった
+                    # バッチは次回に再送する（--onceではcronなどの呼び出し元に失敗を返す）
+                    if options['once']:
+                        raise
+                    logger.exception('リマインダーを送信できませんでした。次回に再試行します')
+                    counts = {}
+                if options['once'] or any(counts.values()):
+                    summary = '、'.join(f'{kind} {count}件' for kind, count in counts.items())
+                    self.stdout.write(self.style.SUCCESS(f'リマインダーを送信しました（{summary}）'))
+                if options['once']:
+                    break
+                # 長時間動くプロセスなので、リクエストの終了時と同じく古い接続を閉じる
+                close_old_connections()
+                stop.wait(max(0.0, options['interval'] - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
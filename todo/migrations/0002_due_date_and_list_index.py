@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='todo',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Todo', 'verbose_name_plural': 'Todos'},
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='due_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='期限日時'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='todo_user_created_idx'),
+        ),
+    ]
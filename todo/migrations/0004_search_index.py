@@ -0,0 +1,68 @@
+"""Todoの全文検索用インデックス。
+
+PostgreSQLでは ``SearchVector('title', 'description', config='simple')`` の
+GIN式インデックスを作成し、SQLiteではFTS5仮想テーブル ``todo_todo_fts`` を
+作成して既存の行を登録します。FTS5が無効なSQLiteやその他のデータベースでは
+何もしません（検索は ``icontains`` にフォールバックします）。
+"""
+
+from django.db import migrations
+
+
+SEARCH_CONFIG = 'simple'
+INDEX_NAME = 'todo_search_gin'
+FTS_TABLE = 'todo_todo_fts'
+
+
+def _search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(SearchVector('title', 'description', config=SEARCH_CONFIG), name=INDEX_NAME)
+
+
+def _fts_tokenizer(connection) -> str:
+    # trigramトークナイザ（SQLite 3.34以降）は分かち書きのない日本語の部分一致に対応する
+    if connection.Database.sqlite_version_info >= (3, 34):
+        return 'trigram'
+    return 'unicode61'
+
+
+def _fts5_enabled(connection) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('todo', 'Todo'), _search_index())
+    elif connection.vendor == 'sqlite' and _fts5_enabled(connection):
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f"USING fts5(title, description, user_id UNINDEXED, tokenize='{_fts_tokenizer(connection)}')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, user_id) '
+            'SELECT id, title, description, user_id FROM todo_todo'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('todo', 'Todo'), _search_index())
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0003_due_status_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0004_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('todo_id', models.BigIntegerField(verbose_name='TodoのID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='記録日時')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'Todoの変更履歴',
+                'verbose_name_plural': 'Todoの変更履歴',
+                'indexes': [models.Index(fields=['user', 'id'], name='todo_change_user_seq_idx'), models.Index(fields=['created_at'], name='todo_change_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0006_batch_idempotency_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='todo_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='総数')),
+                ('open', models.PositiveIntegerField(default=0, verbose_name='未完了')),
+                ('overdue', models.PositiveIntegerField(default=0, verbose_name='期限切れ')),
+                ('due_today', models.PositiveIntegerField(default=0, verbose_name='今日期限')),
+                ('next_due_at', models.DateTimeField(blank=True, null=True, verbose_name='次に期限を迎える日時')),
+                ('computed_at', models.DateTimeField(verbose_name='集計日時')),
+            ],
+            options={
+                'verbose_name': 'Todoの集計',
+                'verbose_name_plural': 'Todoの集計',
+                'indexes': [models.Index(fields=['next_due_at'], name='todo_stats_next_due_idx'), models.Index(fields=['computed_at'], name='todo_stats_computed_idx')],
+            },
+        ),
+    ]
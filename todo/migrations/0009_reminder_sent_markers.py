@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0008_todo_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='due_soon_reminded_for',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='期限間近を通知した期限'),
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='overdue_reminded_for',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='期限切れを通知した期限'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('completed', False), ('due_date__isnull', False), models.Q(('due_soon_reminded_for__isnull', True), models.Q(('due_soon_reminded_for', models.F('due_date')), _negated=True), _connector='OR')), fields=['due_date', 'id'], name='todo_due_soon_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('completed', False), ('due_date__isnull', False), models.Q(('overdue_reminded_for__isnull', True), models.Q(('overdue_reminded_for', models.F('due_date')), _negated=True), _connector='OR')), fields=['due_date', 'id'], name='todo_overdue_pending_idx'),
+        ),
+    ]
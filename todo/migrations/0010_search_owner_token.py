@@ -0,0 +1,70 @@
+"""FTS5仮想テーブルの所有ユーザーを索引付きのトークン列に置き換える。
+
+``user_id UNINDEXED`` 列による絞り込みはMATCHで全ユーザーの文書を辿った後に
+行われるため、所有ユーザーを私用領域の文字からなるトークンとして ``owner`` 列に
+登録し、MATCH式の条件に含められるようにします。SQLite（FTS5）以外では何もしません。
+"""
+
+from django.db import migrations
+
+
+FTS_TABLE = 'todo_todo_fts'
+# todo.search.owner_token と一致させること
+OWNER_TOKEN_BASE = 0xF0000
+OWNER_TOKEN_RADIX = 0xFFFE
+OWNER_TOKEN_DIGITS = 3
+
+
+def _owner_token_sql(column: str) -> str:
+    digits = [
+        f'{OWNER_TOKEN_BASE} + ({column} / {OWNER_TOKEN_RADIX ** place}) % {OWNER_TOKEN_RADIX}'
+        for place in reversed(range(OWNER_TOKEN_DIGITS))
+    ]
+    return f'char({", ".join(digits)})'
+
+
+def _fts_tokenizer(connection) -> str:
+    # trigramトークナイザ（SQLite 3.34以降）は分かち書きのない日本語の部分一致に対応する
+    if connection.Database.sqlite_version_info >= (3, 34):
+        return 'trigram'
+    return 'unicode61'
+
+
+def _fts_table_exists(connection) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _rebuild(schema_editor, owner_column: str, owner_expression: str) -> None:
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not _fts_table_exists(connection):
+        return
+    schema_editor.execute(f'DROP TABLE {FTS_TABLE}')
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {FTS_TABLE} '
+        f"USING fts5(title, description, {owner_column}, tokenize='{_fts_tokenizer(connection)}')"
+    )
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description, {owner_column.split()[0]}) '
+        f'SELECT id, title, description, {owner_expression} FROM todo_todo'
+    )
+
+
+def index_owner_token(apps, schema_editor):
+    _rebuild(schema_editor, 'owner', _owner_token_sql('user_id'))
+
+
+def unindex_owner_token(apps, schema_editor):
+    _rebuild(schema_editor, 'user_id UNINDEXED', 'user_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0009_reminder_sent_markers'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_owner_token, unindex_owner_token),
+    ]
@@ -5,11 +5,189 @@
 """
 
 from __future__ import annotations
-from django.db import models
+from typing import Optional
+from django.db import connections, models, router, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+
+# 「期限間近」とみなす期間
+DUE_SOON_WINDOW = timedelta(days=3)
+
+
+def _day_bounds(now: datetime) -> tuple[datetime, datetime]:
+    """``now`` が属する日（UTC）の開始・終了日時を返す。
+
+    ``Todo.is_due_today`` と同じく、日付の比較はUTCで行います。
+
+    Args:
+        now: 基準日時。
+
+    Returns:
+        (当日0時, 翌日0時) のタプル。
+    """
+    start = now.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+def _reminder_pending(field: str) -> Q:
+    """リマインダーを現在の期限に対してまだ送っていない、期限のある未完了Todoの条件を返す。
+
+    ``field`` には送信したときの期限を記録します。期限を変更すると記録と一致しなくなり、
+    新しい期限に対して再び送信の対象になります。
+
+    Args:
+        field: 送信済みの期限を記録するTodoのフィールド名。
+
+    Returns:
+        絞り込みの条件（部分インデックスの条件にも使用します）。
+    """
+    return Q(completed=False, due_date__isnull=False) & (
+        Q(**{f'{field}__isnull': True}) | ~Q(**{field: F('due_date')})
+    )
+
+
+class TodoQuerySet(models.QuerySet):
+    """Todo用のカスタムクエリセット。"""
+
+    def filter_completed(self, completed: bool) -> TodoQuerySet:
+        """完了状態で絞り込む。
+
+        ``completed=False`` のような真偽値リテラルでの絞り込みは
+        ``NOT completed`` というSQLになり、SQLiteでは複合インデックス
+        ``(user, completed, due_date)`` の等価条件として使えません。
+        ``Value`` で包んで ``completed = %s`` の形にします。
+
+        Args:
+            completed: 完了済みを取得する場合True、未完了ならFalse。
+
+        Returns:
+            絞り込んだクエリセット。
+        """
+        return self.filter(completed=Value(completed))
+
+    def with_due_status(self, now: Optional[datetime] = None) -> TodoQuerySet:
+        """期限ステータスを ``due_status`` としてSQL側でアノテーションする。
+
+        ``Todo.get_due_status`` と同じ判定を ``Case``/``When`` で行い、
+        すべての行で同じ基準時刻を使用します。
+
+        Args:
+            now: 判定の基準時刻。省略時は現在時刻。
+
+        Returns:
+            ``due_status`` アノテーション付きのクエリセット。
+        """
+        if now is None:
+            now = timezone.now()
+        today_start, today_end = _day_bounds(now)
+        return self.annotate(due_status=Case(
+            When(due_date__isnull=True, then=Value('no_due_date')),
+            When(due_date__lt=now, then=Value('overdue')),
+            When(Q(due_date__gte=today_start, due_date__lt=today_end), then=Value('due_today')),
+            When(due_date__lte=now + DUE_SOON_WINDOW, then=Value('due_soon')),
+            default=Value('normal'),
+            output_field=models.CharField(),
+        ))
+
+    def filter_due_status(self, status: str, now: Optional[datetime] = None) -> TodoQuerySet:
+        """期限ステータスで絞り込む。
+
+        ``Todo.get_due_status`` と同じ判定を、期限日時の範囲条件に変換します。
+        ``due_status`` のアノテーションで絞り込むと全行で ``CASE`` 式を
+        評価することになるため、インデックスで範囲を辿れる条件にします。
+
+        Args:
+            status: 'overdue'、'due_today'、'due_soon'、'normal'、'no_due_date' のいずれか。
+            now: 判定の基準時刻。省略時は現在時刻。
+
+        Returns:
+            絞り込んだクエリセット。
+
+        Raises:
+            ValueError: ``status`` が不正な場合。
+        """
+        if now is None:
+            now = timezone.now()
+        _, today_end = _day_bounds(now)
+        # 判定は期限切れ・今日期限・期限間近の順に優先されるため、範囲は互いに重ならない
+        conditions = {
+            'no_due_date': Q(due_date__isnull=True),
+            'overdue': Q(due_date__lt=now),
+            'due_today': Q(due_date__gte=now, due_date__lt=today_end),
+            'due_soon': Q(due_date__gte=today_end, due_date__lte=now + DUE_SOON_WINDOW),
+            'normal': Q(due_date__gt=now + DUE_SOON_WINDOW),
+        }
+        if status not in conditions:
+            raise ValueError(f'不正な期限ステータスです: {status}')
+        return self.filter(conditions[status])
+
+
+class TodoManager(models.Manager.from_queryset(TodoQuerySet)):
+    """Todo用のカスタムマネージャー。
+
+    ``TodoQuerySet`` の絞り込みに加え、クエリセットの条件に依存しない
+    1件単位の更新をまとめます。
+    """
+
+    def toggle_completed(self, pk: int, user_id: int) -> Optional[bool]:
+        """完了状態を1文のUPDATEで反転する。
+
+        ``UPDATE ... SET completed = NOT completed ... RETURNING completed``
+        を所有ユーザーで絞り込んで実行するため、読み取りと書き込みの間に
+        他のリクエストの変更が割り込むことはなく、他のカラムも上書きしません。
+        ``RETURNING`` が使えないデータベースでは ``Case`` 式による
+        UPDATEの後に同じトランザクション内で値を読み取ります。
+
+        ``save()`` を経由しないため ``post_save`` シグナルは送信されません。
+
+        Args:
+            pk: 切り替えるTodoの主キー。
+            user_id: Todoを所有するユーザーのID。
+
+        Returns:
+            切り替え後の完了状態。対象のTodoが存在しない場合はNone。
+        """
+        using = self._db or router.db_for_write(self.model)
+        connection = connections[using]
+        now = timezone.now()
+        if _supports_update_returning(connection):
+            opts = self.model._meta
+            qn = connection.ops.quote_name
+            completed = qn(opts.get_field('completed').column)
+            sql = (
+                f'UPDATE {qn(opts.db_table)} '
+                f'SET {completed} = NOT {completed}, {qn(opts.get_field("updated_at").column)} = %s '
+                f'WHERE {qn(opts.pk.column)} = %s AND {qn(opts.get_field("user").column)} = %s '
+                f'RETURNING {completed}'
+            )
+            params = [opts.get_field('updated_at').get_db_prep_value(now, connection), pk, user_id]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            return None if row is None else bool(row[0])
+
+        queryset = self.using(using)
+        with transaction.atomic(using=using):
+            rows = queryset.filter(pk=pk, user_id=user_id).update(
+                completed=Case(When(completed=True, then=Value(False)), default=Value(True)),
+                updated_at=now,
+            )
+            if not rows:
+                return None
+            return queryset.filter(pk=pk).values_list('completed', flat=True).get()
+
+
+def _supports_update_returning(connection) -> bool:
+    """データベースが ``UPDATE ... RETURNING`` に対応しているかを返す。"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
 
 
 class Todo(models.Model):
@@ -27,6 +205,8 @@ class Todo(models.Model):
         created_at: todoが作成された日時。
         updated_at: todoが最後に更新された日時。
         user: このtodoを所有するユーザーへの参照。
+        due_soon_reminded_for: 期限間近のリマインダーを送った時点の期限日時。
+        overdue_reminded_for: 期限切れのリマインダーを送った時点の期限日時。
     """
     
     title = models.CharField(max_length=200, verbose_name='タイトル')
@@ -35,13 +215,49 @@ class Todo(models.Model):
     due_date = models.DateTimeField(null=True, blank=True, verbose_name='期限日時')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='ユーザー')
+    # user_id単独のインデックスは先頭がuserの複合インデックスで代替できるため作らない
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name='ユーザー')
+    # 送信済みのリマインダー（todo.reminders）。期限を変更すると再び送信の対象になる
+    due_soon_reminded_for = models.DateTimeField(null=True, blank=True, editable=False,
+                                                 verbose_name='期限間近を通知した期限')
+    overdue_reminded_for = models.DateTimeField(null=True, blank=True, editable=False,
+                                                verbose_name='期限切れを通知した期限')
+
+    objects = TodoManager()
 
     class Meta:
         """Todoモデルのメタ設定。"""
         verbose_name = 'Todo'
         verbose_name_plural = 'Todos'
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # 一覧のキーセットページネーション (user, -created_at, -id) 用
+            models.Index(fields=['user', '-created_at', '-id'], name='todo_user_created_idx'),
+            # ユーザー別の完了状態・期限日での絞り込み用
+            models.Index(fields=['user', 'completed', 'due_date'], name='todo_user_open_due_idx'),
+            # 完了状態で絞り込んだ一覧（作成日時順）のキーセットページネーション用
+            models.Index(fields=['user', 'completed', '-created_at', '-id'], name='todo_user_done_created_idx'),
+            # 完了状態で絞り込まない期限での絞り込み・期限順の一覧用
+            models.Index(fields=['user', 'due_date'], name='todo_user_due_idx'),
+            # 期限のある未完了Todoだけを対象にした部分インデックス
+            models.Index(
+                fields=['due_date'],
+                name='todo_open_due_date_idx',
+                condition=Q(completed=False, due_date__isnull=False),
+            ),
+            # リマインダーを送っていないTodoだけを対象にした部分インデックス。
+            # 送信済みのTodoは外れるため、しきい値を過ぎた未送信のTodoだけを辿れる
+            models.Index(
+                fields=['due_date', 'id'],
+                name='todo_due_soon_pending_idx',
+                condition=_reminder_pending('due_soon_reminded_for'),
+            ),
+            models.Index(
+                fields=['due_date', 'id'],
+                name='todo_overdue_pending_idx',
+                condition=_reminder_pending('overdue_reminded_for'),
+            ),
+        ]
 
     def __str__(self) -> str:
         """Todoの文字列表現を返す。
@@ -66,40 +282,59 @@ class Todo(models.Model):
             if self.due_date < now.replace(second=0, microsecond=0):
                 raise ValidationError({'due_date': '期限日は過去の日付にできません。'})
     
-    def is_overdue(self) -> bool:
+    def is_overdue(self, now: Optional[datetime] = None) -> bool:
         """期限切れかどうかを判定。
         
+        Args:
+            now: 判定の基準時刻。省略時は現在時刻。
+        
         Returns:
             期限切れの場合True、そうでなければFalse。
         """
         if self.due_date is None:
             return False
-        return timezone.now() > self.due_date
+        if now is None:
+            now = timezone.now()
+        return now > self.due_date
     
-    def is_due_soon(self) -> bool:
+    def is_due_soon(self, now: Optional[datetime] = None) -> bool:
         """期限間近かどうかを判定（3日以内）。
         
+        Args:
+            now: 判定の基準時刻。省略時は現在時刻。
+        
         Returns:
             期限まで3日以内の場合True、そうでなければFalse。
         """
         if self.due_date is None:
             return False
-        return timezone.now() <= self.due_date <= timezone.now() + timedelta(days=3)
+        if now is None:
+            now = timezone.now()
+        return now <= self.due_date <= now + DUE_SOON_WINDOW
     
-    def is_due_today(self) -> bool:
+    def is_due_today(self, now: Optional[datetime] = None) -> bool:
         """今日期限かどうかを判定。
         
+        Args:
+            now: 判定の基準時刻。省略時は現在時刻。
+        
         Returns:
             今日期限の場合True、そうでなければFalse。
         """
         if self.due_date is None:
             return False
-        today = timezone.now().date()
-        return self.due_date.date() == today
+        today_start, today_end = _day_bounds(now or timezone.now())
+        return today_start <= self.due_date < today_end
     
-    def get_due_status(self) -> str:
+    def get_due_status(self, now: Optional[datetime] = None) -> str:
         """期限ステータスを取得。
         
+        ``TodoQuerySet.with_due_status`` でアノテーションされた
+        ``due_status`` がある場合はその値をそのまま返します。
+        
+        Args:
+            now: 判定の基準時刻。省略時は現在時刻。
+        
         Returns:
             期限ステータス文字列：
             - 'overdue': 期限切れ
@@ -108,14 +343,183 @@ class Todo(models.Model):
             - 'normal': 通常
             - 'no_due_date': 期限日なし
         """
+        annotated = self.__dict__.get('due_status')
+        if annotated is not None and now is None:
+            return annotated
+        
         if self.due_date is None:
             return 'no_due_date'
         
-        if self.is_overdue():
+        if now is None:
+            now = timezone.now()
+        if self.is_overdue(now):
             return 'overdue'
-        elif self.is_due_today():
+        elif self.is_due_today(now):
             return 'due_today'
-        elif self.is_due_soon():
+        elif self.is_due_soon(now):
             return 'due_soon'
         else:
             return 'normal'
+
+
+class TodoChange(models.Model):
+    """差分同期用のTodoの変更履歴。
+    
+    Todoが作成・更新・完了切り替え・削除されるたびに、変更されたTodoごとに
+    1行追加されます。主キーは単調に増加するため、クライアントは最後に
+    受け取った主キーを同期トークンとして保持し、それ以降の変更だけを取得します。
+    変更後にTodoが存在しなければ削除されたものとして扱うため、
+    削除されたTodoの行は墓標（tombstone）の役割も果たします。
+    
+    古い行は ``prune_todo_changes`` コマンドで削除します。
+    
+    Attributes:
+        user: 変更されたTodoの所有ユーザー。
+        todo_id: 変更されたTodoのID（削除後も残すため外部キーにしない）。
+        created_at: 変更が記録された日時。
+    """
+    
+    # ユーザー削除時のTodoの連鎖削除でも記録できるよう、外部キー制約は付けない
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name='+', verbose_name='ユーザー',
+    )
+    todo_id = models.BigIntegerField(verbose_name='TodoのID')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='記録日時')
+
+    class Meta:
+        """TodoChangeモデルのメタ設定。"""
+        verbose_name = 'Todoの変更履歴'
+        verbose_name_plural = 'Todoの変更履歴'
+        indexes = [
+            # ユーザーごとに同期トークン以降の変更を読む (user, id) 用
+            models.Index(fields=['user', 'id'], name='todo_change_user_seq_idx'),
+            # 保持期間を過ぎた行の削除用
+            models.Index(fields=['created_at'], name='todo_change_created_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """変更履歴の文字列表現を返す。
+        
+        Returns:
+            連番と変更されたTodoのID。
+        """
+        return f'#{self.pk} todo={self.todo_id}'
+
+
+class TodoIdempotencyKey(models.Model):
+    """バッチ書き込みで処理済みの操作の冪等性キー。
+    
+    同じキーを持つ操作が再送された場合、再適用せずに保存した結果を返します。
+    古い行は ``prune_todo_changes`` コマンドで変更履歴と一緒に削除します。
+    
+    Attributes:
+        user: 操作したユーザー。
+        key: クライアントが操作ごとに付けた一意なキー。
+        result: 最初に適用したときの操作結果。
+        created_at: 操作を適用した日時。
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name='ユーザー')
+    key = models.CharField(max_length=64, verbose_name='冪等性キー')
+    result = models.JSONField(verbose_name='操作結果')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='記録日時')
+
+    class Meta:
+        """TodoIdempotencyKeyモデルのメタ設定。"""
+        verbose_name = '冪等性キー'
+        verbose_name_plural = '冪等性キー'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='todo_idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            # 保持期間を過ぎた行の削除用
+            models.Index(fields=['created_at'], name='todo_idempotency_created_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """冪等性キーの文字列表現を返す。
+        
+        Returns:
+            冪等性キー。
+        """
+        return self.key
+
+
+class TodoStats(models.Model):
+    """ユーザーごとのTodoの件数の集計（非正規化した1行）。
+    
+    一覧ページのヘッダーや集計APIで、Todoを走査せずに主キー1回の読み込みで
+    件数を返すために使用します。Todoの変更（``todos_changed``）のたびに
+    :func:`todo.stats.refresh_stats` で再集計します。
+    
+    期限切れ・今日期限の件数は時刻の経過でも変わるため、集計時点より後で
+    最初に期限を迎える未完了Todoの期限（``next_due_at``）を保持し、その時刻か
+    日付が変わった後に読み込んだ場合は再集計します。定期的な再集計には
+    ``reconcile_todo_stats`` コマンドを使用します。
+    
+    Attributes:
+        user: 集計対象のユーザー。
+        total: Todoの総数。
+        open: 未完了のTodoの数。
+        overdue: 期限切れの未完了のTodoの数。
+        due_today: 今日期限（期限切れを除く）の未完了のTodoの数。
+        next_due_at: 集計時点より後で最初に期限を迎える未完了Todoの期限。
+        computed_at: 集計した日時。
+    """
+    
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='todo_stats', verbose_name='ユーザー',
+    )
+    total = models.PositiveIntegerField(default=0, verbose_name='総数')
+    open = models.PositiveIntegerField(default=0, verbose_name='未完了')
+    overdue = models.PositiveIntegerField(default=0, verbose_name='期限切れ')
+    due_today = models.PositiveIntegerField(default=0, verbose_name='今日期限')
+    next_due_at = models.DateTimeField(null=True, blank=True, verbose_name='次に期限を迎える日時')
+    computed_at = models.DateTimeField(verbose_name='集計日時')
+
+    class Meta:
+        """TodoStatsモデルのメタ設定。"""
+        verbose_name = 'Todoの集計'
+        verbose_name_plural = 'Todoの集計'
+        indexes = [
+            # 期限の経過で古くなった集計を再集計コマンドで探す用
+            models.Index(fields=['next_due_at'], name='todo_stats_next_due_idx'),
+            models.Index(fields=['computed_at'], name='todo_stats_computed_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """集計の文字列表現を返す。
+        
+        Returns:
+            ユーザーIDと件数。
+        """
+        return f'user={self.user_id} total={self.total} open={self.open}'
+    
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        """時刻の経過で件数が変わっている可能性があるかを判定。
+        
+        Args:
+            now: 判定の基準時刻。省略時は現在時刻。
+        
+        Returns:
+            次の期限を過ぎたか、集計後に日付（UTC）が変わった場合True。
+        """
+        if now is None:
+            now = timezone.now()
+        if self.next_due_at is not None and now >= self.next_due_at:
+            return True
+        return now >= _day_bounds(self.computed_at)[1]
+    
+    def as_dict(self) -> dict[str, int]:
+        """件数を辞書で返す。
+        
+        Returns:
+            ``total``・``open``・``overdue``・``due_today`` をキーとする辞書。
+        """
+        return {
+            'total': self.total,
+            'open': self.open,
+            'overdue': self.overdue,
+            'due_today': self.due_today,
+        }
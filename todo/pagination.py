@@ -0,0 +1,293 @@
+"""Todo一覧用のキーセット（カーソル）ページネーション。
+
+このモジュールは ``(created_at, id)`` をキーとしたキーセット方式の
+ページネーションを提供します。OFFSET方式と異なり、何ページ目を
+取得してもインデックスを辿る範囲はページサイズ分だけなので、
+深いページでも取得時間が一定に保たれます。期限の近い順の一覧には
+``(due_date, id)`` をキーとする :class:`DueDateKeysetPaginator` を使用します。
+"""
+
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+
+
+DEFAULT_PAGE_SIZE = 50
+
+DIRECTION_NEXT = 'n'
+DIRECTION_PREV = 'p'
+
+
+class InvalidCursor(ValueError):
+    """カーソル文字列を解釈できない場合に送出される例外。"""
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """ページ境界の行を指すカーソル。
+
+    Attributes:
+        value: 境界となる行の並び替えのキー（作成日時や期限日時。期限なしはNone）。
+        pk: 境界となる行の主キー。
+        direction: 境界からどちら向きに読むか（'n': 次ページ、'p': 前ページ）。
+    """
+
+    value: Optional[datetime]
+    pk: int
+    direction: str = DIRECTION_NEXT
+
+    def encode(self) -> str:
+        """URLに埋め込める不透明な文字列へ変換する。
+
+        Returns:
+            URLセーフなBase64文字列（パディングなし）。
+        """
+        value = '' if self.value is None else self.value.isoformat()
+        raw = f'{self.direction}|{value}|{self.pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, value: str) -> Cursor:
+        """:meth:`encode` で生成した文字列からカーソルを復元する。
+
+        Args:
+            value: カーソル文字列。
+
+        Returns:
+            復元したカーソル。
+
+        Raises:
+            InvalidCursor: 文字列の形式が不正な場合。
+        """
+        try:
+            padded = value + '=' * (-len(value) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            direction, value, pk = raw.split('|')
+            cursor = cls(datetime.fromisoformat(value) if value else None, int(pk), direction)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise InvalidCursor(value) from exc
+        if cursor.direction not in (DIRECTION_NEXT, DIRECTION_PREV):
+            raise InvalidCursor(value)
+        return cursor
+
+
+@dataclass
+class KeysetPage:
+    """キーセットページネーションで取得した1ページ分の結果。
+
+    Attributes:
+        object_list: このページに含まれるオブジェクトのリスト。
+        next_cursor: 次ページのカーソル文字列（存在しない場合はNone）。
+        previous_cursor: 前ページのカーソル文字列（存在しない場合はNone）。
+    """
+
+    object_list: list[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __bool__(self) -> bool:
+        return bool(self.object_list)
+
+    @property
+    def has_next(self) -> bool:
+        """次ページが存在するかどうか。"""
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        """前ページが存在するかどうか。"""
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self) -> bool:
+        """前後いずれかのページが存在するかどうか。"""
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """``(-created_at, -id)`` 順のクエリセットをキーセット方式でページ分割する。
+
+    各ページは ``page_size + 1`` 件だけを取得し、余った1件で
+    続きのページが存在するかを判定します。COUNTクエリは発行しません。
+
+    Attributes:
+        queryset: ページ分割対象のクエリセット。
+        page_size: 1ページあたりの件数。
+    """
+
+    def __init__(self, queryset: QuerySet, page_size: Optional[int] = None) -> None:
+        """ページネーターを初期化する。
+
+        Args:
+            queryset: ページ分割対象のクエリセット。
+            page_size: 1ページあたりの件数。省略時は ``settings.TODO_PAGE_SIZE``
+                （未設定なら50件）。
+        """
+        if page_size is None:
+            page_size = getattr(settings, 'TODO_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        self.queryset = queryset
+        self.page_size = max(1, page_size)
+
+    def get_page(self, cursor: Optional[str]) -> KeysetPage:
+        """カーソル文字列に対応するページを返す。
+
+        カーソルが空または不正な場合は先頭ページを返します。
+
+        Args:
+            cursor: :meth:`Cursor.encode` で生成したカーソル文字列。
+
+        Returns:
+            取得したページ。
+        """
+        return self.page(self._decode(cursor))
+
+    async def aget_page(self, cursor: Optional[str]) -> KeysetPage:
+        """:meth:`get_page` の非同期版。"""
+        return await self.apage(self._decode(cursor))
+
+    def page(self, cursor: Optional[Cursor]) -> KeysetPage:
+        """カーソルを境界としてページを取得する。
+
+        Args:
+            cursor: 境界カーソル。Noneの場合は先頭ページ。
+
+        Returns:
+            取得したページ。
+        """
+        limit = self.page_size + 1
+        rows: list[Any] = []
+        for queryset in self._segments(cursor):
+            rows.extend(queryset[:limit - len(rows)])
+            if len(rows) >= limit:
+                break
+        return self._build(cursor, rows)
+
+    async def apage(self, cursor: Optional[Cursor]) -> KeysetPage:
+        """:meth:`page` の非同期版。"""
+        limit = self.page_size + 1
+        rows: list[Any] = []
+        for queryset in self._segments(cursor):
+            rows.extend([row async for row in queryset[:limit - len(rows)]])
+            if len(rows) >= limit:
+                break
+        return self._build(cursor, rows)
+
+    @staticmethod
+    def _decode(cursor: Optional[str]) -> Optional[Cursor]:
+        if cursor:
+            try:
+                return Cursor.decode(cursor)
+            except InvalidCursor:
+                pass
+        return None
+
+    def _segments(self, cursor: Optional[Cursor]) -> list[QuerySet]:
+        """カーソルの位置から読む順に並べたクエリセットを返す。
+
+        ページは先頭のクエリセットから順に ``page_size + 1`` 件に達するまで読みます。
+        """
+        if cursor is None:
+            return [self.queryset.order_by('-created_at', '-id')]
+        if cursor.direction == DIRECTION_NEXT:
+            return [
+                self.queryset
+                .filter(Q(created_at__lt=cursor.value)
+                        | Q(created_at=cursor.value, id__lt=cursor.pk))
+                .order_by('-created_at', '-id')
+            ]
+        # 前ページは逆順で読み、表示順に戻す
+        return [
+            self.queryset
+            .filter(Q(created_at__gt=cursor.value)
+                    | Q(created_at=cursor.value, id__gt=cursor.pk))
+            .order_by('created_at', 'id')
+        ]
+
+    def _key(self, row: Any) -> Optional[datetime]:
+        """行の並び替えのキーを返す。"""
+        return row.created_at
+
+    def _build(self, cursor: Optional[Cursor], rows: list[Any]) -> KeysetPage:
+        """取得した行からページオブジェクトを組み立てる。"""
+        has_extra = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if cursor is not None and cursor.direction == DIRECTION_PREV:
+            rows.reverse()
+            has_more_after, has_before = True, has_extra
+        else:
+            has_more_after, has_before = has_extra, cursor is not None
+
+        page = KeysetPage(object_list=rows)
+        if rows and has_more_after:
+            last = rows[-1]
+            page.next_cursor = Cursor(self._key(last), last.pk, DIRECTION_NEXT).encode()
+        if rows and has_before:
+            first = rows[0]
+            page.previous_cursor = Cursor(self._key(first), first.pk, DIRECTION_PREV).encode()
+        return page
+
+
+class DueDateKeysetPaginator(KeysetPaginator):
+    """期限の近い順（``(due_date, id)`` の昇順、期限なしは最後）にページ分割する。
+
+    NULLを最後に並べる ``ORDER BY ... NULLS LAST`` はSQLiteではインデックスの
+    順序と一致せず全件の並び替えになるため、期限ありの行と期限なしの行を
+    別々のクエリで読みます。どちらもインデックスの範囲を辿るだけで済み、
+    両方にまたがるページだけが2クエリになります。
+
+    Attributes:
+        include_no_due_date: 期限なしの行を読むかどうか。期限の範囲で絞り込んだ
+            クエリセットでは期限なしの行は含まれないため、Falseにして
+            不要なクエリを省きます。
+    """
+
+    def __init__(self, queryset: QuerySet, page_size: Optional[int] = None,
+                 include_no_due_date: bool = True) -> None:
+        super().__init__(queryset, page_size)
+        self.include_no_due_date = include_no_due_date
+
+    def _segments(self, cursor: Optional[Cursor]) -> list[QuerySet]:
+        return [queryset for queryset, has_due in self._due_segments(cursor)
+                if has_due or self.include_no_due_date]
+
+    def _due_segments(self, cursor: Optional[Cursor]) -> list[tuple[QuerySet, bool]]:
+        """読む順に並べた ``(クエリセット, 期限ありの行か)`` のリストを返す。"""
+        with_due = self.queryset.filter(due_date__isnull=False)
+        without_due = self.queryset.filter(due_date__isnull=True)
+        if cursor is None:
+            return [(with_due.order_by('due_date', 'id'), True), (without_due.order_by('id'), False)]
+        if cursor.direction == DIRECTION_NEXT:
+            if cursor.value is None:
+                return [(without_due.filter(id__gt=cursor.pk).order_by('id'), False)]
+            return [
+                (with_due
+                 .filter(Q(due_date__gt=cursor.value) | Q(due_date=cursor.value, id__gt=cursor.pk))
+                 .order_by('due_date', 'id'), True),
+                (without_due.order_by('id'), False),
+            ]
+        # 前ページは逆順（期限なし→期限ありの降順）で読み、表示順に戻す
+        if cursor.value is None:
+            return [
+                (without_due.filter(id__lt=cursor.pk).order_by('-id'), False),
+                (with_due.order_by('-due_date', '-id'), True),
+            ]
+        return [
+            (with_due
+             .filter(Q(due_date__lt=cursor.value) | Q(due_date=cursor.value, id__lt=cursor.pk))
+             .order_by('-due_date', '-id'), True)
+        ]
+
+    def _key(self, row: Any) -> Optional[datetime]:
+        return row.due_date
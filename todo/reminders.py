@@ -0,0 +1,260 @@
+"""期限が近づいた・過ぎたTodoのリマインダーの送信。
+
+``run_reminder_scheduler`` コマンドが一定間隔で :func:`run_tick` を呼び出し、
+しきい値を過ぎてまだ送信していないTodoにリマインダーを送信します。
+
+- ``due_soon``: 期限まで ``DUE_SOON_WINDOW``（3日）を切った（一覧の「期限間近」）。
+- ``overdue``: 期限を過ぎた。
+
+送信したTodoには、種類ごとのフィールド（``due_soon_reminded_for``・
+``overdue_reminded_for``）に送信時点の期限を記録します。期限を過ぎてから
+作成したTodoや、しきい値の内側へ期限を変更したTodoも次回の実行で送信し、
+期限を変更したTodoには新しい期限に対して改めて送信します。
+
+未送信のTodoは種類ごとの部分インデックス（``todo_due_soon_pending_idx``・
+``todo_overdue_pending_idx``）に残り、送信すると外れます。しきい値を過ぎた
+未送信のTodoを ``(due_date, id)`` の順に ``TODO_REMINDER_BATCH_SIZE`` 件ずつ
+読むときは、このインデックスの該当範囲を辿るだけで済み、送信済みのTodoや
+全ユーザーのTodoを走査しません。
+
+送信には ``settings.TODO_REMINDER_SENDER`` にクラスのパスで指定した
+送信先を使用します（:class:`ConsoleSender`・:class:`FileSender`・
+:class:`MemorySender`）。メールやプッシュ通知で送る場合は
+:class:`BaseSender` を実装したクラスに差し替えてください。
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional, TextIO
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import DUE_SOON_WINDOW, Todo, _reminder_pending
+
+
+DEFAULT_SENDER = 'todo.reminders.ConsoleSender'
+DEFAULT_BATCH_SIZE = 500
+
+REMINDER_DUE_SOON = 'due_soon'
+REMINDER_OVERDUE = 'overdue'
+
+# リマインダーの種類と、期限の何時間前にしきい値を越えるか。
+# :func:`run_tick` はこの順に送信する（期限切れを送ったTodoには期限間近を送らない）
+THRESHOLDS = {
+    REMINDER_OVERDUE: timedelta(0),
+    REMINDER_DUE_SOON: DUE_SOON_WINDOW,
+}
+
+# リマインダーの種類と、送信時点の期限を記録するTodoのフィールド
+SENT_FIELDS = {
+    REMINDER_OVERDUE: 'overdue_reminded_for',
+    REMINDER_DUE_SOON: 'due_soon_reminded_for',
+}
+
+
+@dataclass(frozen=True)
+class Reminder:
+    """1件のリマインダー。
+
+    Attributes:
+        kind: リマインダーの種類（'due_soon' または 'overdue'）。
+        todo_id: 対象のTodoのID。
+        user_id: Todoを所有するユーザーのID。
+        username: Todoを所有するユーザーのユーザー名。
+        email: Todoを所有するユーザーのメールアドレス（未登録なら空）。
+        title: Todoのタイトル。
+        due_date: Todoの期限日時。
+    """
+
+    kind: str
+    todo_id: int
+    user_id: int
+    username: str
+    email: str
+    title: str
+    due_date: datetime
+
+    @classmethod
+    def for_todo(cls, kind: str, todo: Todo) -> Reminder:
+        """Todo（``user`` を読み込み済み）からリマインダーを作成する。"""
+        return cls(kind, todo.pk, todo.user_id, todo.user.username, todo.user.email, todo.title, todo.due_date)
+
+    def as_dict(self) -> dict[str, Any]:
+        """JSONに変換可能な辞書を返す。"""
+        return dict(asdict(self), due_date=self.due_date.isoformat())
+
+
+class BaseSender:
+    """リマインダーの送信先のインターフェース。"""
+
+    def send_messages(self, reminders: list[Reminder]) -> None:
+        """リマインダーをまとめて送信する。
+
+        データベースのトランザクションの外で呼び出されます。例外を送出した場合、
+        そのバッチのTodoの送信済みの記録は取り消され、次回の実行で同じバッチを再送します。
+
+        Args:
+            reminders: 送信するリマインダー（1件以上）。
+        """
+        raise NotImplementedError
+
+
+class ConsoleSender(BaseSender):
+    """リマインダーを1件1行で標準出力に書き出す送信先（開発用）。"""
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def send_messages(self, reminders: list[Reminder]) -> None:
+        lines = [
+            f'[{reminder.kind}] {reminder.username}: {reminder.title}（期限: {reminder.due_date.isoformat()}）\n'
+            for reminder in reminders
+        ]
+        with self._lock:
+            self.stream.writelines(lines)
+            self.stream.flush()
+
+
+class FileSender(BaseSender):
+    """リマインダーを ``TODO_REMINDER_FILE_PATH`` にNDJSONで追記する送信先。"""
+
+    def send_messages(self, reminders: list[Reminder]) -> None:
+        with open(settings.TODO_REMINDER_FILE_PATH, 'a', encoding='utf-8') as stream:
+            for reminder in reminders:
+                stream.write(json.dumps(reminder.as_dict(), ensure_ascii=False) + '\n')
+
+
+# MemorySenderで送信したリマインダー（テスト用）
+outbox: list[Reminder] = []
+
+
+class MemorySender(BaseSender):
+    """リマインダーを :data:`outbox` に追加する送信先（テスト用）。"""
+
+    def send_messages(self, reminders: list[Reminder]) -> None:
+        outbox.extend(reminders)
+
+
+_sender_lock = threading.Lock()
+_sender: Optional[tuple[str, BaseSender]] = None
+
+
+def get_sender() -> BaseSender:
+    """``settings.TODO_REMINDER_SENDER`` で指定した送信先を返す。
+
+    インスタンスはプロセス内で共有し、設定が変わった場合だけ作り直します。
+
+    Returns:
+        送信先。
+    """
+    global _sender
+    path = getattr(settings, 'TODO_REMINDER_SENDER', DEFAULT_SENDER)
+    with _sender_lock:
+        if _sender is None or _sender[0] != path:
+            _sender = (path, import_string(path)())
+        return _sender[1]
+
+
+def _pending(kind: str, until: datetime) -> QuerySet:
+    """しきい値を過ぎて ``kind`` のリマインダーを送っていない未完了Todoのクエリセットを返す。"""
+    # 部分インデックスの条件と一致させるため、同じ条件をそのまま使う
+    return (
+        Todo.objects
+        .filter(_reminder_pending(SENT_FIELDS[kind]), due_date__lte=until)
+        .select_related('user')
+        .order_by('due_date', 'id')
+    )
+
+
+def _release(claimed: dict[str, set[int]]) -> None:
+    """送信できなかったバッチの記録を取り消し、次回の実行で再送させる。
+
+    記録した後に期限を変更したTodoは、記録がすでに期限と一致しないため変更しません。
+    """
+    for field, todo_ids in claimed.items():
+        if todo_ids:
+            Todo.objects.filter(pk__in=todo_ids, **{field: F('due_date')}).update(**{field: None})
+
+
+def send_reminders(kind: str, now: Optional[datetime] = None, batch_size: Optional[int] = None,
+                   sender: Optional[BaseSender] = None) -> int:
+    """1種類のリマインダーを、しきい値を過ぎた未送信のTodoにバッチで送信する。
+
+    バッチごとに、Todoの行をロックして送信時点の期限を記録する短いトランザクションを
+    コミットしてから送信します。メールやプッシュ通知の送信に時間がかかっても、
+    ユーザーの編集や完了切り替えを待たせません。ほかのスケジューラーがロックしている
+    行は読み飛ばすため、同時に動いても同じTodoに重ねて送りません。
+
+    送信先が例外を送出した場合は記録を取り消し、次回の実行で再送します。
+    記録のコミットから送信までの間にプロセスが終了した場合、そのバッチは
+    送信されません（重複よりも取りこぼしを許容する、最大1回の送信）。
+    期限切れを送ったTodoは、しきい値の大きい種類（期限間近）も送信済みとして記録します。
+
+    Args:
+        kind: リマインダーの種類。
+        now: 基準時刻。省略時は現在時刻。
+        batch_size: 1回に送信する件数。省略時は ``TODO_REMINDER_BATCH_SIZE``。
+        sender: 送信先。省略時は :func:`get_sender`。
+
+    Returns:
+        送信したリマインダーの件数。
+    """
+    if now is None:
+        now = timezone.now()
+    if batch_size is None:
+        batch_size = getattr(settings, 'TODO_REMINDER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    if sender is None:
+        sender = get_sender()
+    until = now + THRESHOLDS[kind]
+    fields = [SENT_FIELDS[other] for other, threshold in THRESHOLDS.items() if threshold >= THRESHOLDS[kind]]
+    sent = 0
+    while True:
+        with transaction.atomic():
+            todos = list(
+                _pending(kind, until).select_for_update(skip_locked=True, of=('self',))[:batch_size]
+            )
+            if not todos:
+                return sent
+            # 取り消すときに元から送信済みだった種類の記録を消さないよう、このバッチで記録したものを覚えておく
+            claimed = {
+                field: {todo.pk for todo in todos if getattr(todo, field) != todo.due_date} for field in fields
+            }
+            # 行をロックしているため、読み込んだ時点から期限は変わっていない
+            Todo.objects.filter(pk__in=[todo.pk for todo in todos]).update(
+                **{field: F('due_date') for field in fields}
+            )
+        try:
+            sender.send_messages([Reminder.for_todo(kind, todo) for todo in todos])
+        except Exception:
+            _release(claimed)
+            raise
+        sent += len(todos)
+        if len(todos) < batch_size:
+            return sent
+
+
+def run_tick(now: Optional[datetime] = None, batch_size: Optional[int] = None,
+             sender: Optional[BaseSender] = None) -> dict[str, int]:
+    """すべての種類のリマインダーを送信する（スケジューラーの1回分）。
+
+    Args:
+        now: 基準時刻。省略時は現在時刻。
+        batch_size: 1回に送信する件数。省略時は ``TODO_REMINDER_BATCH_SIZE``。
+        sender: 送信先。省略時は :func:`get_sender`。
+
+    Returns:
+        種類ごとの送信した件数。
+    """
+    if now is None:
+        now = timezone.now()
+    return {kind: send_reminders(kind, now, batch_size, sender) for kind in THRESHOLDS}
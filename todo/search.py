@@ -0,0 +1,245 @@
+"""Todoの全文検索。
+
+このモジュールはTodoのタイトルと詳細を対象とした全文検索を提供します。
+
+- PostgreSQL: ``SearchVector`` の式インデックス（GIN）と ``SearchRank`` を使用します。
+- SQLite: FTS5仮想テーブル ``todo_todo_fts`` を使用し、``bm25`` で順位付けします。
+  仮想テーブルは ``todos_changed`` シグナルで ``todo_todo`` と同期されます。
+  所有ユーザーは索引付きの ``owner`` 列にトークン（:func:`owner_token`）として
+  登録し、MATCH式の条件に含めるため、検索はそのユーザーの文書だけを辿ります。
+- その他のデータベース、またはFTS5で扱えない短い語では ``icontains`` に
+  フォールバックします（作成日時の新しい順）。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Todo
+from .pagination import DEFAULT_PAGE_SIZE
+
+
+# PostgreSQLのテキスト検索設定。マイグレーション0004の式インデックスと一致させること。
+SEARCH_CONFIG = 'simple'
+FTS_TABLE = 'todo_todo_fts'
+# trigramトークナイザは3文字未満の語に一致しない
+MIN_TRIGRAM_TERM_LENGTH = 3
+# FTS5テーブルを同期する際に1文で扱うIDの数
+SYNC_CHUNK_SIZE = 500
+# 所有ユーザーのトークンは補助私用面（U+F0000〜）の文字の3桁でユーザーIDを表す。
+# 検索語と衝突せず、trigram・unicode61のどちらのトークナイザでも1つのトークンになる。
+# マイグレーション0010と一致させること
+OWNER_TOKEN_BASE = 0xF0000
+OWNER_TOKEN_RADIX = 0xFFFE
+OWNER_TOKEN_DIGITS = 3
+
+
+@dataclass
+class SearchPage:
+    """検索結果の1ページ。
+
+    Attributes:
+        object_list: 関連度の高い順に並んだTodoのリスト。
+        number: ページ番号（1始まり）。
+        has_next: 次のページが存在するかどうか。
+    """
+
+    object_list: list[Todo] = field(default_factory=list)
+    number: int = 1
+    has_next: bool = False
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    @property
+    def has_previous(self) -> bool:
+        """前のページが存在するかどうか。"""
+        return self.number > 1
+
+
+def _terms(query: str) -> list[str]:
+    return [term for term in query.split() if term]
+
+
+def _fts_available() -> bool:
+    """SQLiteのFTS5テーブルが利用できるかどうかを返す（存在する場合は接続ごとに記憶する）。"""
+    if connection.vendor != 'sqlite':
+        return False
+    if getattr(connection, '_todo_fts_available', False):
+        return True
+    available = FTS_TABLE in connection.introspection.table_names()
+    if available:
+        connection._todo_fts_available = True
+    return available
+
+
+def owner_token(user_id: int) -> str:
+    """FTS5テーブルの ``owner`` 列に登録する所有ユーザーのトークンを返す。
+
+    Args:
+        user_id: ユーザーのID。
+
+    Returns:
+        私用領域の文字3つからなるトークン。
+    """
+    digits = []
+    for _ in range(OWNER_TOKEN_DIGITS):
+        user_id, digit = divmod(user_id, OWNER_TOKEN_RADIX)
+        digits.append(chr(OWNER_TOKEN_BASE + digit))
+    return ''.join(reversed(digits))
+
+
+def _owner_token_sql(column: str) -> str:
+    """:func:`owner_token` と同じ値を求めるSQLiteの式を返す。
+
+    パラメーター付きのクエリに埋め込むため、剰余演算子は ``%%`` とエスケープします。
+    """
+    digits = [
+        f'{OWNER_TOKEN_BASE} + ({column} / {OWNER_TOKEN_RADIX ** place}) %% {OWNER_TOKEN_RADIX}'
+        for place in reversed(range(OWNER_TOKEN_DIGITS))
+    ]
+    return f'char({", ".join(digits)})'
+
+
+def _chunks(todo_ids: list[int]) -> Iterable[list[int]]:
+    for start in range(0, len(todo_ids), SYNC_CHUNK_SIZE):
+        yield todo_ids[start:start + SYNC_CHUNK_SIZE]
+
+
+def _fts_match_expression(user_id: int, terms: list[str]) -> str:
+    """所有ユーザーと検索語をFTS5のMATCH式に変換する。
+
+    所有ユーザーのトークンと、タイトル・詳細に対する各語をフレーズとした
+    AND検索を組み合わせます。
+    """
+    phrases = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    return f'owner : "{owner_token(user_id)}" AND {{title description}} : ({phrases})'
+
+
+def _search_fts(user_id: int, terms: list[str], limit: int, offset: int) -> list[tuple[int, float]]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            'ORDER BY rank LIMIT %s OFFSET %s',
+            [_fts_match_expression(user_id, terms), limit, offset],
+        )
+        # bm25は関連度が高いほど小さい（負の）値になるため符号を反転する
+        return [(pk, -rank) for pk, rank in cursor.fetchall()]
+
+
+def _search_postgres(user_id: int, query: str, limit: int, offset: int) -> list[tuple[int, float]]:
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    vector = SearchVector('title', 'description', config=SEARCH_CONFIG)
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    rows = (
+        Todo.objects.filter(user_id=user_id)
+        .annotate(search=vector)
+        .filter(search=search_query)
+        .annotate(rank=SearchRank(vector, search_query))
+        .order_by('-rank', '-id')
+        .values_list('pk', 'rank')[offset:offset + limit]
+    )
+    return list(rows)
+
+
+def _search_fallback(user_id: int, terms: list[str], limit: int, offset: int) -> list[tuple[int, float]]:
+    queryset = Todo.objects.filter(user_id=user_id)
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    rows = queryset.order_by('-created_at', '-id').values_list('pk', flat=True)[offset:offset + limit]
+    return [(pk, 0.0) for pk in rows]
+
+
+def parse_page_number(value: Optional[str]) -> int:
+    """クエリパラメータのページ番号を解釈する（不正な値は1ページ目とする）。"""
+    try:
+        return max(1, int(value or 1))
+    except ValueError:
+        return 1
+
+
+def search_todos(user_id: int, query: str, page: int = 1, page_size: Optional[int] = None) -> SearchPage:
+    """ユーザーのTodoをタイトルと詳細で全文検索する。
+
+    Args:
+        user_id: 検索するユーザーのID。
+        query: 検索語（空白区切りの語はすべてを含むものに一致します）。
+        page: ページ番号（1始まり）。
+        page_size: 1ページあたりの件数。省略時は一覧と同じ件数。
+
+    Returns:
+        関連度順の検索結果。各Todoには ``rank`` 属性と
+        期限ステータスのアノテーションが付与されます。
+    """
+    page_size = page_size or getattr(settings, 'TODO_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    page = max(1, page)
+    terms = _terms(query)
+    if not terms:
+        return SearchPage(number=page)
+
+    limit, offset = page_size + 1, (page - 1) * page_size
+    if connection.vendor == 'postgresql':
+        ranked = _search_postgres(user_id, query, limit, offset)
+    elif _fts_available() and all(len(term) >= MIN_TRIGRAM_TERM_LENGTH for term in terms):
+        ranked = _search_fts(user_id, terms, limit, offset)
+    else:
+        ranked = _search_fallback(user_id, terms, limit, offset)
+
+    has_next = len(ranked) > page_size
+    ranked = ranked[:page_size]
+    todos = Todo.objects.filter(user_id=user_id).with_due_status().in_bulk([pk for pk, _ in ranked])
+    results = []
+    for pk, rank in ranked:
+        todo = todos.get(pk)
+        if todo is not None:
+            todo.rank = rank
+            results.append(todo)
+    return SearchPage(object_list=results, number=page, has_next=has_next)
+
+
+def update_index(todo_ids: Iterable[int]) -> None:
+    """SQLiteのFTS5テーブルに指定したTodoの最新の内容を反映する。
+
+    FTS5テーブルが存在しない場合は何もしません。
+
+    Args:
+        todo_ids: 反映するTodoのID。
+    """
+    todo_ids = list(todo_ids)
+    if not todo_ids or not _fts_available():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(todo_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, owner) '
+                f'SELECT id, title, description, {_owner_token_sql("user_id")} '
+                f'FROM todo_todo WHERE id IN ({placeholders})',
+                chunk,
+            )
+
+
+def remove_from_index(todo_ids: Iterable[int]) -> None:
+    """SQLiteのFTS5テーブルから指定したTodoを削除する。
+
+    Args:
+        todo_ids: 削除するTodoのID。
+    """
+    todo_ids = list(todo_ids)
+    if not todo_ids or not _fts_available():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(todo_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
@@ -0,0 +1,183 @@
+"""キャッシュを優先し、データベースへは遅延して書き込むセッションエンジン。
+
+``SESSION_ENGINE = 'todo.sessions'`` で使用します（``TODO_SESSION_MODE=write_behind``）。
+読み込みは ``cached_db`` と同じくキャッシュを優先し、見つからない場合だけ
+データベースを参照します。保存はキャッシュにだけ同期的に書き込み、
+データベースへの書き込みはプロセスごとのバッファにためて、件数か経過時間が
+しきい値に達したリクエストの終了時（およびプロセスの終了時）にまとめて行います。
+
+- ``TODO_SESSION_WRITE_BEHIND_DELAY``: 書き込みを保留する最大秒数。
+- ``TODO_SESSION_WRITE_BEHIND_BATCH``: この件数がたまったらすぐに書き込む。
+
+ログアウトなどで削除したセッションは、キャッシュに削除済みの印を残し、
+他のプロセスのバッファにある古い書き込みでデータベースに復活しないようにします。
+キャッシュ（``SESSION_CACHE_ALIAS``）は複数プロセスで運用する場合、
+プロセス間で共有されるバックエンドを指定してください。プロセスが異常終了した
+場合は保留中の書き込みが失われますが、セッションはキャッシュに残ります。
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from typing import Any
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.base_session import AbstractBaseSession
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DELETED_KEY_PREFIX = 'todo.sessions.deleted'
+
+
+class WriteBehindBuffer:
+    """データベースへの書き込みを保留するセッションのバッファ（プロセスごと）。
+
+    同じセッションへの書き込みは最後の1件だけを保持し、
+    :meth:`flush` で1回の一括UPSERTとして書き込みます。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._pending: dict[str, AbstractBaseSession] = {}
+        self._since: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, instance: AbstractBaseSession) -> None:
+        """セッションの書き込みを保留し、しきい値に達していれば書き込む。"""
+        with self._lock:
+            self._pending[instance.session_key] = instance
+            if self._since is None:
+                self._since = time.monotonic()
+        if len(self._pending) >= settings.TODO_SESSION_WRITE_BEHIND_BATCH:
+            self.flush()
+
+    def get(self, session_key: str) -> AbstractBaseSession | None:
+        """保留中のセッションを返す（なければ ``None``）。"""
+        with self._lock:
+            return self._pending.get(session_key)
+
+    def discard(self, session_key: str) -> None:
+        """保留中のセッションの書き込みを取り消す。"""
+        with self._lock:
+            self._pending.pop(session_key, None)
+
+    def is_due(self) -> bool:
+        """保留を始めてから ``TODO_SESSION_WRITE_BEHIND_DELAY`` 秒を過ぎたか。"""
+        since = self._since
+        return since is not None and time.monotonic() - since >= settings.TODO_SESSION_WRITE_BEHIND_DELAY
+
+    def flush(self) -> int:
+        """保留中の書き込みをまとめてデータベースに書き込む。
+
+        削除済みの印があるセッションは書き込みません。書き込みに失敗した場合は、
+        その後に保留された新しい書き込みを優先して保留に戻します。
+
+        Returns:
+            書き込んだセッションの件数。
+        """
+        with self._lock:
+            pending, self._pending, self._since = self._pending, {}, None
+            if not pending:
+                return 0
+            deleted = _cache().get_many([_deleted_key(key) for key in pending])
+            instances = [instance for key, instance in pending.items() if _deleted_key(key) not in deleted]
+            if not instances:
+                return 0
+            model = type(instances[0])
+            try:
+                model.objects.bulk_create(
+                    instances,
+                    update_conflicts=True,
+                    unique_fields=['session_key'],
+                    update_fields=['session_data', 'expire_date'],
+                )
+            except DatabaseError:
+                logger.warning('セッション%d件をデータベースに書き込めませんでした', len(instances), exc_info=True)
+                self._pending = {**pending, **self._pending}
+                self._since = time.monotonic()
+                return 0
+            return len(instances)
+
+
+write_behind = WriteBehindBuffer()
+atexit.register(write_behind.flush)
+
+
+def _cache() -> Any:
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _deleted_key(session_key: str) -> str:
+    return f'{DELETED_KEY_PREFIX}:{session_key}'
+
+
+@receiver(request_finished, dispatch_uid='todo_flush_sessions')
+def flush_sessions(**kwargs: Any) -> None:
+    """リクエストの終了時に、保留が長くなったセッションを書き込む。"""
+    if write_behind.is_due():
+        write_behind.flush()
+
+
+class SessionStore(CachedDBStore):
+    """キャッシュに同期的に、データベースに遅延して書き込むセッションストア。"""
+
+    def _get_session_from_db(self) -> AbstractBaseSession | None:
+        pending = write_behind.get(self.session_key)
+        if pending is not None:
+            return pending if pending.expire_date > timezone.now() else None
+        if self._cache.get(_deleted_key(self.session_key)) is not None:
+            return None
+        return super()._get_session_from_db()
+
+    async def _aget_session_from_db(self) -> AbstractBaseSession | None:
+        return await sync_to_async(self._get_session_from_db)()
+
+    def save(self, must_create: bool = False) -> None:
+        """セッションをキャッシュに保存し、データベースへの書き込みを保留する。
+
+        Args:
+            must_create: 新しいセッションとして保存する場合は ``True``。
+
+        Raises:
+            CreateError: ``must_create`` で、同じキーのセッションが既にある場合。
+        """
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        timeout = self.get_expiry_age()
+        if must_create:
+            if not self._cache.add(self.cache_key, data, timeout):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, timeout)
+        write_behind.add(self.create_model_instance(data))
+
+    async def asave(self, must_create: bool = False) -> None:
+        await sync_to_async(self.save)(must_create)
+
+    def delete(self, session_key: str | None = None) -> None:
+        """セッションを削除し、保留中の書き込みを取り消す。"""
+        session_key = session_key or self.session_key
+        if session_key is None:
+            return
+        self._cache.set(_deleted_key(session_key), True, settings.SESSION_COOKIE_AGE)
+        write_behind.discard(session_key)
+        super().delete(session_key)
+
+    async def adelete(self, session_key: str | None = None) -> None:
+        await sync_to_async(self.delete)(session_key)
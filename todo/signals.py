@@ -0,0 +1,153 @@
+"""Todoアプリケーションのシグナル定義とシグナルハンドラ。
+
+Todoの変更は ``todos_changed`` シグナルに集約されます。モデルの
+保存・削除（``post_save``/``post_delete``）はこのシグナルに変換され、
+``save()`` を経由しない一括更新は ``todos_changed`` を直接送信します。
+キャッシュの無効化や全文検索テーブルの同期、差分同期用の変更履歴の記録、
+ユーザーごとの件数の集計、ライブ更新イベントの配信など、
+変更に追従する処理は ``todos_changed`` を受信します。
+"""
+
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import search, stats, sync
+from .broker import get_broker
+from .cache import bump_list_version, mark_deleted
+from .models import Todo
+
+
+# Todoが変更されたことを通知するシグナル。
+# 引数: user_id（所有ユーザーID）, todo_ids（変更されたTodoのIDのリスト）,
+#       action（'created'、'updated'、'toggled'、'deleted' のいずれか）
+todos_changed = Signal()
+
+ACTION_CREATED = 'created'
+ACTION_UPDATED = 'updated'
+ACTION_TOGGLED = 'toggled'
+ACTION_DELETED = 'deleted'
+
+_coalescing = threading.local()
+
+
+def send_todos_changed(user_id: int, todo_ids: Iterable[int], action: str) -> None:
+    """``todos_changed`` シグナルを送信する。
+
+    ``save()``/``delete()`` を経由しない一括更新の後に呼び出します。
+    :func:`coalesce_todos_changed` の中で呼び出された場合は送信を保留し、
+    ブロックの終了時にユーザーと変更の種類ごとにまとめて送信します。
+
+    Args:
+        user_id: 変更されたTodoの所有ユーザーID。
+        todo_ids: 変更されたTodoのID。
+        action: 変更の種類。
+    """
+    pending = getattr(_coalescing, 'pending', None)
+    if pending is not None:
+        pending.setdefault((user_id, action), []).extend(todo_ids)
+        return
+    todos_changed.send(sender=Todo, user_id=user_id, todo_ids=list(todo_ids), action=action)
+
+
+@contextmanager
+def coalesce_todos_changed() -> Iterator[None]:
+    """ブロック内の ``todos_changed`` をまとめて1回ずつ送信するコンテキストマネージャ。
+
+    一括削除やインポートのように1行ごとにシグナルが発生する処理を囲み、
+    キャッシュの無効化などの副作用をバッチごとに1回で済ませます。
+    ブロックが例外で終了した場合、保留中の通知は破棄されます。
+    入れ子になった場合は最も外側のブロックの終了時に送信します。
+
+    Yields:
+        None
+    """
+    if getattr(_coalescing, 'pending', None) is not None:
+        yield
+        return
+    _coalescing.pending = {}
+    try:
+        yield
+        pending = _coalescing.pending
+    finally:
+        _coalescing.pending = None
+    for (user_id, action), todo_ids in pending.items():
+        todos_changed.send(sender=Todo, user_id=user_id, todo_ids=todo_ids, action=action)
+
+
+@receiver(post_save, sender=Todo, dispatch_uid='todo_forward_post_save')
+def forward_post_save(sender: type[Todo], instance: Todo, created: bool, **kwargs: Any) -> None:
+    """Todoの保存を ``todos_changed`` として送信する。"""
+    send_todos_changed(instance.user_id, [instance.pk], ACTION_CREATED if created else ACTION_UPDATED)
+
+
+@receiver(post_delete, sender=Todo, dispatch_uid='todo_forward_post_delete')
+def forward_post_delete(sender: type[Todo], instance: Todo, **kwargs: Any) -> None:
+    """Todoの削除を ``todos_changed`` として送信する。"""
+    send_todos_changed(instance.user_id, [instance.pk], ACTION_DELETED)
+
+
+@receiver(todos_changed, dispatch_uid='todo_invalidate_list_cache')
+def invalidate_list_cache(sender: type[Todo], user_id: int, action: str, **kwargs: Any) -> None:
+    """所有ユーザーの一覧キャッシュを無効化し、削除時は削除時刻を記録する。
+
+    コミット前に無効化すると、並行するリクエストが新しいバージョンの下に
+    コミット前の一覧を描画してキャッシュしてしまうため、コミット後に無効化します。
+    """
+    def invalidate() -> None:
+        bump_list_version(user_id)
+        if action == ACTION_DELETED:
+            mark_deleted(user_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(todos_changed, dispatch_uid='todo_sync_search_index')
+def sync_search_index(sender: type[Todo], todo_ids: list[int], action: str, **kwargs: Any) -> None:
+    """SQLiteの全文検索テーブルをTodoの変更に追従させる。
+
+    完了状態の切り替えは検索対象の文字列を変えないため無視します。
+    """
+    if action == ACTION_DELETED:
+        search.remove_from_index(todo_ids)
+    elif action in (ACTION_CREATED, ACTION_UPDATED):
+        search.update_index(todo_ids)
+
+
+@receiver(todos_changed, dispatch_uid='todo_record_sync_changes')
+def record_sync_changes(sender: type[Todo], user_id: int, todo_ids: list[int], **kwargs: Any) -> None:
+    """差分同期用の変更履歴を記録する。
+
+    変更と同じトランザクションで記録するため、ロールバックされた変更は残りません。
+    """
+    sync.record_changes(user_id, todo_ids)
+
+
+@receiver(todos_changed, dispatch_uid='todo_refresh_stats')
+def refresh_stats(sender: type[Todo], user_id: int, action: str, **kwargs: Any) -> None:
+    """ユーザーごとの件数の集計を再集計する。
+
+    削除は古いものとして印を付けるだけにし、次の読み込みで再集計します
+    （ユーザーの削除に伴う連鎖削除で1件ごとに再集計しないため）。
+    """
+    if action == ACTION_DELETED:
+        stats.invalidate_stats(user_id)
+    else:
+        stats.refresh_stats(user_id)
+
+
+@receiver(todos_changed, dispatch_uid='todo_publish_events')
+def publish_events(sender: type[Todo], user_id: int, todo_ids: list[int], action: str, **kwargs: Any) -> None:
+    """変更イベントをライブ更新の購読者へ配信する。
+
+    購読者は受信後にカードを再取得するため、トランザクションの
+    コミット後に配信します。
+    """
+    event = {'action': action, 'ids': list(todo_ids)}
+    transaction.on_commit(lambda: get_broker().publish(user_id, event))
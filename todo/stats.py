@@ -0,0 +1,192 @@
+"""ユーザーごとのTodoの件数の集計（:class:`~todo.models.TodoStats`）の更新と読み込み。
+
+一覧ページのヘッダーと集計APIは :func:`get_stats` で主キー1回の読み込みだけで
+件数を取得します。Todoが作成・更新・完了切り替えされると ``todos_changed`` の
+受信側が :func:`refresh_stats` を呼び出し、集計と保存を
+``INSERT ... SELECT ... ON CONFLICT DO UPDATE`` の1文で行います。
+集計は ``(user, completed, due_date)`` の複合インデックスだけで完結します。
+PostgreSQLでは集計の前に別の文で集計の行をロックし、同じユーザーの書き込みを
+直列化します（READ COMMITTEDでは各文がその時点でコミット済みの行を見るため、
+ロックを待った後の集計には先に書き込んだトランザクションのTodoも含まれます）。
+
+削除では :func:`invalidate_stats` で集計を古いものとして印を付けるだけにし、
+次に読み込んだときに再集計します（ユーザーの削除に伴う大量の連鎖削除で
+1件ごとに再集計しないため）。
+
+期限切れ・今日期限の件数は時刻の経過で変わるため、:meth:`TodoStats.is_stale`
+が真になった集計は読み込み時に再集計します。``reconcile_todo_stats``
+コマンド（:func:`reconcile_stats`）を定期的に実行すると、読み込みの前に
+再集計しておけるほか、``QuerySet.update()`` のようにシグナルを送らない
+変更によるずれも ``--all`` で修正できます。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Todo, TodoStats, _day_bounds
+
+
+STATS_COLUMNS = ('total', 'open', 'overdue', 'due_today', 'next_due_at', 'computed_at')
+
+
+def _aggregate_sql(user_id: int, now: datetime) -> tuple[str, list]:
+    """1ユーザーのTodoを ``STATS_COLUMNS`` の順に集計するSELECT文を返す。"""
+    opts = Todo._meta
+    qn = connection.ops.quote_name
+    completed = qn(opts.get_field('completed').column)
+    due_date = qn(opts.get_field('due_date').column)
+    user = qn(opts.get_field('user').column)
+    today_start, today_end = _day_bounds(now)
+    # 期限の比較は Todo.with_due_status と同じ（期限切れを優先し、今日期限はその残り）
+    is_open = f'{completed} = %s'
+    sql = (
+        f'SELECT COUNT(*), '
+        f'COUNT(CASE WHEN {is_open} THEN 1 END), '
+        f'COUNT(CASE WHEN {is_open} AND {due_date} < %s THEN 1 END), '
+        f'COUNT(CASE WHEN {is_open} AND {due_date} >= %s AND {due_date} < %s THEN 1 END), '
+        f'MIN(CASE WHEN {is_open} AND {due_date} >= %s THEN {due_date} END), '
+        f'%s '
+        f'FROM {qn(opts.db_table)} WHERE {user} = %s'
+    )
+    prep = opts.get_field('due_date').get_db_prep_value
+    params = [
+        False,
+        False, prep(now, connection),
+        False, prep(max(now, today_start), connection), prep(today_end, connection),
+        False, prep(now, connection),
+        prep(now, connection),
+        user_id,
+    ]
+    return sql, params
+
+
+def _lock_stats_row(user_id: int, now: datetime) -> None:
+    """集計の行をロックする。行がなければ空の集計として作成してロックする。
+
+    ``SELECT ... FOR UPDATE`` は存在しない行をロックできないため、
+    ``ON CONFLICT DO UPDATE`` で既存の行を更新せずにロックする。
+    """
+    opts = TodoStats._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    user = qn(opts.get_field('user').column)
+    computed_at = qn(opts.get_field('computed_at').column)
+    columns = [qn(opts.get_field(name).column) for name in STATS_COLUMNS]
+    sql = (
+        f'INSERT INTO {table} ({user}, {", ".join(columns)}) '
+        f'VALUES (%s, 0, 0, 0, 0, NULL, %s) '
+        f'ON CONFLICT ({user}) DO UPDATE SET {computed_at} = {table}.{computed_at}'
+    )
+    prep = opts.get_field('computed_at').get_db_prep_value
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, prep(now, connection)])
+
+
+def refresh_stats(user_id: int, now: Optional[datetime] = None) -> None:
+    """ユーザーのTodoを集計し、集計の行を作成または更新する。
+
+    SQLiteでは1文で集計して保存します。PostgreSQLでは先に集計の行をロックし、
+    同じユーザーの並行する書き込みが互いの件数を上書きしないようにします。
+
+    Args:
+        user_id: 集計するユーザーのID。
+        now: 集計の基準時刻。省略時は現在時刻。
+    """
+    if now is None:
+        now = timezone.now()
+    if connection.vendor == 'postgresql':
+        # 自動コミットで呼ばれた場合もロックと集計を同じトランザクションにする
+        with transaction.atomic():
+            _lock_stats_row(user_id, now)
+            _upsert_stats(user_id, now)
+        return
+    _upsert_stats(user_id, now)
+
+
+def _upsert_stats(user_id: int, now: datetime) -> None:
+    """ユーザーのTodoを集計し、集計の行を作成または更新する（1文）。"""
+    opts = TodoStats._meta
+    qn = connection.ops.quote_name
+    user = qn(opts.get_field('user').column)
+    columns = [qn(opts.get_field(name).column) for name in STATS_COLUMNS]
+    select, params = _aggregate_sql(user_id, now)
+    sql = (
+        f'INSERT INTO {qn(opts.db_table)} ({user}, {", ".join(columns)}) '
+        f'{select.replace("SELECT ", "SELECT %s, ", 1)} '
+        f'ON CONFLICT ({user}) DO UPDATE SET '
+        + ', '.join(f'{column} = excluded.{column}' for column in columns)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *params])
+
+
+def invalidate_stats(user_id: int, now: Optional[datetime] = None) -> None:
+    """集計を古いものとして印を付け、次の読み込みで再集計させる。
+
+    Args:
+        user_id: 対象のユーザーのID。
+        now: 基準時刻。省略時は現在時刻。
+    """
+    TodoStats.objects.filter(user_id=user_id).update(next_due_at=now or timezone.now())
+
+
+def get_stats(user_id: int, now: Optional[datetime] = None) -> TodoStats:
+    """ユーザーの集計を返す。未作成か古い場合は再集計してから返す。
+
+    Args:
+        user_id: 対象のユーザーのID。
+        now: 基準時刻。省略時は現在時刻。
+
+    Returns:
+        ユーザーの集計。
+    """
+    if now is None:
+        now = timezone.now()
+    stats = TodoStats.objects.filter(user_id=user_id).first()
+    if stats is None or stats.is_stale(now):
+        refresh_stats(user_id, now)
+        stats = TodoStats.objects.get(user_id=user_id)
+    return stats
+
+
+async def aget_stats(user_id: int) -> TodoStats:
+    """:func:`get_stats` の非同期版。"""
+    now = timezone.now()
+    stats = await TodoStats.objects.filter(user_id=user_id).afirst()
+    if stats is None or stats.is_stale(now):
+        await sync_to_async(refresh_stats)(user_id, now)
+        stats = await TodoStats.objects.aget(user_id=user_id)
+    return stats
+
+
+def reconcile_stats(now: Optional[datetime] = None, all_users: bool = False) -> int:
+    """古くなった集計（``all_users`` なら全ユーザーの集計）を再集計する。
+
+    Args:
+        now: 基準時刻。省略時は現在時刻。
+        all_users: Trueの場合は、Todoを持つすべてのユーザーと集計の行がある
+            すべてのユーザーを再集計する。
+
+    Returns:
+        再集計したユーザーの数。
+    """
+    if now is None:
+        now = timezone.now()
+    if all_users:
+        user_ids = set(Todo.objects.values_list('user_id', flat=True).distinct())
+        user_ids.update(TodoStats.objects.values_list('user_id', flat=True))
+    else:
+        today_start, _ = _day_bounds(now)
+        user_ids = set(TodoStats.objects.filter(
+            Q(next_due_at__lte=now) | Q(computed_at__lt=today_start)
+        ).values_list('user_id', flat=True))
+    for user_id in sorted(user_ids):
+        refresh_stats(user_id, now)
+    return len(user_ids)
@@ -0,0 +1,230 @@
+"""オフライン・モバイルクライアント向けの差分同期。
+
+クライアントは前回の同期で受け取ったトークンを送り、それ以降に
+変更されたTodoと削除されたTodoのIDだけを受け取ります。変更の検出には
+``TodoChange`` の単調増加する主キーを使用するため、1回の同期で読む行数は
+Todoの総数ではなく変更の件数に比例します。
+
+トークンには最後に読んだ変更履歴の連番と、その位置の時刻を含め、
+``SECRET_KEY`` で署名します。変更履歴の保持期間
+（``settings.TODO_SYNC_RETENTION_DAYS``）を過ぎたトークンや、署名が
+一致しない不正なトークンを受け取った場合は、全件を返して同期をやり直させます。
+
+連番より前の変更を取りこぼさないよう、ユーザーごとの変更履歴は連番の順に
+コミットされる必要があります。PostgreSQLでは連番の採番とコミットの順序が
+トランザクションごとに前後するため、:func:`record_changes` はユーザーごとの
+アドバイザリロックをトランザクションの終了まで保持して記録を直列化します
+（SQLiteは書き込みをデータベース単位で直列化するため不要です）。
+"""
+
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Todo, TodoChange
+
+
+DEFAULT_SYNC_LIMIT = 500
+DEFAULT_RETENTION_DAYS = 30
+
+TOKEN_SALT = 'todo.sync.token'
+
+# 変更履歴の記録を直列化するアドバイザリロックのキーの1つ目（2つ目はユーザーID）
+CHANGE_LOCK_NAMESPACE = 0x7D0C
+
+
+class InvalidSyncToken(ValueError):
+    """同期トークンを解釈できない場合に送出される例外。"""
+
+
+@dataclass(frozen=True)
+class SyncToken:
+    """クライアントが同期済みの位置を表すトークン。
+
+    Attributes:
+        seq: 同期済みの最後の変更履歴の連番。
+        issued_at: その位置の時刻。保持期間の判定に使用します。
+    """
+
+    seq: int
+    issued_at: datetime
+
+    def encode(self) -> str:
+        """URLに埋め込める不透明な文字列へ変換する。
+
+        クライアントが連番や時刻を書き換えて保持期間の判定を
+        すり抜けられないよう、``SECRET_KEY`` で署名します。
+
+        Returns:
+            URLセーフなBase64文字列（パディングなし）と署名を ``:`` でつないだ文字列。
+        """
+        raw = f'{self.seq}|{self.issued_at.isoformat()}'
+        payload = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+        return signing.Signer(salt=TOKEN_SALT).sign(payload)
+
+    @classmethod
+    def decode(cls, value: str) -> SyncToken:
+        """:meth:`encode` で生成した文字列からトークンを復元する。
+
+        Args:
+            value: トークン文字列。
+
+        Returns:
+            復元したトークン。
+
+        Raises:
+            InvalidSyncToken: 文字列の形式が不正、または署名が一致しない場合。
+        """
+        try:
+            payload = signing.Signer(salt=TOKEN_SALT).unsign(value)
+        except signing.BadSignature as exc:
+            raise InvalidSyncToken(value) from exc
+        try:
+            padded = payload + '=' * (-len(payload) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            seq, issued_at = raw.split('|')
+            token = cls(int(seq), datetime.fromisoformat(issued_at))
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise InvalidSyncToken(value) from exc
+        if timezone.is_naive(token.issued_at):
+            raise InvalidSyncToken(value)
+        return token
+
+
+@dataclass
+class SyncResult:
+    """1回の同期で返す結果。
+
+    Attributes:
+        todos: 作成または変更されたTodo（``with_due_status`` でアノテーション済み）。
+        deleted: 削除されたTodoのID。
+        token: 次回の同期で送るトークン文字列。
+        has_more: 続きの変更が残っているかどうか。Trueの場合はすぐに再同期します。
+        reset: 全件を返したかどうか。Trueの場合、クライアントは手元のTodoを置き換えます。
+    """
+
+    todos: list[Todo] = field(default_factory=list)
+    deleted: list[int] = field(default_factory=list)
+    token: str = ''
+    has_more: bool = False
+    reset: bool = False
+
+
+def get_retention() -> timedelta:
+    """変更履歴の保持期間を返す。"""
+    return timedelta(days=getattr(settings, 'TODO_SYNC_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+
+
+def record_changes(user_id: int, todo_ids: Iterable[int]) -> None:
+    """Todoの変更を変更履歴に記録する。
+
+    PostgreSQLでは、同じユーザーの変更履歴を記録するトランザクションを
+    アドバイザリロックで直列化します。後から採番された連番が先にコミットされ、
+    その連番まで同期したクライアントが前の変更を取りこぼすことを防ぎます。
+    ロックは呼び出し元のトランザクションの終了まで保持されます。
+
+    Args:
+        user_id: 変更されたTodoの所有ユーザーID。
+        todo_ids: 変更されたTodoのID。
+    """
+    changes = [TodoChange(user_id=user_id, todo_id=pk) for pk in dict.fromkeys(todo_ids)]
+    connection = connections[router.db_for_write(TodoChange)]
+    if connection.vendor != 'postgresql':
+        TodoChange.objects.using(connection.alias).bulk_create(changes)
+        return
+    # 自動コミットで呼ばれた場合もロックと記録を同じトランザクションにする
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            # キーは32ビットの整数2つ。ユーザーIDが衝突しても直列化が増えるだけで正しさは変わらない
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s, %s)', [CHANGE_LOCK_NAMESPACE, user_id % 2 ** 31]
+            )
+        TodoChange.objects.using(connection.alias).bulk_create(changes)
+
+
+def _parse_token(value: Optional[str], now: datetime) -> Optional[SyncToken]:
+    """有効なトークンを返す。空・不正・期限切れの場合はNone。"""
+    if not value:
+        return None
+    try:
+        token = SyncToken.decode(value)
+    except InvalidSyncToken:
+        return None
+    if token.issued_at < now - get_retention():
+        return None
+    return token
+
+
+def sync_changes(user_id: int, since: Optional[str], limit: Optional[int] = None) -> SyncResult:
+    """トークン以降に変更されたTodoと削除されたTodoのIDを返す。
+
+    Args:
+        user_id: 同期するユーザーID。
+        since: 前回の同期で受け取ったトークン文字列。初回はNone。
+        limit: 1回で読む変更履歴の最大件数。省略時は
+            ``settings.TODO_SYNC_LIMIT``（未設定なら500件）。
+
+    Returns:
+        同期結果。トークンが空・不正・期限切れの場合は全件を返します。
+    """
+    now = timezone.now()
+    token = _parse_token(since, now)
+    if token is None:
+        return _full_sync(user_id, now)
+
+    if limit is None:
+        limit = getattr(settings, 'TODO_SYNC_LIMIT', DEFAULT_SYNC_LIMIT)
+    rows = list(
+        TodoChange.objects
+        .filter(user_id=user_id, id__gt=token.seq)
+        .order_by('id')
+        .values_list('id', 'todo_id', 'created_at')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return SyncResult(token=SyncToken(token.seq, now).encode())
+
+    changed = list(dict.fromkeys(todo_id for _, todo_id, _ in rows))
+    todos = list(Todo.objects.filter(user_id=user_id, pk__in=changed).with_due_status().order_by('id'))
+    alive = {todo.pk for todo in todos}
+    last_seq, _, last_created_at = rows[-1]
+    # 続きがある場合、次の変更は最後に読んだ変更以降に記録されたもの
+    issued_at = last_created_at if has_more else now
+    return SyncResult(
+        todos=todos,
+        deleted=[pk for pk in changed if pk not in alive],
+        token=SyncToken(last_seq, issued_at).encode(),
+        has_more=has_more,
+    )
+
+
+def _full_sync(user_id: int, now: datetime) -> SyncResult:
+    """ユーザーの全Todoと現在の位置のトークンを返す。"""
+    # 先に位置を読むことで、読み出し中の変更は次回の同期で再送される
+    seq = TodoChange.objects.filter(user_id=user_id).aggregate(seq=Max('id'))['seq'] or 0
+    todos = list(Todo.objects.filter(user_id=user_id).with_due_status().order_by('id'))
+    return SyncResult(todos=todos, token=SyncToken(seq, now).encode(), reset=True)
+
+
+def prune_changes(now: Optional[datetime] = None) -> int:
+    """保持期間を過ぎた変更履歴を削除する。
+
+    Args:
+        now: 判定の基準時刻。省略時は現在時刻。
+
+    Returns:
+        削除した行数。
+    """
+    cutoff = (now or timezone.now()) - get_retention()
+    deleted, _ = TodoChange.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
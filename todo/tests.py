@@ -4,17 +4,63 @@
 ユーザー認証とTodoのCRUD操作のテストを実行します。
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
 from django.test import override_settings
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection, connections
+from django.db.backends.signals import connection_created
 from django.middleware.csrf import get_token
 from django.utils import timezone
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.cache import caches
+from django.contrib.sessions.models import Session
+import csv
+import io
 import json
+import os
+import random
+import tempfile
+import asyncio
+import base64
+import functools
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from unittest import skipUnless
+from unittest.mock import Mock, patch
 from datetime import datetime, timedelta
-from .models import Todo
+from asgiref.sync import sync_to_async
+from todoproject.settings import base as base_settings
+from .auth_backends import user_cache
+from .models import DUE_SOON_WINDOW, Todo, TodoChange, TodoIdempotencyKey, TodoStats
+from .pagination import DIRECTION_NEXT, Cursor, KeysetPaginator
+from . import cache as list_cache
+from .broker import RESET_EVENT, InProcessBroker, PostgresBroker, get_broker
+from .bulk import apply_bulk_action
+from .export import iter_csv
+from .filters import InvalidFilter, parse_filters
+from .forms import TodoForm
+from .importer import import_todos, iter_records
+from . import hashers as password_hashers
+from . import reminders
+from .search import owner_token, search_todos
+from .sessions import write_behind
+from .stats import _lock_stats_row, get_stats, reconcile_stats, refresh_stats
+from .signals import ACTION_CREATED, coalesce_todos_changed, send_todos_changed, todos_changed
+from .sync import SyncToken, prune_changes, sync_changes
+from .urls import async_urlpatterns, common_urlpatterns
+from todoproject import metrics as request_metrics
+from todoproject.metrics import registry as metrics_registry
+from benchmarks import hot_paths
 
 
 class AuthenticationTestCase(TestCase):
@@ -737,3 +783,2642 @@ class TodoUITestCase(TestCase):
         self.assertContains(response, 'flatpickr(')
         self.assertContains(response, 'enableTime: true')
         self.assertContains(response, 'locale: "ja"')
+
+
+@override_settings(TODO_PAGE_SIZE=3)
+class TodoKeysetPaginationTestCase(TestCase):
+    """Todo一覧のキーセットページネーションのテストケース。
+    
+    カーソルによる前後ページの移動と、作成日時が同じ行の扱いをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。
+        
+        作成日時が重複する行を含む7件のTodoを作成します。
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        base = timezone.now() - timedelta(days=1)
+        self.todos = []
+        for i in range(7):
+            todo = Todo.objects.create(title=f'Todo {i}', user=self.user)
+            # 2件ずつ同じ作成日時にしてidでの順序付けを確認する
+            Todo.objects.filter(pk=todo.pk).update(created_at=base + timedelta(minutes=i // 2))
+            self.todos.append(todo)
+        self.expected = list(
+            Todo.objects.filter(user=self.user).order_by('-created_at', '-id')
+        )
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_pages_cover_all_rows_in_order(self):
+        """次ページを辿るとすべての行が重複なく順番に得られることをテスト。"""
+        seen = []
+        cursor = None
+        # カーソルが進まない不具合で無限に辿らないよう、ページ数に上限を設ける
+        for _ in range(len(self.expected) + 1):
+            params = {'cursor': cursor} if cursor else {}
+            response = self.client.get(reverse('todo_list'), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page']
+            seen.extend(page.object_list)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        else:
+            self.fail('最終ページに到達しませんでした')
+        self.assertEqual(seen, self.expected)
+    
+    def test_previous_cursor_returns_previous_page(self):
+        """前ページのカーソルで直前のページに戻れることをテスト。"""
+        first = self.client.get(reverse('todo_list')).context['page']
+        self.assertFalse(first.has_previous)
+        second = self.client.get(reverse('todo_list'), {'cursor': first.next_cursor}).context['page']
+        back = self.client.get(reverse('todo_list'), {'cursor': second.previous_cursor}).context['page']
+        self.assertEqual(back.object_list, first.object_list)
+        self.assertEqual(back.object_list, self.expected[:3])
+    
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """不正なカーソルの場合は先頭ページが表示されることをテスト。"""
+        response = self.client.get(reverse('todo_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'].object_list, self.expected[:3])
+    
+    def test_page_query_count_is_constant(self):
+        """ページの深さに関わらずTodo取得クエリが1回であることをテスト。"""
+        first = self.client.get(reverse('todo_list')).context['page']
+        second = self.client.get(reverse('todo_list'), {'cursor': first.next_cursor}).context['page']
+        paginator = KeysetPaginator(Todo.objects.filter(user=self.user), 3)
+        with self.assertNumQueries(1):
+            paginator.get_page(second.next_cursor)
+
+
+class TodoDueStatusAnnotationTestCase(TestCase):
+    """SQL側の期限ステータスアノテーションのテストケース。
+    
+    ``with_due_status`` の結果がモデルの判定メソッドと一致することをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.now = timezone.now()
+        offsets = [None, timedelta(days=-1), timedelta(minutes=1), timedelta(days=2),
+                   timedelta(days=3), timedelta(days=7)]
+        for i, offset in enumerate(offsets):
+            Todo.objects.create(
+                title=f'Todo {i}',
+                user=self.user,
+                due_date=None if offset is None else self.now + offset
+            )
+    
+    def test_annotation_matches_model_methods(self):
+        """アノテーション値がget_due_statusと一致することをテスト。"""
+        for todo in Todo.objects.filter(user=self.user).with_due_status(self.now):
+            self.assertEqual(todo.due_status, todo.get_due_status(self.now), todo.title)
+    
+    def test_get_due_status_prefers_annotation(self):
+        """アノテーションがある場合はその値を返すことをテスト。"""
+        todo = Todo.objects.filter(user=self.user).with_due_status(self.now).get(title='Todo 1')
+        self.assertEqual(todo.get_due_status(), 'overdue')
+        todo.due_status = 'normal'
+        self.assertEqual(todo.get_due_status(), 'normal')
+    
+    def test_todo_list_renders_with_single_query_for_todos(self):
+        """一覧表示でTodoの取得が1クエリで済むことをテスト。"""
+        self.client.login(username='testuser', password='testpass123')
+        with self.assertNumQueries(5):
+            # セッション, ユーザー, ETag用の集計, Todo一覧, 件数の集計
+            response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '期限切れ')
+        self.assertContains(response, 'badge bg-danger')
+
+
+class TodoQueryPlanTestCase(TestCase):
+    """主要な問い合わせの実行計画のテストケース。
+    
+    一覧や期限での絞り込みがフルスキャンではなく想定した
+    インデックスを使うことを確認し、インデックスの退行を検出します。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        for i in range(20):
+            Todo.objects.create(
+                title=f'Todo {i}',
+                user=self.user,
+                due_date=timezone.now() + timedelta(days=i)
+            )
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _explain(self, sql: str, params=()) -> str:
+        """SQLの実行計画を文字列で返す。"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # 行数が少ないとシーケンシャルスキャンが選ばれるため無効化する
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql, params)
+            elif connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            else:
+                self.skipTest(f'{connection.vendor} is not supported')
+            return '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+    
+    def _assert_uses_index(self, queryset, index_name: str) -> None:
+        """クエリセットが指定したインデックスを使うことを確認する。"""
+        sql, params = queryset.query.sql_with_params()
+        plan = self._explain(sql, params)
+        self.assertIn(index_name, plan)
+    
+    def _view_todo_queries(self, url: str) -> list[str]:
+        """ビューが発行したtodo_todoへのSELECT文を返す。"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries
+                if q['sql'].startswith('SELECT') and '"todo_todo"' in q['sql']]
+    
+    def _assert_no_full_scan(self, sql: str) -> None:
+        """SQLがtodo_todoの全件走査を行わないことを確認する。"""
+        plan = self._explain(sql)
+        self.assertNotIn('SCAN todo_todo', plan)
+        self.assertNotIn('Seq Scan on todo_todo', plan)
+    
+    def test_todo_list_uses_user_created_index(self):
+        """一覧ページのクエリが作成日時インデックスを使うことをテスト。"""
+        queries = self._view_todo_queries(reverse('todo_list'))
+        page_queries = [sql for sql in queries if 'ORDER BY' in sql]
+        self.assertEqual(len(page_queries), 1)
+        self.assertIn('todo_user_created_idx', self._explain(page_queries[0]))
+        for sql in queries:
+            self._assert_no_full_scan(sql)
+    
+    def test_todo_list_cursor_page_uses_user_created_index(self):
+        """カーソル指定ページのクエリも作成日時インデックスを使うことをテスト。"""
+        with override_settings(TODO_PAGE_SIZE=5):
+            page = self.client.get(reverse('todo_list')).context['page']
+            queries = self._view_todo_queries(f"{reverse('todo_list')}?cursor={page.next_cursor}")
+        page_queries = [sql for sql in queries if 'ORDER BY' in sql]
+        self.assertEqual(len(page_queries), 1)
+        self.assertIn('todo_user_created_idx', self._explain(page_queries[0]))
+    
+    def test_api_list_avoids_full_scan(self):
+        """JSON一覧APIのクエリが全件走査を行わないことをテスト。"""
+        queries = self._view_todo_queries(reverse('api_todo_list'))
+        self.assertTrue(queries)
+        for sql in queries:
+            self._assert_no_full_scan(sql)
+    
+    def test_open_due_filter_uses_user_completed_due_index(self):
+        """ユーザー別の未完了・期限絞り込みが複合インデックスを使うことをテスト。"""
+        queryset = Todo.objects.filter(
+            user=self.user, due_date__lt=timezone.now() + timedelta(days=3)
+        ).filter_completed(False).order_by('due_date')
+        self._assert_uses_index(queryset, 'todo_user_open_due_idx')
+    
+    def test_open_due_window_uses_partial_index(self):
+        """全ユーザー横断の期限ウィンドウ検索が部分インデックスを使うことをテスト。"""
+        now = timezone.now()
+        queryset = Todo.objects.filter(
+            completed=False, due_date__isnull=False,
+            due_date__gt=now, due_date__lte=now + timedelta(days=1)
+        ).order_by('due_date')
+        self._assert_uses_index(queryset, 'todo_open_due_date_idx')
+    
+    def test_due_status_filters_avoid_full_scan(self):
+        """期限ステータスで絞り込んだ一覧のクエリが全件走査を行わないことをテスト。"""
+        for status in ('overdue', 'due_today', 'due_soon', 'normal', 'no_due_date'):
+            for params in (f'due={status}', f'due={status}&completed=false', f'due={status}&sort=due'):
+                with self.subTest(params=params):
+                    queries = self._view_todo_queries(f"{reverse('todo_list')}?{params}")
+                    self.assertTrue(queries)
+                    for sql in queries:
+                        self._assert_no_full_scan(sql)
+    
+    def test_open_due_status_filter_uses_user_completed_due_index(self):
+        """未完了の期限間近の絞り込みが複合インデックスを使うことをテスト。"""
+        queries = self._view_todo_queries(f"{reverse('todo_list')}?due=due_soon&completed=false&sort=due")
+        page_queries = [sql for sql in queries if 'ORDER BY' in sql]
+        self.assertTrue(page_queries)
+        for sql in page_queries:
+            self.assertIn('todo_user_open_due_idx', self._explain(sql))
+
+
+LIST_CACHE_SETTINGS = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'todo_list': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'todo-list-tests',
+        'OPTIONS': {'MAX_ENTRIES': 100},
+    },
+}
+
+
+@override_settings(CACHES=LIST_CACHE_SETTINGS)
+class TodoListCacheTestCase(TestCase):
+    """ユーザー別一覧キャッシュのテストケース。
+    
+    再読み込み時のキャッシュヒットと、保存・削除シグナルによる無効化をテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        list_cache.get_cache().clear()
+        list_cache.stats.reset()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='キャッシュTodo', user=self.user)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_reload_is_served_from_cache(self):
+        """変更がなければ2回目の表示でTodoを問い合わせないことをテスト。"""
+        self.client.get(reverse('todo_list'))
+        with self.assertNumQueries(3):
+            # セッション, ユーザー, 集計の読み込みのみ
+            response = self.client.get(reverse('todo_list'))
+        self.assertContains(response, 'キャッシュTodo')
+        snapshot = list_cache.stats.snapshot()
+        # 集計結果とフラグメントの2つ
+        self.assertEqual(snapshot['hits'], 2)
+        self.assertEqual(snapshot['misses'], 2)
+    
+    def test_save_invalidates_cache(self):
+        """Todoの保存で一覧キャッシュが無効化されることをテスト。"""
+        self.client.get(reverse('todo_list'))
+        self.todo.title = '更新後Todo'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.todo.save()
+        response = self.client.get(reverse('todo_list'))
+        self.assertContains(response, '更新後Todo')
+        self.assertNotContains(response, 'キャッシュTodo')
+    
+    def test_delete_invalidates_cache(self):
+        """Todoの削除で一覧キャッシュが無効化されることをテスト。"""
+        self.client.get(reverse('todo_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.todo.delete()
+        response = self.client.get(reverse('todo_list'))
+        self.assertContains(response, 'まだTodoがありません')
+    
+    def test_invalidated_after_commit(self):
+        """一覧キャッシュの無効化がコミットまで遅延されることをテスト。"""
+        before = list_cache.get_list_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.todo.title = '更新後Todo'
+            self.todo.save()
+            self.assertEqual(list_cache.get_list_version(self.user.pk), before)
+        self.assertNotEqual(list_cache.get_list_version(self.user.pk), before)
+    
+    def test_cache_is_per_user(self):
+        """他のユーザーのキャッシュが表示されないことをテスト。"""
+        self.client.get(reverse('todo_list'))
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        response = self.client.get(reverse('todo_list'))
+        self.assertNotContains(response, 'キャッシュTodo')
+    
+    def test_version_survives_eviction_without_reuse(self):
+        """バージョン番号が失われても古いフラグメントを再利用しないことをテスト。"""
+        before = list_cache.get_list_version(self.user.pk)
+        list_cache.get_cache().delete(f'todo:list:version:{self.user.pk}')
+        self.assertNotEqual(list_cache.get_list_version(self.user.pk), before)
+
+
+class TodoConditionalGetTestCase(TestCase):
+    """一覧ページとJSON一覧APIの条件付きGETのテストケース。
+    
+    ETag・Last-Modifiedが一致した場合に304を返し、
+    Todoの変更後は200を返すことをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='条件付きGET', user=self.user)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_todo_list_returns_304_for_matching_etag(self):
+        """一致するETagで一覧ページが304になり描画されないことをテスト。"""
+        response = self.client.get(reverse('todo_list'))
+        etag = response['ETag']
+        with self.assertTemplateNotUsed('todo/todo_list.html'):
+            response = self.client.get(reverse('todo_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+    
+    def test_api_returns_304_for_matching_etag(self):
+        """一致するETagでJSON一覧APIが304になることをテスト。"""
+        response = self.client.get(reverse('api_todo_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['todos'][0]['title'], '条件付きGET')
+        response = self.client.get(reverse('api_todo_list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+    
+    def test_update_changes_etag(self):
+        """Todoの更新でETagが変わることをテスト。"""
+        etag = self.client.get(reverse('api_todo_list'))['ETag']
+        self.client.post(reverse('todo_toggle', args=[self.todo.pk]))
+        response = self.client.get(reverse('api_todo_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_delete_changes_etag(self):
+        """Todoの削除でETagが変わることをテスト。"""
+        etag = self.client.get(reverse('api_todo_list'))['ETag']
+        self.todo.delete()
+        response = self.client.get(reverse('api_todo_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['todos'], [])
+    
+    def test_relogin_changes_etag(self):
+        """ログインし直すとETagが変わり、古いCSRFトークンのページを304で使い続けないことをテスト。"""
+        response = self.client.get(reverse('todo_list'))
+        self.assertIn('Cookie', response['Vary'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('todo_list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.logout()
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('todo_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_etag_is_per_user(self):
+        """他のユーザーのETagでは304にならないことをテスト。"""
+        etag = self.client.get(reverse('api_todo_list'))['ETag']
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        response = self.client.get(reverse('api_todo_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    @override_settings(CACHES=LIST_CACHE_SETTINGS)
+    def test_last_modified_returns_304_and_tracks_deletes(self):
+        """If-Modified-Sinceで304になり、削除後は200になることをテスト。"""
+        list_cache.get_cache().clear()
+        last_modified = self.client.get(reverse('api_todo_list'))['Last-Modified']
+        response = self.client.get(reverse('api_todo_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        
+        with patch('todo.cache.timezone.now', return_value=timezone.now() + timedelta(seconds=5)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.todo.delete()
+        response = self.client.get(reverse('api_todo_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+
+class TodoInPlaceUpdateTestCase(TestCase):
+    """一覧ページのカード単位の更新機能のテストケース。
+    
+    カード部分のみを返すビューと、AJAXでの削除をテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(
+            title='カードTodo',
+            user=self.user,
+            due_date=timezone.now() - timedelta(hours=1)
+        )
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_card_renders_single_todo(self):
+        """カードビューが対象のTodoだけを描画することをテスト。"""
+        Todo.objects.create(title='別のTodo', user=self.user)
+        response = self.client.get(reverse('todo_card', args=[self.todo.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'todo/todo_card.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertContains(response, f'id="todo-{self.todo.pk}"')
+        self.assertContains(response, 'カードTodo')
+        self.assertContains(response, '期限切れ')
+        self.assertNotContains(response, '別のTodo')
+    
+    def test_card_reflects_toggle(self):
+        """切り替え後のカードに完了状態が反映されることをテスト。"""
+        self.client.post(reverse('todo_toggle', args=[self.todo.pk]))
+        response = self.client.get(reverse('todo_card', args=[self.todo.pk]))
+        self.assertContains(response, '未完了にする')
+        self.assertContains(response, 'text-decoration-line-through')
+    
+    def test_card_unauthorized_user(self):
+        """他のユーザーのカードは404になることをテスト。"""
+        self.client.login(username='other', password='testpass123')
+        response = self.client.get(reverse('todo_card', args=[self.todo.pk]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_ajax_delete_returns_json(self):
+        """AJAXでの削除がリダイレクトせずJSONを返すことをテスト。"""
+        response = self.client.post(
+            reverse('todo_delete', args=[self.todo.pk]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'deleted': True})
+        self.assertFalse(Todo.objects.filter(pk=self.todo.pk).exists())
+    
+    def test_list_script_does_not_reload_on_toggle(self):
+        """一覧ページが切り替え後にカードだけを差し替えることをテスト。"""
+        response = self.client.get(reverse('todo_list'))
+        self.assertContains(response, reverse('todo_card', args=[0]))
+        self.assertContains(response, 'replaceWith')
+
+
+class TodoAtomicToggleTestCase(TestCase):
+    """1文のUPDATEによる完了状態切り替えのテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='切り替えTodo', user=self.user)
+    
+    def test_toggle_is_single_statement(self):
+        """切り替えが1クエリで行われることをテスト。"""
+        with self.assertNumQueries(1):
+            completed = Todo.objects.toggle_completed(self.todo.pk, self.user.pk)
+        self.assertTrue(completed)
+        self.todo.refresh_from_db()
+        self.assertTrue(self.todo.completed)
+    
+    def test_toggle_other_users_todo_returns_none(self):
+        """他のユーザーのTodoは切り替えられないことをテスト。"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.assertIsNone(Todo.objects.toggle_completed(self.todo.pk, other.pk))
+        self.todo.refresh_from_db()
+        self.assertFalse(self.todo.completed)
+    
+    def test_toggle_does_not_overwrite_other_fields(self):
+        """切り替えがタイトルなど他のフィールドを上書きしないことをテスト。"""
+        Todo.objects.filter(pk=self.todo.pk).update(title='別タブで編集')
+        Todo.objects.toggle_completed(self.todo.pk, self.user.pk)
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.title, '別タブで編集')
+        self.assertTrue(self.todo.completed)
+    
+    def test_fallback_without_returning(self):
+        """RETURNING非対応のデータベースでも切り替えられることをテスト。"""
+        with patch('todo.models._supports_update_returning', return_value=False):
+            self.assertTrue(Todo.objects.toggle_completed(self.todo.pk, self.user.pk))
+            self.assertFalse(Todo.objects.toggle_completed(self.todo.pk, self.user.pk))
+            self.assertIsNone(Todo.objects.toggle_completed(self.todo.pk + 1000, self.user.pk))
+    
+    def test_toggle_updates_updated_at(self):
+        """切り替えで更新日時が進むことをテスト。"""
+        before = self.todo.updated_at
+        Todo.objects.toggle_completed(self.todo.pk, self.user.pk)
+        self.todo.refresh_from_db()
+        self.assertGreater(self.todo.updated_at, before)
+
+
+class TodoConcurrentToggleTestCase(TransactionTestCase):
+    """複数スレッドからの同時切り替えのテストケース。
+    
+    同時に切り替えても更新が失われず、並行して行われた
+    タイトルの編集も上書きされないことをテストします。
+    """
+    
+    THREADS = 8
+    TOGGLES_PER_THREAD = 25
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='同時切り替え', user=self.user)
+    
+    MAX_ATTEMPTS = 1000
+    
+    @classmethod
+    def _retry(cls, operation):
+        """ロック競合で失敗した操作を再試行する。
+        
+        ロックが解放されない不具合でテストが止まらないよう、
+        ``MAX_ATTEMPTS`` 回失敗したら最後の例外を送出します。
+        """
+        for attempt in range(cls.MAX_ATTEMPTS):
+            try:
+                return operation()
+            except OperationalError:
+                # SQLiteの共有キャッシュではロック競合が即座にエラーになる
+                if attempt == cls.MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.001)
+    
+    @staticmethod
+    def _thread(func):
+        """終了時にスレッド専用のDB接続を閉じるスレッドを作成する。"""
+        def target():
+            try:
+                func()
+            finally:
+                connections.close_all()
+        return threading.Thread(target=target)
+    
+    def test_concurrent_toggles_do_not_lose_updates(self):
+        """同時切り替えで更新が失われないことをテスト。"""
+        barrier = threading.Barrier(self.THREADS + 1)
+        results = []
+        lock = threading.Lock()
+        
+        def toggler():
+            barrier.wait()
+            for _ in range(self.TOGGLES_PER_THREAD):
+                value = self._retry(
+                    lambda: Todo.objects.toggle_completed(self.todo.pk, self.user.pk)
+                )
+                with lock:
+                    results.append(value)
+        
+        def renamer():
+            barrier.wait()
+            self._retry(lambda: Todo.objects.filter(pk=self.todo.pk).update(title='同時編集後'))
+        
+        threads = [self._thread(toggler) for _ in range(self.THREADS)]
+        threads.append(self._thread(renamer))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        total = self.THREADS * self.TOGGLES_PER_THREAD
+        self.assertEqual(len(results), total)
+        # 各切り替えが直前の値を反転させていれば、Trueを返した回数は総数の半分になる
+        self.assertEqual(results.count(True), total // 2)
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.completed, total % 2 == 1)
+        self.assertEqual(self.todo.title, '同時編集後')
+
+
+@override_settings(TODO_BULK_CHUNK_SIZE=3, TODO_BULK_MAX_IDS=10)
+class TodoBulkActionTestCase(TestCase):
+    """Todoの一括操作APIのテストケース。
+    
+    一括での完了・未完了・削除と、他のユーザーのTodoの扱い、
+    件数上限と不正なリクエストをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            password='testpass123'
+        )
+        self.todos = [Todo.objects.create(title=f'Todo {i}', user=self.user) for i in range(5)]
+        self.other_todo = Todo.objects.create(title='他人のTodo', user=self.other)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _post(self, payload):
+        return self.client.post(
+            reverse('api_todo_bulk'),
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+    
+    def test_bulk_complete(self):
+        """選択したTodoがまとめて完了になることをテスト。"""
+        Todo.objects.filter(pk=self.todos[0].pk).update(completed=True)
+        ids = [todo.pk for todo in self.todos] + [self.other_todo.pk]
+        response = self._post({'action': 'complete', 'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[str(self.todos[0].pk)], 'unchanged')
+        self.assertEqual(results[str(self.todos[1].pk)], 'updated')
+        self.assertEqual(results[str(self.other_todo.pk)], 'not_found')
+        self.assertEqual(Todo.objects.filter(user=self.user, completed=True).count(), 5)
+        self.other_todo.refresh_from_db()
+        self.assertFalse(self.other_todo.completed)
+    
+    def test_bulk_reopen(self):
+        """選択したTodoがまとめて未完了になることをテスト。"""
+        Todo.objects.filter(user=self.user).update(completed=True)
+        response = self._post({'action': 'reopen', 'ids': [self.todos[0].pk, self.todos[1].pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Todo.objects.filter(user=self.user, completed=False).count(), 2)
+    
+    def test_bulk_delete(self):
+        """選択したTodoがまとめて削除され、他人のTodoは残ることをテスト。"""
+        ids = [todo.pk for todo in self.todos] + [self.other_todo.pk]
+        response = self._post({'action': 'delete', 'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[str(self.todos[4].pk)], 'deleted')
+        self.assertEqual(results[str(self.other_todo.pk)], 'not_found')
+        self.assertFalse(Todo.objects.filter(user=self.user).exists())
+        self.assertTrue(Todo.objects.filter(pk=self.other_todo.pk).exists())
+    
+    def test_bulk_update_query_count_per_chunk(self):
+        """チャンクごとにSELECTとUPDATEが1回ずつであることをテスト。"""
+        ids = [todo.pk for todo in self.todos]
+        # 5件をチャンクサイズ3で分割すると2チャンク
+        with self.assertNumQueries(2 * 6):
+            # 各チャンク: SAVEPOINT, SELECT, UPDATE, RELEASE SAVEPOINT, 変更履歴のINSERT, 集計の更新
+            apply_bulk_action(self.user.pk, 'complete', ids)
+    
+    def test_bulk_delete_issues_one_delete_and_one_signal_per_chunk(self):
+        """削除がチャンクごとに1文のDELETEと1回の通知で済むことをテスト。"""
+        ids = [todo.pk for todo in self.todos]
+        received = []
+        
+        def receiver(sender, todo_ids, action, **kwargs):
+            received.append((action, sorted(todo_ids)))
+        
+        todos_changed.connect(receiver)
+        self.addCleanup(todos_changed.disconnect, receiver)
+        with CaptureQueriesContext(connection) as ctx:
+            apply_bulk_action(self.user.pk, 'delete', ids)
+        deletes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "todo_todo"')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(received, [('deleted', ids[:3]), ('deleted', ids[3:])])
+        self.assertFalse(Todo.objects.filter(pk__in=ids).exists())
+    
+    @skipUnless(connection.features.has_select_for_update, 'SELECT ... FOR UPDATE is not supported')
+    def test_bulk_update_locks_rows(self):
+        """完了状態を読み取るSELECTで対象の行をロックすることをテスト。"""
+        with CaptureQueriesContext(connection) as ctx:
+            apply_bulk_action(self.user.pk, 'complete', [todo.pk for todo in self.todos])
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and '"todo_todo"' in q['sql']]
+        self.assertTrue(selects)
+        self.assertTrue(all('FOR UPDATE' in sql for sql in selects))
+    
+    def test_too_many_ids_is_rejected(self):
+        """上限を超えるIDの指定は400になることをテスト。"""
+        response = self._post({'action': 'complete', 'ids': list(range(1, 12))})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10件まで', response.json()['error'])
+    
+    def test_invalid_action_is_rejected(self):
+        """不正な操作は400になることをテスト。"""
+        response = self._post({'action': 'archive', 'ids': [self.todos[0].pk]})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_malformed_body_is_rejected(self):
+        """JSONとして不正なボディは400になることをテスト。"""
+        response = self.client.post(reverse('api_todo_bulk'), data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_get_is_not_allowed(self):
+        """GETは405になることをテスト。"""
+        response = self.client.get(reverse('api_todo_bulk'))
+        self.assertEqual(response.status_code, 405)
+
+
+class TodoExportTestCase(TestCase):
+    """Todoのストリーミングエクスポートのテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            password='testpass123'
+        )
+        self.due_date = timezone.now() + timedelta(days=1)
+        self.todo = Todo.objects.create(
+            title='エクスポート, "引用"',
+            description='1行目\n2行目',
+            user=self.user,
+            due_date=self.due_date
+        )
+        Todo.objects.create(title='他人のTodo', user=self.other)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_csv_export(self):
+        """CSVでエクスポートされ、他人のTodoは含まれないことをテスト。"""
+        response = self.client.get(reverse('todo_export'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('todos.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'title', 'description', 'completed', 'due_date', 'created_at', 'updated_at'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1], 'エクスポート, "引用"')
+        self.assertEqual(rows[1][2], '1行目\n2行目')
+        self.assertEqual(rows[1][4], self.due_date.isoformat())
+    
+    def test_ndjson_export(self):
+        """NDJSONでエクスポートされることをテスト。"""
+        response = self.client.get(reverse('todo_export'), {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['id'], self.todo.pk)
+        self.assertEqual(record['title'], 'エクスポート, "引用"')
+        self.assertFalse(record['completed'])
+    
+    def test_export_does_not_build_model_instances(self):
+        """エクスポートがモデルインスタンスを生成しないことをテスト。"""
+        with patch.object(Todo, 'from_db', side_effect=AssertionError('model instance built')):
+            response = self.client.get(reverse('todo_export'), {'format': 'ndjson'})
+            content = b''.join(response.streaming_content)
+        self.assertIn('エクスポート'.encode(), content)
+    
+    def test_invalid_format(self):
+        """不正な形式の指定は400になることをテスト。"""
+        response = self.client.get(reverse('todo_export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TODO_IMPORT_BATCH_SIZE=2)
+class TodoImportTestCase(TestCase):
+    """Todoの一括インポートのテストケース。
+    
+    CSV/NDJSONの読み込み、行ごとの検証エラー、バッチ単位の登録と
+    変更通知、管理コマンドとアップロードビューをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.future = (timezone.now() + timedelta(days=5)).isoformat()
+        self.past = (timezone.now() - timedelta(days=5)).isoformat()
+        self.csv_content = (
+            'title,description,completed,due_date\n'
+            f'買い物,牛乳,true,{self.future}\n'
+            ',タイトルなし,false,\n'
+            f'過去の期限,,false,{self.past}\n'
+            '掃除,,0,\n'
+            '洗濯,,1,\n'
+        )
+        self.changes = []
+        todos_changed.connect(self._record_change)
+    
+    def tearDown(self):
+        todos_changed.disconnect(self._record_change)
+    
+    def _record_change(self, sender, user_id, todo_ids, action, **kwargs):
+        self.changes.append((user_id, list(todo_ids), action))
+    
+    def test_import_csv_reports_row_errors(self):
+        """有効な行が登録され、不正な行がエラーとして報告されることをテスト。"""
+        report = import_todos(self.user, iter_records(io.StringIO(self.csv_content), 'csv'))
+        self.assertEqual(report.total, 5)
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.error_count, 2)
+        self.assertEqual([error.line for error in report.errors], [3, 4])
+        self.assertIn('title', report.errors[0].errors)
+        self.assertIn('due_date', report.errors[1].errors)
+        todo = Todo.objects.get(title='買い物')
+        self.assertTrue(todo.completed)
+        self.assertEqual(todo.description, '牛乳')
+        self.assertGreater(report.rows_per_second, 0)
+    
+    def test_import_notifies_once_per_batch(self):
+        """変更通知が行ごとではなくバッチごとに送信されることをテスト。"""
+        import_todos(self.user, iter_records(io.StringIO(self.csv_content), 'csv'))
+        # 有効な3行をバッチサイズ2で登録すると2バッチ
+        self.assertEqual([len(ids) for _, ids, _ in self.changes], [2, 1])
+        self.assertTrue(all(action == 'created' for _, _, action in self.changes))
+    
+    def test_import_ndjson(self):
+        """NDJSONを読み込み、解析できない行をエラーにすることをテスト。"""
+        content = (
+            json.dumps({'title': 'NDJSON Todo', 'completed': True}, ensure_ascii=False) + '\n'
+            '\n'
+            '{broken\n'
+            '[1, 2]\n'
+        )
+        report = import_todos(self.user, iter_records(io.StringIO(content), 'ndjson'))
+        self.assertEqual(report.created, 1)
+        self.assertEqual([error.line for error in report.errors], [3, 4])
+        self.assertTrue(Todo.objects.get(title='NDJSON Todo').completed)
+    
+    def test_exported_file_can_be_imported(self):
+        """エクスポートしたCSVを再インポートできることをテスト。"""
+        Todo.objects.create(title='往復Todo', user=self.user, due_date=timezone.now() + timedelta(days=1))
+        other = User.objects.create_user(username='other', password='testpass123')
+        exported = ''.join(iter_csv(self.user.pk))
+        report = import_todos(other, iter_records(io.StringIO(exported), 'csv'))
+        self.assertEqual(report.created, 1)
+        self.assertTrue(Todo.objects.filter(user=other, title='往復Todo').exists())
+    
+    def test_management_command(self):
+        """管理コマンドでファイルをインポートできることをテスト。"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as handle:
+            handle.write(self.csv_content)
+        self.addCleanup(os.remove, handle.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_todos', 'testuser', handle.name, stdout=stdout, stderr=stderr)
+        self.assertIn('5行中3件を登録しました', stdout.getvalue())
+        self.assertIn('3行目', stderr.getvalue())
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 3)
+    
+    def test_management_command_unknown_user(self):
+        """存在しないユーザーを指定するとエラーになることをテスト。"""
+        with self.assertRaises(CommandError):
+            call_command('import_todos', 'nobody', 'todos.csv')
+    
+    def test_upload_view(self):
+        """アップロードビューでファイルをインポートできることをテスト。"""
+        self.client.login(username='testuser', password='testpass123')
+        upload = SimpleUploadedFile('todos.csv', self.csv_content.encode('utf-8'), content_type='text/csv')
+        response = self.client.post(reverse('todo_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '5行中3件を登録しました')
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 3)
+    
+    def test_upload_view_unknown_format(self):
+        """拡張子から形式を判定できない場合はエラーを表示することをテスト。"""
+        self.client.login(username='testuser', password='testpass123')
+        upload = SimpleUploadedFile('todos.txt', self.csv_content.encode('utf-8'))
+        response = self.client.post(reverse('todo_import'), {'file': upload})
+        self.assertContains(response, 'ファイル形式を推定できません')
+        self.assertFalse(Todo.objects.filter(user=self.user).exists())
+    
+    def test_upload_view_wrong_encoding(self):
+        """文字コードが合わないファイルはエラーを表示し、指定すれば読み込めることをテスト。"""
+        self.client.login(username='testuser', password='testpass123')
+        content = 'title\n牛乳を買う\n'.encode('cp932')
+        response = self.client.post(reverse('todo_import'), {'file': SimpleUploadedFile('todos.csv', content)})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '文字コード utf-8-sig として読み込めません')
+        self.assertFalse(Todo.objects.filter(user=self.user).exists())
+        response = self.client.post(
+            reverse('todo_import'), {'file': SimpleUploadedFile('todos.csv', content), 'encoding': 'cp932'}
+        )
+        self.assertContains(response, '1行中1件を登録しました')
+        self.assertTrue(Todo.objects.filter(user=self.user, title='牛乳を買う').exists())
+    
+    def test_upload_view_malformed_csv(self):
+        """CSVとして解析できない行はエラーを表示し、それまでの行は登録することをテスト。"""
+        self.client.login(username='testuser', password='testpass123')
+        content = 'title\n牛乳を買う\n卵\x00を買う\n'.encode('utf-8')
+        response = self.client.post(reverse('todo_import'), {'file': SimpleUploadedFile('todos.csv', content)})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'CSVとして解析できません')
+        self.assertEqual(list(Todo.objects.filter(user=self.user).values_list('title', flat=True)), ['牛乳を買う'])
+    
+    def test_management_command_reports_unreadable_file(self):
+        """読み込めないファイルや不明な文字コードは CommandError になることをテスト。"""
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as handle:
+            handle.write('title\n牛乳を買う\n'.encode('cp932'))
+        self.addCleanup(os.remove, handle.name)
+        with self.assertRaisesMessage(CommandError, '読み込めません'):
+            call_command('import_todos', 'testuser', handle.name, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, '不明な文字コード'):
+            call_command('import_todos', 'testuser', handle.name, '--encoding', 'unknown', stdout=io.StringIO())
+        call_command('import_todos', 'testuser', handle.name, '--encoding', 'cp932', stdout=io.StringIO())
+        self.assertTrue(Todo.objects.filter(user=self.user, title='牛乳を買う').exists())
+
+
+class TodoSignalCoalescingTestCase(TestCase):
+    """変更通知の集約のテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.changes = []
+        todos_changed.connect(self._record_change)
+    
+    def tearDown(self):
+        todos_changed.disconnect(self._record_change)
+    
+    def _record_change(self, sender, user_id, todo_ids, action, **kwargs):
+        self.changes.append((user_id, list(todo_ids), action))
+    
+    def test_changes_are_sent_once_per_user_and_action(self):
+        """ブロック内の通知がユーザーと種類ごとに1回にまとめられることをテスト。"""
+        with coalesce_todos_changed():
+            first = Todo.objects.create(title='1', user=self.user)
+            second = Todo.objects.create(title='2', user=self.user)
+            self.assertEqual(self.changes, [])
+        self.assertEqual(self.changes, [(self.user.pk, [first.pk, second.pk], 'created')])
+    
+    def test_pending_changes_are_dropped_on_error(self):
+        """例外で終了した場合は保留中の通知が破棄されることをテスト。"""
+        with self.assertRaises(RuntimeError):
+            with coalesce_todos_changed():
+                Todo.objects.create(title='1', user=self.user)
+                raise RuntimeError
+        self.assertEqual(self.changes, [])
+        Todo.objects.create(title='2', user=self.user)
+        self.assertEqual(len(self.changes), 1)
+    
+    def _fail_receivers(self):
+        def receiver(**kwargs):
+            raise RuntimeError('receiver failed')
+        
+        todos_changed.connect(receiver)
+        self.addCleanup(todos_changed.disconnect, receiver)
+    
+    def test_failing_receiver_rolls_back_toggle(self):
+        """通知の受信側が失敗した場合は完了状態の切り替えが取り消されることをテスト。"""
+        todo = Todo.objects.create(title='切り替え', user=self.user)
+        self._fail_receivers()
+        self.client.force_login(self.user)
+        with self.assertRaises(RuntimeError):
+            self.client.post(reverse('todo_toggle', args=[todo.pk]))
+        todo.refresh_from_db()
+        self.assertFalse(todo.completed)
+    
+    def test_failing_receiver_rolls_back_import_batch(self):
+        """通知の受信側が失敗した場合はインポートしたバッチの登録が取り消されることをテスト。"""
+        self._fail_receivers()
+        with self.assertRaises(RuntimeError):
+            import_todos(self.user, iter_records(io.StringIO('title\n牛乳\n'), 'csv'))
+        self.assertFalse(Todo.objects.filter(user=self.user).exists())
+
+
+@override_settings(TODO_PAGE_SIZE=2)
+class TodoSearchTestCase(TestCase):
+    """Todoの全文検索のテストケース。
+    
+    タイトル・詳細の検索、関連度順の並び、ページ分割、
+    変更に伴う検索インデックスの同期をテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='other',
+            password='testpass123'
+        )
+        self.milk = Todo.objects.create(title='牛乳を買う', description='スーパーで牛乳と卵', user=self.user)
+        self.report = Todo.objects.create(title='週次レポート', description='weekly report draft', user=self.user)
+        self.eggs = Todo.objects.create(title='卵を買う', description='', user=self.user)
+        Todo.objects.create(title='牛乳を買う（他人）', user=self.other)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _titles(self, query, page=1):
+        return [todo.title for todo in search_todos(self.user.pk, query, page)]
+    
+    def test_search_title_and_description(self):
+        """タイトルと詳細の両方が検索対象になることをテスト。"""
+        self.assertEqual(self._titles('牛乳を'), ['牛乳を買う'])
+        self.assertEqual(self._titles('report'), ['週次レポート'])
+    
+    def test_search_ranks_more_relevant_first(self):
+        """一致が多いTodoが上位になることをテスト。"""
+        Todo.objects.create(title='牛乳', description='牛乳 牛乳 牛乳', user=self.user)
+        self.assertEqual(self._titles('牛乳')[0], '牛乳')
+    
+    def test_search_multiple_terms_require_all(self):
+        """複数の語はすべてを含むTodoに一致することをテスト。"""
+        self.assertEqual(self._titles('買う スーパー'), ['牛乳を買う'])
+    
+    def test_search_is_paginated(self):
+        """検索結果がページ分割されることをテスト。"""
+        first = search_todos(self.user.pk, '買う', 1)
+        self.assertEqual(len(first), 2)
+        self.assertFalse(first.has_next)
+        Todo.objects.create(title='本を買う', user=self.user)
+        first = search_todos(self.user.pk, '買う', 1)
+        second = search_todos(self.user.pk, '買う', 2)
+        self.assertTrue(first.has_next)
+        self.assertEqual(len(second), 1)
+        self.assertTrue(second.has_previous)
+    
+    def test_index_follows_updates_and_deletes(self):
+        """更新・削除・インポートが検索結果に反映されることをテスト。"""
+        self.milk.title = '豆乳を買う'
+        self.milk.description = ''
+        self.milk.save()
+        self.assertEqual(self._titles('牛乳'), [])
+        self.assertEqual(self._titles('豆乳を'), ['豆乳を買う'])
+        self.milk.delete()
+        self.assertEqual(self._titles('豆乳を'), [])
+        import_todos(self.user, iter_records(io.StringIO('title\nインポートした牛乳\n'), 'csv'))
+        self.assertEqual(self._titles('牛乳'), ['インポートした牛乳'])
+    
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5のテスト')
+    def test_sqlite_uses_fts_table(self):
+        """SQLiteではFTS5テーブルで検索することをテスト。"""
+        with CaptureQueriesContext(connection) as ctx:
+            search_todos(self.user.pk, '牛乳を')
+        self.assertTrue(any('todo_todo_fts' in q['sql'] and 'MATCH' in q['sql'] for q in ctx.captured_queries))
+    
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5のテスト')
+    def test_sqlite_owner_is_part_of_match(self):
+        """SQLiteでは所有ユーザーをMATCH式の索引付きトークンで絞り込むことをテスト。"""
+        with CaptureQueriesContext(connection) as ctx:
+            results = search_todos(self.other.pk, '牛乳を')
+        self.assertEqual([todo.title for todo in results], ['牛乳を買う（他人）'])
+        fts_sql = [q['sql'] for q in ctx.captured_queries if 'todo_todo_fts' in q['sql']]
+        self.assertTrue(fts_sql)
+        self.assertTrue(all('user_id' not in sql for sql in fts_sql))
+        self.assertTrue(any(owner_token(self.other.pk) in sql for sql in fts_sql))
+        # 桁の繰り上がりをまたぐIDでも他のユーザーのトークンと一致しない
+        self.assertEqual(len({owner_token(pk) for pk in (1, 0xFFFD, 0xFFFE, 0xFFFF, 0xFFFE ** 2)}), 5)
+    
+    def test_short_terms_fall_back_to_substring_search(self):
+        """短い語でも部分一致で検索できることをテスト。"""
+        self.assertEqual(self._titles('卵'), ['卵を買う', '牛乳を買う'])
+    
+    def test_search_api(self):
+        """検索APIが関連度付きのJSONを返すことをテスト。"""
+        response = self.client.get(reverse('api_todo_search'), {'q': 'report'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([todo['title'] for todo in data['todos']], ['週次レポート'])
+        self.assertIn('rank', data['todos'][0])
+        self.assertEqual(data['page'], 1)
+    
+    def test_search_view(self):
+        """検索結果ページに一致したTodoだけが表示されることをテスト。"""
+        response = self.client.get(reverse('todo_search'), {'q': '牛乳を'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '牛乳を買う')
+        self.assertNotContains(response, '週次レポート')
+        self.assertNotContains(response, '（他人）')
+    
+    def test_empty_query(self):
+        """空の検索語では結果が空になることをテスト。"""
+        self.assertEqual(self._titles('  '), [])
+
+
+class AsyncViewsURLConf:
+    """非同期ビューを使うURL設定（``TODO_ASYNC_VIEWS=True`` の場合と同じ構成）。"""
+    
+    urlpatterns = async_urlpatterns + common_urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncViewsURLConf)
+class TodoAsyncViewsTestCase(TestCase):
+    """一覧・切り替え・JSON APIの非同期ビューのテストケース。
+    
+    非同期ビューが同期ビューと同じレスポンスを返すことをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='非同期のTodo', description='牛乳を買う', user=self.user)
+        self.other_todo = Todo.objects.create(title='他人のTodo', user=self.other_user)
+    
+    async def test_login_required(self):
+        """未ログインではログインページへリダイレクトされることをテスト。"""
+        response = await self.async_client.get(reverse('todo_list'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/login/'))
+    
+    async def test_todo_list(self):
+        """一覧ページに自分のTodoだけが表示され、ETagで304になることをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '非同期のTodo')
+        self.assertNotContains(response, '他人のTodo')
+        self.assertContains(response, 'testuser')
+        
+        response = await self.async_client.get(reverse('todo_list'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+    
+    async def test_toggle(self):
+        """完了状態が切り替わり、他人のTodoは404になることをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('todo_toggle', args=[self.todo.pk]))
+        self.assertEqual(response.json(), {'completed': True})
+        todo = await Todo.objects.aget(pk=self.todo.pk)
+        self.assertTrue(todo.completed)
+        
+        response = await self.async_client.post(reverse('todo_toggle', args=[self.other_todo.pk]))
+        self.assertEqual(response.status_code, 404)
+    
+    async def test_toggle_rolled_back_when_receiver_fails(self):
+        """通知の受信側が失敗した場合は完了状態の切り替えが取り消されることをテスト。"""
+        def receiver(**kwargs):
+            raise RuntimeError('receiver failed')
+        
+        todos_changed.connect(receiver)
+        self.addCleanup(todos_changed.disconnect, receiver)
+        await self.async_client.aforce_login(self.user)
+        with self.assertRaises(RuntimeError):
+            await self.async_client.post(reverse('todo_toggle', args=[self.todo.pk]))
+        todo = await Todo.objects.aget(pk=self.todo.pk)
+        self.assertFalse(todo.completed)
+    
+    @override_settings(TODO_EXPORT_CHUNK_SIZE=1)
+    async def test_export_streams_async_iterator(self):
+        """エクスポートが非同期のイテレーターで逐次送信されることをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        await Todo.objects.acreate(title='2件目', user=self.user)
+        for export_format in ('csv', 'ndjson'):
+            with self.subTest(format=export_format):
+                response = await self.async_client.get(reverse('todo_export'), {'format': export_format})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.is_async)
+                content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+                self.assertIn('2件目', content)
+                self.assertNotIn('他人のTodo', content)
+        response = await self.async_client.get(reverse('todo_export'), {'format': 'ndjson'})
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['2件目', '非同期のTodo'])
+    
+    async def test_card(self):
+        """1件分のカードが描画され、他人のTodoは404になることをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_card', args=[self.todo.pk]))
+        self.assertContains(response, f'id="todo-{self.todo.pk}"')
+        response = await self.async_client.get(reverse('todo_card', args=[self.other_todo.pk]))
+        self.assertEqual(response.status_code, 404)
+    
+    async def test_api_matches_sync_view(self):
+        """JSON一覧APIが同期版と同じ内容を返すことをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api_todo_list'))
+        self.assertEqual(response.status_code, 200)
+        
+        with override_settings(ROOT_URLCONF='todoproject.urls'):
+            expected = await self.async_client.get(reverse('api_todo_list'))
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response['ETag'], expected['ETag'])
+        
+        response = await self.async_client.get(reverse('api_todo_list'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+    
+    async def test_search_api(self):
+        """検索APIが自分のTodoだけを返すことをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api_todo_search'), {'q': '牛乳を'})
+        self.assertEqual([todo['title'] for todo in response.json()['todos']], ['非同期のTodo'])
+
+
+class TodoEventBrokerTestCase(TestCase):
+    """ライブ更新イベントのブローカーのテストケース。"""
+    
+    async def test_publish_from_another_thread(self):
+        """別スレッドから配信したイベントを購読者が受け取れることをテスト。"""
+        broker = InProcessBroker()
+        subscription = broker.subscribe(1)
+        other = broker.subscribe(2)
+        thread = threading.Thread(target=broker.publish, args=(1, {'action': 'toggled', 'ids': [5]}))
+        thread.start()
+        thread.join()
+        self.assertEqual(await subscription.get(timeout=1), {'action': 'toggled', 'ids': [5]})
+        self.assertIsNone(await other.get(timeout=0.01))
+        
+        subscription.close()
+        other.close()
+        self.assertEqual(broker.subscriber_count(1), 0)
+    
+    @override_settings(TODO_EVENT_QUEUE_SIZE=2)
+    async def test_overflow_sends_reset(self):
+        """キューがあふれた購読者にはresetイベントが届くことをテスト。"""
+        broker = InProcessBroker()
+        subscription = broker.subscribe(1)
+        for pk in range(5):
+            broker.publish(1, {'action': 'updated', 'ids': [pk]})
+        await asyncio.sleep(0)
+        self.assertEqual((await subscription.get(timeout=1))['ids'], [0])
+        self.assertEqual((await subscription.get(timeout=1))['ids'], [1])
+        self.assertEqual(await subscription.get(timeout=1), RESET_EVENT)
+        subscription.close()
+    
+    def test_publish_to_closed_loop_drops_subscription(self):
+        """イベントループが閉じた購読者への配信は例外にならず、購読を解除することをテスト。"""
+        broker = InProcessBroker()
+        
+        async def subscribe():
+            return broker.subscribe(1)
+        
+        # asyncio.run は終了時にイベントループを閉じる
+        asyncio.run(subscribe())
+        self.assertEqual(broker.subscriber_count(1), 1)
+        broker.publish(1, {'action': 'toggled', 'ids': [5]})
+        self.assertEqual(broker.subscriber_count(1), 0)
+    
+    def test_todo_changes_are_published_after_commit(self):
+        """Todoの保存・削除がコミット後にイベントとして配信されることをテスト。"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        with patch.object(InProcessBroker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                todo = Todo.objects.create(title='ライブ更新', user=user)
+                self.assertFalse(publish.called)
+            pk = todo.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                todo.delete()
+        publish.assert_any_call(user.pk, {'action': 'created', 'ids': [pk]})
+        publish.assert_any_call(user.pk, {'action': 'deleted', 'ids': [pk]})
+    
+    async def test_postgres_broker_relays_notifications(self):
+        """PostgresBrokerが通知のペイロードを経由して購読者に配信することをテスト。"""
+        broker = PostgresBroker()
+        payloads = []
+        
+        def notify(payload):
+            # NOTIFYと受信スレッドの代わりに、送信したペイロードをそのまま受信したことにする
+            payloads.append(payload)
+            broker.dispatch(payload)
+        
+        with patch.object(broker, '_notify', side_effect=notify), patch.object(broker, '_start_listener'):
+            subscription = broker.subscribe(1)
+            other = broker.subscribe(2)
+            broker.publish(1, {'action': 'toggled', 'ids': [5]})
+            self.assertEqual(await subscription.get(timeout=1), {'action': 'toggled', 'ids': [5]})
+            self.assertIsNone(await other.get(timeout=0.01))
+            # NOTIFYのペイロードの上限を超えるイベントはresetに置き換える
+            broker.publish(1, {'action': 'deleted', 'ids': list(range(5000))})
+            self.assertEqual(await subscription.get(timeout=1), RESET_EVENT)
+        self.assertTrue(all(len(payload) <= 8000 for payload in payloads))
+        subscription.close()
+        other.close()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQLのLISTEN/NOTIFYのテスト')
+class PostgresBrokerTestCase(TransactionTestCase):
+    """PostgreSQLのLISTEN/NOTIFYによるイベント配信のテストケース。"""
+    
+    async def test_notification_reaches_subscriber(self):
+        """別の接続から送信した通知が受信スレッド経由で購読者に届くことをテスト。"""
+        broker = PostgresBroker()
+        self.addCleanup(broker.close)
+        subscription = broker.subscribe(1)
+        self.assertTrue(await sync_to_async(broker.wait_until_listening)(5))
+        await sync_to_async(broker.publish)(1, {'action': 'toggled', 'ids': [5]})
+        self.assertEqual(await subscription.get(timeout=5), {'action': 'toggled', 'ids': [5]})
+        subscription.close()
+
+
+class TodoEventStreamTestCase(TestCase):
+    """Server-Sent Eventsビューのテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='ライブ更新', user=self.user)
+    
+    async def test_stream_delivers_events(self):
+        """購読中のユーザーに変更イベントが届くことをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        
+        get_broker().publish(self.user.pk, {'action': 'toggled', 'ids': [self.todo.pk]})
+        message = await asyncio.wait_for(anext(stream), timeout=1)
+        self.assertEqual(message, f'event: toggled\ndata: {{"ids": [{self.todo.pk}]}}\n\n'.encode())
+        
+        # クライアントの切断（待機中のタスクのキャンセル）で購読が解除される
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(get_broker().subscriber_count(self.user.pk), 0)
+    
+    @override_settings(TODO_EVENTS_HEARTBEAT=0.01)
+    async def test_stream_sends_heartbeat(self):
+        """イベントがない間はコメント行を送信することをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_events'))
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        self.assertEqual(await asyncio.wait_for(anext(stream), timeout=1), b': keep-alive\n\n')
+        await stream.aclose()
+    
+    def test_wsgi_request_returns_204(self):
+        """ASGI以外では204を返し、再接続させないことをテスト。"""
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('todo_events'))
+        self.assertEqual(response.status_code, 204)
+    
+    @override_settings(TODO_EVENTS_ENABLED=False)
+    async def test_disabled_events_return_204(self):
+        """ライブ更新が無効な場合はASGIでも204を返すことをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('todo_events'))
+        self.assertEqual(response.status_code, 204)
+
+
+class TodoSyncTestCase(TestCase):
+    """差分同期APIのテストケース。
+    
+    トークン以降の変更と削除だけが返り、処理量が変更件数に
+    比例することをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.todos = [Todo.objects.create(title=f'Todo {i}', user=self.user) for i in range(5)]
+        Todo.objects.create(title='他人のTodo', user=self.other_user)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _sync(self, since=None):
+        params = {'since': since} if since else {}
+        response = self.client.get(reverse('api_todo_sync'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_initial_sync_returns_all_todos(self):
+        """初回の同期では自分の全Todoが返ることをテスト。"""
+        data = self._sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual([todo['title'] for todo in data['todos']], [f'Todo {i}' for i in range(5)])
+        self.assertEqual(data['deleted'], [])
+    
+    def test_returns_only_changes_since_token(self):
+        """トークン以降に変更・削除されたTodoだけが返ることをテスト。"""
+        token = self._sync()['token']
+        self.assertEqual(self._sync(token)['todos'], [])
+        
+        self.client.post(reverse('todo_toggle', args=[self.todos[1].pk]))
+        deleted_pk = self.todos[2].pk
+        self.client.post(reverse('todo_delete', args=[deleted_pk]))
+        created = Todo.objects.create(title='新しいTodo', user=self.user)
+        Todo.objects.create(title='他人の新しいTodo', user=self.other_user)
+        
+        data = self._sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual([todo['id'] for todo in data['todos']], [self.todos[1].pk, created.pk])
+        self.assertTrue(data['todos'][0]['completed'])
+        self.assertEqual(data['deleted'], [deleted_pk])
+        self.assertEqual(self._sync(data['token'])['todos'], [])
+    
+    def test_bulk_changes_are_recorded(self):
+        """一括操作の変更も同期されることをテスト。"""
+        token = self._sync()['token']
+        apply_bulk_action(self.user.pk, 'delete', [todo.pk for todo in self.todos[:3]])
+        self.assertEqual(sorted(self._sync(token)['deleted']), sorted(todo.pk for todo in self.todos[:3]))
+    
+    def test_query_count_does_not_depend_on_total(self):
+        """同期のクエリ数がTodoの総数に依存しないことをテスト。"""
+        token = self._sync()['token']
+        Todo.objects.bulk_create(Todo(title=f'追加 {i}', user=self.user) for i in range(200))
+        self.todos[0].save()
+        with self.assertNumQueries(2):
+            result = sync_changes(self.user.pk, token)
+        self.assertEqual([todo.pk for todo in result.todos], [self.todos[0].pk])
+    
+    def test_paginates_with_has_more(self):
+        """変更が上限を超える場合は続きを取得できることをテスト。"""
+        token = self._sync()['token']
+        for todo in self.todos:
+            todo.save()
+        first = sync_changes(self.user.pk, token, limit=3)
+        self.assertTrue(first.has_more)
+        second = sync_changes(self.user.pk, first.token, limit=3)
+        self.assertFalse(second.has_more)
+        self.assertEqual([todo.pk for todo in first.todos + second.todos], [todo.pk for todo in self.todos])
+    
+    def test_invalid_or_expired_token_resets(self):
+        """不正なトークンや保持期間を過ぎたトークンでは全件を返すことをテスト。"""
+        self.assertTrue(self._sync('invalid!')['reset'])
+        expired = SyncToken(0, timezone.now() - timedelta(days=31)).encode()
+        self.assertTrue(self._sync(expired)['reset'])
+    
+    def test_forged_token_resets(self):
+        """署名が一致しないトークンでは全件を返すことをテスト。"""
+        token = SyncToken(0, timezone.now())
+        forged = base64.urlsafe_b64encode(f'0|{token.issued_at.isoformat()}'.encode()).decode().rstrip('=')
+        self.assertTrue(self._sync(forged)['reset'])
+        payload, signature = token.encode().split(':')
+        self.assertTrue(self._sync(f'{payload}:{signature[::-1]}')['reset'])
+        self.assertFalse(self._sync(token.encode())['reset'])
+    
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQLのアドバイザリロックのテスト')
+    def test_changes_are_recorded_under_user_lock(self):
+        """PostgreSQLでは変更履歴の記録をユーザーごとのロックで直列化することをテスト。"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.todos[0].save()
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        lock = next(i for i, sql in enumerate(sqls) if 'pg_advisory_xact_lock' in sql)
+        insert = next(i for i, sql in enumerate(sqls) if sql.startswith('INSERT INTO "todo_todochange"'))
+        self.assertLess(lock, insert)
+    
+    def test_prune_changes(self):
+        """保持期間を過ぎた変更履歴だけが削除されることをテスト。"""
+        TodoChange.objects.filter(todo_id=self.todos[0].pk).update(created_at=timezone.now() - timedelta(days=40))
+        out = io.StringIO()
+        call_command('prune_todo_changes', stdout=out)
+        self.assertIn('変更履歴を1件', out.getvalue())
+        self.assertFalse(TodoChange.objects.filter(todo_id=self.todos[0].pk).exists())
+        self.assertEqual(prune_changes(), 0)
+
+
+class TodoBatchApiTestCase(TestCase):
+    """バッチ書き込みAPIのテストケース。
+    
+    複数の操作を順番どおりに1トランザクションで適用し、
+    冪等性キーで再送を検出することをテストします。
+    """
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.todos = [Todo.objects.create(title=f'Todo {i}', user=self.user) for i in range(3)]
+        self.other_todo = Todo.objects.create(title='他人のTodo', user=self.other_user)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _post(self, operations):
+        return self.client.post(
+            reverse('api_todo_batch'),
+            data=json.dumps({'operations': operations}),
+            content_type='application/json'
+        )
+    
+    def test_applies_operations_in_order(self):
+        """作成・更新・切り替え・削除が順番どおりに適用されることをテスト。"""
+        first, second, third = self.todos
+        response = self._post([
+            {'op': 'create', 'data': {'title': '新しいTodo', 'description': 'オフラインで作成'}},
+            {'op': 'update', 'id': first.pk, 'data': {'title': '更新したTodo'}},
+            {'op': 'toggle', 'id': second.pk},
+            {'op': 'toggle', 'id': second.pk},
+            {'op': 'toggle', 'id': second.pk},
+            {'op': 'update', 'id': third.pk, 'data': {'title': '消える前の更新'}},
+            {'op': 'delete', 'id': third.pk},
+            {'op': 'toggle', 'id': third.pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'updated', 'updated', 'updated', 'updated', 'updated', 'deleted', 'not_found']
+        )
+        created = Todo.objects.get(pk=results[0]['id'])
+        self.assertEqual((created.title, created.user), ('新しいTodo', self.user))
+        first.refresh_from_db()
+        self.assertEqual(first.title, '更新したTodo')
+        second.refresh_from_db()
+        self.assertTrue(second.completed)
+        self.assertFalse(Todo.objects.filter(pk=third.pk).exists())
+    
+    def test_other_users_todo_is_not_found(self):
+        """他のユーザーのTodoは変更されず not_found になることをテスト。"""
+        response = self._post([
+            {'op': 'update', 'id': self.other_todo.pk, 'data': {'title': '乗っ取り'}},
+            {'op': 'delete', 'id': self.other_todo.pk},
+        ])
+        self.assertEqual([r['status'] for r in response.json()['results']], ['not_found', 'not_found'])
+        self.other_todo.refresh_from_db()
+        self.assertEqual(self.other_todo.title, '他人のTodo')
+    
+    def test_invalid_operation_does_not_leak_into_later_ones(self):
+        """検証に失敗した操作の値が後続の操作に反映されないことをテスト。"""
+        todo = self.todos[0]
+        response = self._post([
+            {'op': 'update', 'id': todo.pk, 'data': {'title': 'x' * 201, 'description': '反映されない'}},
+            {'op': 'update', 'id': todo.pk, 'data': {'completed': True}},
+            {'op': 'create', 'data': {'title': ''}},
+        ])
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['invalid', 'updated', 'invalid'])
+        self.assertIn('title', results[0]['errors'])
+        todo.refresh_from_db()
+        self.assertEqual((todo.title, todo.description, todo.completed), ('Todo 0', '', True))
+    
+    def test_idempotency_keys_prevent_double_apply(self):
+        """同じキーの操作を再送しても再適用されないことをテスト。"""
+        todo = self.todos[0]
+        operations = [
+            {'op': 'create', 'key': 'create-1', 'data': {'title': '一度だけ作成'}},
+            {'op': 'toggle', 'key': 'toggle-1', 'id': todo.pk},
+        ]
+        first = self._post(operations).json()['results']
+        second = self._post(operations).json()['results']
+        self.assertEqual(Todo.objects.filter(title='一度だけ作成').count(), 1)
+        todo.refresh_from_db()
+        self.assertTrue(todo.completed)
+        self.assertEqual(second, [dict(result, replayed=True) for result in first])
+        
+        # 同じバッチ内で重複したキーも1回だけ適用する
+        results = self._post([
+            {'op': 'toggle', 'key': 'toggle-2', 'id': todo.pk},
+            {'op': 'toggle', 'key': 'toggle-2', 'id': todo.pk},
+        ]).json()['results']
+        self.assertEqual(results[1], dict(results[0], replayed=True))
+        todo.refresh_from_db()
+        self.assertFalse(todo.completed)
+        self.assertEqual(TodoIdempotencyKey.objects.filter(user=self.user).count(), 3)
+    
+    def test_idempotency_keys_are_per_user(self):
+        """他のユーザーの冪等性キーとは衝突しないことをテスト。"""
+        TodoIdempotencyKey.objects.create(user=self.other_user, key='k', result={'status': 'deleted'})
+        results = self._post([{'op': 'toggle', 'key': 'k', 'id': self.todos[0].pk}]).json()['results']
+        self.assertEqual(results, [{'status': 'updated', 'id': self.todos[0].pk}])
+    
+    def test_many_operations_use_set_based_queries(self):
+        """500件の操作でもクエリ数が操作数に比例しないことをテスト。"""
+        todos = Todo.objects.bulk_create(Todo(title=f'一括 {i}', user=self.user) for i in range(250))
+        operations = [{'op': 'toggle', 'key': f't{todo.pk}', 'id': todo.pk} for todo in todos]
+        operations += [{'op': 'create', 'key': f'c{i}', 'data': {'title': f'作成 {i}'}} for i in range(250)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post(operations)
+        self.assertEqual(len(response.json()['results']), 500)
+        self.assertLess(len(ctx.captured_queries), 30)
+        self.assertEqual(Todo.objects.filter(user=self.user, completed=True).count(), 250)
+    
+    def test_rejects_malformed_requests(self):
+        """不正なリクエストは400になり、何も適用されないことをテスト。"""
+        self.assertEqual(self._post([{'op': 'archive', 'id': 1}]).status_code, 400)
+        self.assertEqual(self._post([{'op': 'toggle'}]).status_code, 400)
+        self.assertEqual(self._post([{'op': 'toggle', 'id': 1, 'key': 'x' * 65}]).status_code, 400)
+        with override_settings(TODO_BATCH_MAX_OPERATIONS=1):
+            response = self._post([{'op': 'toggle', 'id': self.todos[0].pk}] * 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1件まで', response.json()['error'])
+        response = self.client.post(reverse('api_todo_batch'), data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Todo.objects.filter(user=self.user, completed=True).exists())
+
+
+class RequestMetricsTestCase(TestCase):
+    """リクエスト計測ミドルウェアとメトリクスエンドポイントのテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='計測', user=self.user)
+        self.client.login(username='testuser', password='testpass123')
+        metrics_registry.reset()
+    
+    def _server_timing(self, response):
+        return dict(
+            (part.split(';')[0].strip(), part)
+            for part in response['Server-Timing'].split(',')
+        )
+    
+    def test_server_timing_header(self):
+        """Server-Timingヘッダーにクエリ数と各時間が含まれることをテスト。"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('todo_list'))
+        timing = self._server_timing(response)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing['db'])
+        self.assertIn('tpl;dur=', timing['tpl'])
+        self.assertIn('total;dur=', timing['total'])
+    
+    def test_metrics_endpoint_aggregates_per_view(self):
+        """メトリクスエンドポイントがビューごとのヒストグラムを返すことをテスト。"""
+        self.client.get(reverse('todo_list'))
+        self.client.post(reverse('todo_toggle', args=[self.todo.pk]))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE todo_request_duration_seconds histogram', body)
+        self.assertIn('todo_request_queries_count{view="todo_list"} 1', body)
+        self.assertIn('todo_request_queries_count{view="todo_toggle"} 1', body)
+        self.assertIn('todo_request_template_duration_seconds_bucket{view="todo_list",le="+Inf"} 1', body)
+        self.assertIn('todo_list_cache_hits_total', body)
+        self.assertNotRegex(body, r'todo_request_template_duration_seconds_sum\{view="todo_list"\} 0\n')
+    
+    def test_metrics_endpoint_access_control(self):
+        """許可されていない接続元やトークンなしでは403になることをテスト。"""
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.1')
+        self.assertEqual(response.status_code, 403)
+        with override_settings(TODO_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+    
+    @override_settings(TODO_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_not_recorded(self):
+        """サンプリングされなかったリクエストは記録されないことをテスト。"""
+        response = self.client.get(reverse('todo_list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('view="todo_list"', metrics_registry.render())
+    
+    @override_settings(ROOT_URLCONF=AsyncViewsURLConf)
+    async def test_async_view_queries_are_counted(self):
+        """非同期ビューでスレッド上で実行されたクエリも計測されることをテスト。"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('api_todo_list'))
+        db = self._server_timing(response)['db']
+        self.assertNotIn('desc="0 queries"', db)
+
+
+class DatabaseConnectionMetricsTestCase(TestCase):
+    """データベース接続とコネクションプールのメトリクスのテストケース。"""
+    
+    def test_counts_new_connections(self):
+        """新しく開いた接続の数が出力されることをテスト。"""
+        opened = request_metrics._connections_opened.get('default', 0)
+        connection_created.send(sender=type(connection), connection=connection)
+        lines = request_metrics.collect_database_metrics()
+        self.assertIn(f'todo_db_connections_opened_total{{alias="default"}} {opened + 1}', lines)
+        self.assertFalse(any(line.startswith('todo_db_pool_') for line in lines))
+    
+    def test_pool_usage_and_wait_time(self):
+        """プールを設定した接続の使用状況と待ち時間が出力されることをテスト。"""
+        class FakePool:
+            def get_stats(self):
+                return {'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+                        'requests_num': 120, 'requests_queued': 3, 'requests_wait_ms': 1500}
+        
+        class FakeConnection:
+            alias = 'default'
+            settings_dict = {'OPTIONS': {'pool': {'min_size': 2, 'max_size': 10}}}
+            pool = FakePool()
+        
+        with patch.object(request_metrics.connections, 'all', return_value=[FakeConnection()]):
+            lines = request_metrics.collect_database_metrics()
+        self.assertIn('todo_db_pool_size{alias="default"} 4', lines)
+        self.assertIn('todo_db_pool_available{alias="default"} 1', lines)
+        self.assertIn('todo_db_pool_requests_total{alias="default"} 120', lines)
+        self.assertIn('todo_db_pool_wait_seconds_total{alias="default"} 1.5', lines)
+        self.assertIn('todo_db_pool_requests_errors_total{alias="default"} 0', lines)
+    
+    def test_exposed_at_metrics_endpoint(self):
+        """メトリクスエンドポイントに接続のメトリクスが含まれることをテスト。"""
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, '# TYPE todo_db_connections_opened_total counter')
+
+
+# クエリ予算のシナリオで段階的に用意するTodoの件数
+QUERY_BUDGET_SEED_SIZES = (1, 100, 10_000)
+
+
+def query_budget(url_name, budget, method='get', args=(), data=None, content_type=None):
+    """URL名ごとにクエリ予算を宣言するテストデコレーター。
+    
+    テストは :class:`QueryBudgetTestMixin` を継承したクラスに定義します。
+    Todoを ``QUERY_BUDGET_SEED_SIZES`` の件数まで段階的に増やしながら
+    同じリクエストを送り、クエリ数が予算以内であること、件数によらず
+    一定であること（N+1になっていないこと）を検証します。デコレートした
+    メソッドは件数ごとのレスポンスを受け取り、内容を追加で検証できます。
+    
+    Args:
+        url_name: 対象のURL名。
+        budget: 1リクエストで許容するクエリ数の上限。
+        method: HTTPメソッド名（``'get'`` または ``'post'``）。
+        args: URLの位置引数を返す関数。テストケースを受け取ります。
+        data: リクエストのパラメータ、またはテストケースを受け取り
+            パラメータを返す関数。
+        content_type: リクエストボディのContent-Type（JSONを送る場合に指定）。
+    """
+    def decorator(test_method):
+        @functools.wraps(test_method)
+        def wrapper(self):
+            responses = self.assert_query_budget(url_name, budget, method, args, data, content_type)
+            test_method(self, responses)
+        wrapper.query_budget = (url_name, budget)
+        return wrapper
+    return decorator
+
+
+class QueryBudgetTestMixin:
+    """クエリ予算を検証するテストケースのミックスイン。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+        self.seeded = 0
+    
+    def seed(self, count):
+        """Todoの件数が ``count`` 件になるまで追加する。
+        
+        期限なし・期限切れ・期限間近・期限に余裕ありと、完了・未完了が
+        混ざるように作成し、通常の作成と同じく ``todos_changed`` を送信します。
+        """
+        now = timezone.now()
+        offsets = [None, timedelta(days=-1), timedelta(hours=12), timedelta(days=10)]
+        todos = [
+            Todo(
+                title=f'買い物 {i}',
+                description=f'メモ {i}',
+                user=self.user,
+                completed=i % 3 == 0,
+                due_date=None if offsets[i % 4] is None else now + offsets[i % 4],
+            )
+            for i in range(self.seeded, count)
+        ]
+        Todo.objects.bulk_create(todos)
+        send_todos_changed(self.user.pk, [todo.pk for todo in todos], ACTION_CREATED)
+        self.seeded = count
+        self.first_todo = Todo.objects.filter(user=self.user).order_by('id').first()
+    
+    def assert_query_budget(self, url_name, budget, method='get', args=(), data=None, content_type=None):
+        """件数を増やしながらリクエストし、クエリ数を検証する。
+        
+        Returns:
+            件数をキー、レスポンスを値とする辞書。
+        """
+        counts = {}
+        responses = {}
+        for size in QUERY_BUDGET_SEED_SIZES:
+            self.seed(size)
+            url = reverse(url_name, args=args(self) if callable(args) else args)
+            params = data(self) if callable(data) else data
+            extra = {'content_type': content_type} if content_type else {}
+            with CaptureQueriesContext(connection) as ctx:
+                response = getattr(self.client, method)(url, params, **extra)
+            self.assertLess(response.status_code, 400, f'{url_name} ({size}件)')
+            sql = '\n'.join(query['sql'] for query in ctx.captured_queries)
+            self.assertLessEqual(
+                len(ctx), budget,
+                f'{url_name} ({size}件) のクエリ数が予算{budget}を超えました:\n{sql}'
+            )
+            counts[size] = len(ctx)
+            responses[size] = response
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'{url_name} のクエリ数がTodoの件数に応じて増えています: {counts}'
+        )
+        return responses
+
+
+class TodoQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """各ビューのクエリ予算のテストケース。
+    
+    Todoが1件・100件・10,000件のいずれでもクエリ数が一定で、
+    予算以内であることをテストします。
+    """
+    
+    @query_budget('todo_list', 5)
+    def test_todo_list(self, responses):
+        """一覧ページのクエリ数をテスト。"""
+        self.assertTrue(responses[10_000].context['page'].has_next)
+    
+    @query_budget('todo_list', 5, data=lambda self: {'cursor': self.newest_cursor()})
+    def test_todo_list_next_page(self, responses):
+        """カーソルを指定した一覧ページのクエリ数をテスト。"""
+        self.assertTrue(responses[10_000].context['page'].has_previous)
+    
+    def newest_cursor(self):
+        """最新のTodoの次から始まるページのカーソルを返す。"""
+        newest = Todo.objects.filter(user=self.user).latest('created_at', 'id')
+        return Cursor(newest.created_at, newest.pk, DIRECTION_NEXT).encode()
+    
+    @query_budget('todo_card', 3, args=lambda self: [self.first_todo.pk])
+    def test_todo_card(self, responses):
+        """カード部分テンプレートのクエリ数をテスト。"""
+    
+    @query_budget('todo_toggle', 7, method='post', args=lambda self: [self.first_todo.pk])
+    def test_todo_toggle(self, responses):
+        """完了状態の切り替えのクエリ数をテスト（更新と通知を囲むSAVEPOINT・RELEASEを含む）。"""
+    
+    @query_budget('todo_search', 4, data={'q': '買い物'})
+    def test_todo_search(self, responses):
+        """検索ページのクエリ数をテスト。"""
+        self.assertTrue(responses[10_000].context['page'].has_next)
+    
+    @query_budget('api_todo_list', 4)
+    def test_api_todo_list(self, responses):
+        """一覧APIのクエリ数をテスト。"""
+    
+    @query_budget('api_todo_search', 4, data={'q': '買い物'})
+    def test_api_todo_search(self, responses):
+        """検索APIのクエリ数をテスト。"""
+    
+    @query_budget('api_todo_stats', 3)
+    def test_api_todo_stats(self, responses):
+        """集計APIのクエリ数をテスト（集計済みの1行を読むだけ）。"""
+        self.assertEqual(json.loads(responses[10_000].content)['total'], 10_000)
+    
+    @query_budget('api_todo_sync', 4, data=lambda self: {'since': SyncToken(0, timezone.now()).encode()})
+    def test_api_todo_sync(self, responses):
+        """差分同期APIのクエリ数をテスト（変更履歴は1回の上限件数まで読む）。"""
+        self.assertTrue(json.loads(responses[10_000].content)['has_more'])
+    
+    @query_budget('api_todo_batch', 17, method='post', content_type='application/json', data=lambda self: {
+        'operations': [
+            {'op': 'create', 'data': {'title': '新規'}, 'key': f'create-{self.seeded}'},
+            {'op': 'toggle', 'id': self.first_todo.pk},
+            {'op': 'update', 'id': self.first_todo.pk, 'data': {'title': '更新'}},
+        ]
+    })
+    def test_api_todo_batch(self, responses):
+        """バッチ書き込みAPIのクエリ数をテスト。"""
+    
+    @query_budget('api_todo_bulk', 8, method='post', content_type='application/json', data=lambda self: {
+        # 直前に追加した最新のTodoは完了済みなので、毎回1件が未完了に戻る
+        'action': 'reopen', 'ids': [self.first_todo.pk, Todo.objects.filter(user=self.user).latest('id').pk],
+    })
+    def test_api_todo_bulk(self, responses):
+        """一括操作APIのクエリ数をテスト。"""
+        for response in responses.values():
+            self.assertIn('updated', json.loads(response.content)['results'].values())
+    
+    @query_budget('todo_create', 7, method='post', data={'title': '新規', 'description': '', 'due_date': ''})
+    def test_todo_create(self, responses):
+        """作成のクエリ数をテスト。"""
+        for response in responses.values():
+            self.assertEqual(response.status_code, 302)
+    
+    @query_budget('todo_update', 8, method='post', args=lambda self: [self.first_todo.pk],
+                  data={'title': '更新', 'description': '', 'due_date': ''})
+    def test_todo_update(self, responses):
+        """更新のクエリ数をテスト。"""
+        for response in responses.values():
+            self.assertEqual(response.status_code, 302)
+    
+    @query_budget('todo_delete', 7, method='post', args=lambda self: [self.first_todo.pk])
+    def test_todo_delete(self, responses):
+        """削除のクエリ数をテスト（削除のたびに次の最古のTodoが対象になる）。"""
+        for response in responses.values():
+            self.assertEqual(response.status_code, 302)
+    
+    @query_budget('todo_import', 9, method='post', data=lambda self: {
+        'file': SimpleUploadedFile('todos.csv', 'title\nインポート1\nインポート2\n'.encode('utf-8')),
+    })
+    def test_todo_import(self, responses):
+        """インポートのクエリ数をテスト（1バッチ分）。"""
+        for response in responses.values():
+            self.assertEqual(response.context['report'].created, 2)
+
+
+@override_settings(ROOT_URLCONF=AsyncViewsURLConf)
+class TodoAsyncQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """非同期ビューのクエリ予算のテストケース。
+    
+    同期版と同じURL名・同じ予算で、非同期ビューのクエリ数をテストします。
+    """
+    
+    newest_cursor = TodoQueryBudgetTestCase.newest_cursor
+    test_todo_list = TodoQueryBudgetTestCase.test_todo_list
+    test_todo_list_next_page = TodoQueryBudgetTestCase.test_todo_list_next_page
+    test_todo_card = TodoQueryBudgetTestCase.test_todo_card
+    test_todo_toggle = TodoQueryBudgetTestCase.test_todo_toggle
+    test_api_todo_list = TodoQueryBudgetTestCase.test_api_todo_list
+    test_api_todo_search = TodoQueryBudgetTestCase.test_api_todo_search
+
+
+class TodoBenchmarkCommandTestCase(TestCase):
+    """ベンチマークの管理コマンドのテストケース。"""
+    
+    def _run(self, *args):
+        stdout = io.StringIO()
+        call_command('benchmark_todos', '--users', '2', '--todos', '5', '--requests', '4',
+                     '--warmup', '1', *args, stdout=stdout)
+        return stdout.getvalue()
+    
+    def test_saves_results_and_leaves_no_data(self):
+        """全シナリオの結果をJSONに保存し、作成したデータを残さないことをテスト。"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'result.json')
+            self._run('--output', path)
+            with open(path, encoding='utf-8') as stream:
+                result = json.load(stream)
+        self.assertEqual(list(result['scenarios']), hot_paths.SCENARIOS)
+        for summary in result['scenarios'].values():
+            self.assertEqual(summary['requests'], 4)
+            self.assertEqual(summary['errors'], 0)
+            self.assertLessEqual(summary['p50_ms'], summary['p95_ms'])
+            self.assertLessEqual(summary['p95_ms'], summary['p99_ms'])
+        self.assertFalse(User.objects.filter(username__startswith=hot_paths.USERNAME_PREFIX).exists())
+        self.assertFalse(Todo.objects.exists())
+    
+    def test_compare_flags_regressions(self):
+        """しきい値を超えて悪化した指標だけがリグレッションになることをテスト。"""
+        def result(p50, throughput, errors=0):
+            return {'scenarios': {'list': {'p50_ms': p50, 'p95_ms': p50, 'throughput': throughput,
+                                           'errors': errors}}}
+        rows = hot_paths.compare(result(10.0, 100.0), result(11.0, 70.0, errors=1), threshold=0.2)
+        flagged = {row['metric'] for row in rows if row['regression']}
+        self.assertEqual(flagged, {'throughput', 'errors'})
+    
+    def test_command_fails_on_regression(self):
+        """基準より遅い場合はコマンドがエラー終了することをテスト。"""
+        baseline = {'scenarios': {'toggle': {'p50_ms': 0.0001, 'p95_ms': 0.0001,
+                                             'throughput': 1e9, 'errors': 0}}}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baseline.json')
+            with open(path, 'w', encoding='utf-8') as stream:
+                json.dump(baseline, stream)
+            with self.assertRaisesMessage(CommandError, 'toggle.p50_ms'):
+                self._run('--scenarios', 'toggle', '--compare', path)
+    
+    def test_write_scenarios_send_only_valid_forms(self):
+        """作成・更新のリクエストが検証エラーにならない期限だけを送ることをテスト。"""
+        rng = random.Random(0)
+        now = timezone.now()
+        due_dates = [hot_paths.due_date_for(rng, now, allow_overdue=False) for _ in range(200)]
+        self.assertTrue(all(due_date is None or due_date > now for due_date in due_dates))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'result.json')
+            self._run('--scenarios', 'create', 'update', '--requests', '40', '--output', path)
+            with open(path, encoding='utf-8') as stream:
+                result = json.load(stream)
+        self.assertEqual([summary['errors'] for summary in result['scenarios'].values()], [0, 0])
+    
+    def test_unexpected_status_counts_as_error(self):
+        """作成で302以外（フォームの再表示の200など）が返るとエラーとして数えることをテスト。"""
+        class FormRedisplayTarget:
+            def request(self, *args):
+                return 200
+        
+        user = User.objects.create_user(username='bench', password='testpass123')
+        bench_user = hot_paths.BenchmarkUser(user=user, todo_ids=[1], deletable_ids=[])
+        result = hot_paths.run_scenario('create', [bench_user], [[FormRedisplayTarget()]],
+                                        requests=3, warmup=0, rng=random.Random(0))
+        self.assertEqual(result['errors'], 3)
+
+
+CACHED_AUTH_SETTINGS = {
+    'SESSION_ENGINE': 'todo.sessions',
+    'TODO_AUTH_USER_CACHE_TTL': 60,
+}
+
+
+class CachedAuthTestMixin:
+    """セッションとユーザーのキャッシュを空にするミックスイン。"""
+    
+    def setUp(self):
+        """キャッシュと保留中のセッションの書き込みを片付ける。"""
+        write_behind.flush()
+        caches['sessions'].clear()
+        user_cache.clear()
+        super().setUp()
+    
+    def tearDown(self):
+        """保留中のセッションを他のテストに持ち越さないよう書き込む。"""
+        write_behind.flush()
+        super().tearDown()
+
+
+@override_settings(**CACHED_AUTH_SETTINGS)
+class TodoCachedAuthQueryBudgetTestCase(CachedAuthTestMixin, QueryBudgetTestMixin, TestCase):
+    """セッションとユーザーがキャッシュにある場合のクエリ予算のテストケース。
+    
+    ``django_session`` と ``auth_user`` を読まず、Todoの操作に必要な
+    クエリだけになることをテストします。
+    """
+    
+    def setUp(self):
+        """ログイン後に1回リクエストしてユーザーをキャッシュに載せる。"""
+        super().setUp()
+        self.client.get(reverse('todo_list'))
+    
+    @query_budget('todo_toggle', 5, method='post', args=lambda self: [self.first_todo.pk])
+    def test_todo_toggle(self, responses):
+        """切り替えはSAVEPOINT・RELEASEの間のTodoのUPDATEと変更履歴・集計の書き込みだけになることをテスト。"""
+    
+    @query_budget('todo_card', 1, args=lambda self: [self.first_todo.pk])
+    def test_todo_card(self, responses):
+        """カード部分テンプレートはTodoの読み込みだけになることをテスト。"""
+    
+    def test_no_session_or_user_queries(self):
+        """キャッシュにヒットした場合にセッションとユーザーを読まないことをテスト。"""
+        self.seed(1)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('todo_toggle', args=[self.first_todo.pk]))
+        self.assertEqual(response.status_code, 200)
+        sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('django_session', sql)
+        self.assertNotIn('auth_user', sql)
+        self.assertTrue(ctx.captured_queries[0]['sql'].startswith('SAVEPOINT'))
+        self.assertTrue(ctx.captured_queries[1]['sql'].startswith('UPDATE "todo_todo"'))
+
+
+@override_settings(**CACHED_AUTH_SETTINGS)
+class CachedAuthenticationTestCase(CachedAuthTestMixin, TestCase):
+    """セッションの遅延書き込みとユーザーのキャッシュのテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.session_key = self.client.session.session_key
+    
+    def test_session_is_written_behind(self):
+        """ログイン時のセッションがまとめてデータベースに書き込まれることをテスト。"""
+        self.assertFalse(Session.objects.filter(session_key=self.session_key).exists())
+        self.assertGreaterEqual(write_behind.flush(), 1)
+        self.assertTrue(Session.objects.filter(session_key=self.session_key).exists())
+    
+    @override_settings(TODO_SESSION_WRITE_BEHIND_DELAY=0)
+    def test_session_is_flushed_at_end_of_request(self):
+        """保留時間を過ぎたセッションがリクエストの終了時に書き込まれることをテスト。"""
+        self.client.get(reverse('todo_list'))
+        self.assertEqual(len(write_behind), 0)
+        self.assertTrue(Session.objects.filter(session_key=self.session_key).exists())
+    
+    def test_pending_session_survives_cache_eviction(self):
+        """キャッシュから消えても、書き込み前のセッションでログインが保たれることをテスト。"""
+        caches['sessions'].clear()
+        response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.status_code, 200)
+    
+    def test_logged_out_session_is_not_resurrected(self):
+        """ログアウトしたセッションが古い保留中の書き込みで復活しないことをテスト。"""
+        stale = write_behind.get(self.session_key)
+        self.client.post(reverse('logout'))
+        # 他のプロセスのバッファに残っていた書き込みを再現する
+        write_behind.add(stale)
+        write_behind.flush()
+        self.assertFalse(Session.objects.filter(session_key=self.session_key).exists())
+        caches['sessions'].clear()
+        response = self.client.get(reverse('todo_list'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('todo_list')}")
+    
+    def test_password_change_invalidates_cached_user(self):
+        """パスワードの変更でキャッシュが無効化され、既存のセッションが使えなくなることをテスト。"""
+        self.client.get(reverse('todo_list'))
+        self.assertEqual(len(user_cache), 1)
+        self.user.set_password('newpass456')
+        self.user.save()
+        self.assertEqual(len(user_cache), 0)
+        response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.status_code, 302)
+    
+    def test_logout_invalidates_cached_user(self):
+        """ログアウトでユーザーがキャッシュから取り除かれることをテスト。"""
+        self.client.get(reverse('todo_list'))
+        self.client.post(reverse('logout'))
+        self.assertEqual(len(user_cache), 0)
+    
+    def test_cached_user_expires_after_ttl(self):
+        """TTLを過ぎたユーザーがデータベースから読み直されることをテスト。"""
+        todo = Todo.objects.create(title='テスト', user=self.user)
+        self.client.get(reverse('todo_list'))
+        with patch('todo.auth_backends.time.monotonic', return_value=time.monotonic() + 61):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse('todo_card', args=[todo.pk]))
+        self.assertIn('auth_user', ' '.join(query['sql'] for query in ctx.captured_queries))
+    
+    def test_cached_user_is_a_copy(self):
+        """リクエストで書き換えた属性がキャッシュに残らないことをテスト。"""
+        user_cache.set(self.user, 60)
+        user_cache.get(self.user.pk).first_name = '変更'
+        self.assertEqual(user_cache.get(self.user.pk).first_name, '')
+
+
+# テストで使う計算量を抑えたハッシャーの設定
+FAST_HASHER_SETTINGS = {
+    'TODO_SCRYPT_WORK_FACTOR': 2 ** 10,
+    'TODO_SCRYPT_PARALLELISM': 1,
+    'TODO_ARGON2_MEMORY_COST': 1024,
+}
+
+
+@override_settings(**FAST_HASHER_SETTINGS)
+class PasswordHashingTestCase(TestCase):
+    """パスワードハッシュのプロファイルとログイン時のアップグレードのテストケース。"""
+    
+    def setUp(self):
+        """PBKDF2でハッシュ化したユーザーを作成。"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+    
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'testuser', 'password': 'testpass123'})
+    
+    def test_scrypt_profile_upgrades_on_login(self):
+        """scryptのプロファイルでは、ログイン時にPBKDF2のハッシュが書き換えられることをテスト。"""
+        with override_settings(PASSWORD_HASHERS=[
+            'todo.hashers.ScryptPasswordHasher',
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        ]):
+            self.assertRedirects(self.login(), reverse('todo_list'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertIn('$1024$', self.user.password)
+    
+    @skipUnless(importlib.util.find_spec('argon2'), 'argon2-cffi がインストールされていません')
+    def test_argon2_parameter_change_upgrades_on_login(self):
+        """Argon2のパラメータを変更すると、次のログインで書き換えられることをテスト。"""
+        with override_settings(PASSWORD_HASHERS=['todo.hashers.Argon2PasswordHasher'], TODO_ARGON2_TIME_COST=1):
+            self.user.set_password('testpass123')
+            self.user.save()
+            self.assertIn('t=1', self.user.password)
+        with override_settings(PASSWORD_HASHERS=['todo.hashers.Argon2PasswordHasher'], TODO_ARGON2_TIME_COST=2):
+            self.assertRedirects(self.login(), reverse('todo_list'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$argon2id$'))
+        self.assertIn('m=1024,t=2,p=1', self.user.password)
+    
+    def test_preferred_hasher_follows_profile(self):
+        """選んだプロファイルのハッシャーが優先されることをテスト。"""
+        self.assertEqual(set(settings.TODO_PASSWORD_HASHER_PROFILES), {'argon2', 'scrypt', 'pbkdf2'})
+        self.assertEqual(settings.PASSWORD_HASHERS[0],
+                         settings.TODO_PASSWORD_HASHER_PROFILES[settings.TODO_PASSWORD_HASHER])
+
+
+@override_settings(ROOT_URLCONF=AsyncViewsURLConf)
+class AsyncLoginTestCase(TestCase):
+    """非同期のログインとハッシュ計算のプロセスプールのテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.addCleanup(password_hashers.shutdown_pool)
+    
+    def login(self, password='testpass123', username='testuser'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password})
+    
+    def test_login_without_pool(self):
+        """プールを使わない場合もログインできることをテスト。"""
+        self.assertRedirects(self.login(), reverse('todo_list'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+    
+    @override_settings(TODO_PASSWORD_HASH_WORKERS=1)
+    def test_login_with_pool_upgrades_hash(self):
+        """プールで検証し、古い方式のハッシュを書き換えることをテスト。"""
+        User.objects.filter(pk=self.user.pk).update(
+            password=make_password('testpass123', hasher='pbkdf2_sha1')
+        )
+        self.assertRedirects(self.login(), reverse('todo_list'), fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertIsNotNone(password_hashers.get_pool())
+    
+    @override_settings(TODO_PASSWORD_HASH_WORKERS=1)
+    def test_login_with_pool_rejects_invalid_credentials(self):
+        """誤ったパスワードや存在しないユーザーではログインできないことをテスト。"""
+        for response in (self.login(password='wrong'), self.login(username='nobody')):
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'ユーザー名またはパスワードが正しくありません。')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class TodoStatsTestCase(TestCase):
+    """ユーザーごとのTodoの件数の集計（TodoStats）のテストケース。"""
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        # 日付の境界をまたがないよう、基準時刻はUTCの正午に固定する
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    
+    def create(self, due=None, completed=False):
+        """基準時刻から ``due`` だけずらした期限のTodoを作成する。"""
+        return Todo.objects.create(
+            title='Todo', user=self.user, completed=completed,
+            due_date=None if due is None else self.now + due,
+        )
+    
+    def test_counts_match_due_status(self):
+        """件数と次の期限が ``with_due_status`` の判定と一致することをテスト。"""
+        self.create()
+        self.create(timedelta(days=-1))
+        self.create(timedelta(hours=-1))
+        self.create(timedelta(hours=2))
+        self.create(timedelta(hours=1), completed=True)
+        self.create(timedelta(days=3))
+        refresh_stats(self.user.pk, self.now)
+        stats = TodoStats.objects.get(user=self.user)
+        self.assertEqual(stats.as_dict(), {'total': 6, 'open': 5, 'overdue': 2, 'due_today': 1})
+        self.assertEqual(stats.next_due_at, self.now + timedelta(hours=2))
+        statuses = Todo.objects.filter(user=self.user, completed=False).with_due_status(self.now)
+        self.assertEqual(statuses.filter(due_status='overdue').count(), stats.overdue)
+        self.assertEqual(statuses.filter(due_status='due_today').count(), stats.due_today)
+    
+    def test_kept_current_on_changes(self):
+        """作成・切り替え・一括操作で集計の行が更新されることをテスト。"""
+        todo = self.create()
+        self.assertEqual(TodoStats.objects.get(user=self.user).open, 1)
+        self.client.post(reverse('todo_toggle', args=[todo.pk]))
+        self.assertEqual(TodoStats.objects.get(user=self.user).open, 0)
+        other = self.create()
+        apply_bulk_action(self.user.pk, 'complete', [other.pk])
+        stats = TodoStats.objects.get(user=self.user)
+        self.assertEqual((stats.total, stats.open), (2, 0))
+    
+    def test_lock_creates_empty_row_and_keeps_existing(self):
+        """集計の行のロックが、行がなければ空の集計を作成し、既存の行は変更しないことをテスト。"""
+        TodoStats.objects.filter(user=self.user).delete()
+        _lock_stats_row(self.user.pk, self.now)
+        stats = TodoStats.objects.get(user=self.user)
+        self.assertEqual(stats.as_dict(), {'total': 0, 'open': 0, 'overdue': 0, 'due_today': 0})
+        self.create()
+        computed_at = TodoStats.objects.get(user=self.user).computed_at
+        _lock_stats_row(self.user.pk, self.now + timedelta(hours=1))
+        stats = TodoStats.objects.get(user=self.user)
+        self.assertEqual((stats.total, stats.open, stats.computed_at), (1, 1, computed_at))
+    
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQLの行ロックのテスト')
+    def test_row_locked_before_recount(self):
+        """PostgreSQLでは集計の前に別の文で集計の行をロックすることをテスト。"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.create()
+        sqls = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "todo_todostats"')]
+        self.assertEqual(len(sqls), 2)
+        self.assertIn('VALUES', sqls[0])
+        self.assertIn('COUNT(', sqls[1])
+    
+    def test_delete_marks_stale_and_recomputes_on_read(self):
+        """削除で集計が古いものになり、読み込み時に再集計されることをテスト。"""
+        todo = self.create()
+        self.create()
+        todo.delete()
+        self.assertTrue(TodoStats.objects.get(user=self.user).is_stale())
+        self.assertEqual(get_stats(self.user.pk).total, 1)
+        self.user.delete()
+        self.assertFalse(TodoStats.objects.exists())
+    
+    def test_recomputes_when_due_date_passes(self):
+        """次の期限を過ぎた読み込みで期限切れの件数が更新されることをテスト。"""
+        self.create(timedelta(hours=1))
+        refresh_stats(self.user.pk, self.now)
+        self.assertEqual(get_stats(self.user.pk, self.now).overdue, 0)
+        later = self.now + timedelta(hours=2)
+        with self.assertNumQueries(3):
+            stats = get_stats(self.user.pk, later)
+        self.assertEqual(stats.overdue, 1)
+        with self.assertNumQueries(1):
+            get_stats(self.user.pk, later)
+    
+    def test_reconcile_command(self):
+        """古い集計だけを再集計し、``--all`` でずれを修正することをテスト。"""
+        self.create(timedelta(hours=1))
+        other = User.objects.create_user(username='other', password='testpass123')
+        Todo.objects.create(title='Todo', user=other)
+        refresh_stats(self.user.pk, self.now)
+        self.assertEqual(reconcile_stats(self.now + timedelta(hours=2)), 1)
+        self.assertEqual(TodoStats.objects.get(user=self.user).overdue, 1)
+        
+        # シグナルを送らない更新は --all で修正する
+        Todo.objects.filter(user=other).update(completed=True)
+        stdout = io.StringIO()
+        call_command('reconcile_todo_stats', '--all', stdout=stdout)
+        self.assertIn('2人のユーザーの集計を再集計しました', stdout.getvalue())
+        self.assertEqual(TodoStats.objects.get(user=other).open, 0)
+    
+    def test_list_page_and_api(self):
+        """一覧ページのヘッダーと集計APIに件数が表示されることをテスト。"""
+        self.create(timedelta(days=-1))
+        self.create(completed=True)
+        response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.context['stats'].as_dict(),
+                         {'total': 2, 'open': 1, 'overdue': 1, 'due_today': 0})
+        self.assertContains(response, 'id="todo-stats"')
+        response = self.client.get(reverse('api_todo_stats'))
+        self.assertEqual(response.json(), {'total': 2, 'open': 1, 'overdue': 1, 'due_today': 0})
+
+
+@override_settings(TODO_PAGE_SIZE=2)
+class TodoListFilterTestCase(TestCase):
+    """一覧の絞り込みと並び替えのテストケース。"""
+    
+    _explain = TodoQueryPlanTestCase._explain
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        # 日付の境界をまたがないよう、基準時刻はUTCの正午に固定する
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        offsets = [None, timedelta(days=-1), timedelta(hours=-1), timedelta(hours=1),
+                   timedelta(days=2), timedelta(days=10), None]
+        self.todos = [
+            Todo.objects.create(
+                title=f'Todo {i}', user=self.user, completed=i == 5,
+                due_date=None if offset is None else self.now + offset,
+            )
+            for i, offset in enumerate(offsets)
+        ]
+    
+    def _filtered_ids(self, query, now=None):
+        queryset = parse_filters(query).apply(Todo.objects.filter(user=self.user), now or self.now)
+        return set(queryset.values_list('pk', flat=True))
+    
+    def _walk(self, url_name, query):
+        """次ページのカーソルを辿って全ページのTodoのIDと各ページを返す。"""
+        ids, pages, cursor = [], [], None
+        # カーソルが進まない不具合で無限に辿らないよう、ページ数に上限を設ける
+        for _ in range(len(self.todos) + 1):
+            params = dict(query, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get(reverse(url_name), params).json()
+            pages.append(data)
+            ids.extend(todo['id'] for todo in data['todos'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids, pages
+        self.fail('最終ページに到達しませんでした')
+    
+    def test_due_status_filter_matches_get_due_status(self):
+        """期限ステータスの絞り込みが ``get_due_status`` の判定と一致することをテスト。"""
+        for status in ('overdue', 'due_today', 'due_soon', 'normal', 'no_due_date'):
+            expected = {todo.pk for todo in self.todos if todo.get_due_status(self.now) == status}
+            self.assertTrue(expected, status)
+            self.assertEqual(self._filtered_ids({'due': status}), expected, status)
+    
+    def test_completed_and_range_filters(self):
+        """完了状態と期限日時の範囲で絞り込めることをテスト。"""
+        self.assertEqual(self._filtered_ids({'completed': 'true'}), {self.todos[5].pk})
+        self.assertEqual(len(self._filtered_ids({'completed': 'false'})), 6)
+        query = {'due_after': self.now.isoformat(), 'due_before': (self.now + timedelta(days=3)).isoformat()}
+        self.assertEqual(self._filtered_ids(query), {self.todos[3].pk, self.todos[4].pk})
+        day = (self.now - timedelta(days=1)).date().isoformat()
+        self.assertEqual(self._filtered_ids({'due_before': day}), set())
+        self.assertEqual(self._filtered_ids({'due_after': day, 'due_before': self.now.date().isoformat()}),
+                         {self.todos[1].pk})
+    
+    def test_sort_by_due_date_with_nulls_last(self):
+        """期限順の一覧が期限なしを最後にして前後のページを辿れることをテスト。"""
+        expected = [self.todos[i].pk for i in (1, 2, 3, 4, 5, 0, 6)]
+        ids, pages = self._walk('api_todo_list', {'sort': 'due'})
+        self.assertEqual(ids, expected)
+        # 最後のページから前のページを辿ると、同じページ分割になる
+        back, cursor = [], pages[-1]['previous_cursor']
+        while cursor:
+            data = self.client.get(reverse('api_todo_list'), {'sort': 'due', 'cursor': cursor}).json()
+            back = [todo['id'] for todo in data['todos']] + back
+            cursor = data['previous_cursor']
+        self.assertEqual(back + [todo['id'] for todo in pages[-1]['todos']], expected)
+    
+    def test_filtered_sort_skips_no_due_date_query(self):
+        """期限の範囲で絞り込んだ期限順の一覧では期限なしの行を問い合わせないことをテスト。"""
+        filters = parse_filters({'sort': 'due', 'due': 'overdue'})
+        paginator = filters.paginator(Todo.objects.filter(user=self.user), self.now)
+        with self.assertNumQueries(1):
+            page = paginator.page(None)
+        self.assertEqual([todo.pk for todo in page], [self.todos[1].pk, self.todos[2].pk])
+    
+    def test_list_page_keeps_filters_in_pagination_links(self):
+        """一覧ページのページ送りのリンクに絞り込みの条件が引き継がれることをテスト。"""
+        response = self.client.get(reverse('todo_list'), {'completed': 'false', 'sort': 'due'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([todo.pk for todo in response.context['page']], [self.todos[1].pk, self.todos[2].pk])
+        self.assertContains(response, '?completed=false&amp;sort=due&amp;cursor=')
+        response = self.client.get(reverse('todo_list'), {'due': 'overdue', 'completed': 'true'})
+        self.assertContains(response, '条件に一致するTodoがありません。')
+    
+    def test_invalid_filters_are_rejected(self):
+        """不正な条件は400になることをテスト。"""
+        for query in ({'completed': 'maybe'}, {'due': 'later'}, {'sort': 'title'}, {'due_after': 'tomorrow'}):
+            with self.assertRaises(InvalidFilter):
+                parse_filters(query)
+            self.assertEqual(self.client.get(reverse('todo_list'), query).status_code, 400)
+            response = self.client.get(reverse('api_todo_list'), query)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+    
+    def test_filtered_queries_use_indexes(self):
+        """絞り込み・期限順の一覧が対応するインデックスを使うことをテスト。"""
+        cases = [
+            ({'completed': 'false'}, 'todo_user_done_created_idx'),
+            ({'sort': 'due'}, 'todo_user_due_idx'),
+            ({'sort': 'due', 'completed': 'false'}, 'todo_user_open_due_idx'),
+            ({'due': 'overdue', 'completed': 'false'}, 'todo_user_open_due_idx'),
+        ]
+        for query, index_name in cases:
+            paginator = parse_filters(query).paginator(Todo.objects.filter(user=self.user), self.now)
+            for queryset in paginator._segments(None):
+                sql, params = queryset[:3].query.sql_with_params()
+                plan = self._explain(sql, params)
+                self.assertIn(index_name, plan, query)
+                self.assertNotIn('SCAN todo_todo', plan, query)
+
+
+@override_settings(ROOT_URLCONF=AsyncViewsURLConf, TODO_PAGE_SIZE=2)
+class AsyncTodoListFilterTestCase(TodoListFilterTestCase):
+    """非同期ビューでの一覧の絞り込みと並び替えのテストケース。"""
+
+
+class RecordingSender(reminders.BaseSender):
+    """送信したバッチを記録し、指定した回目の送信で失敗する送信先。"""
+    
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+    
+    def send_messages(self, reminder_list):
+        if len(self.batches) + 1 == self.fail_on:
+            self.fail_on = None
+            raise RuntimeError('送信に失敗しました')
+        self.batches.append([(reminder.kind, reminder.todo_id) for reminder in reminder_list])
+
+
+@override_settings(TODO_REMINDER_SENDER='todo.reminders.MemorySender')
+class ReminderSchedulerTestCase(TestCase):
+    """期限のリマインダーのスケジューラーのテストケース。"""
+    
+    _explain = TodoQueryPlanTestCase._explain
+    
+    def setUp(self):
+        """テスト用の初期データを設定。"""
+        reminders.outbox.clear()
+        self.addCleanup(reminders.outbox.clear)
+        self.user = User.objects.create_user(username='testuser', password='testpass123', email='test@example.com')
+        self.now = timezone.now()
+    
+    def create(self, due, completed=False):
+        """基準時刻から ``due`` だけずらした期限のTodoを作成する。"""
+        return Todo.objects.create(title='Todo', user=self.user, completed=completed, due_date=self.now + due)
+    
+    def test_todos_already_past_threshold_are_reminded(self):
+        """しきい値の内側で作成・変更したTodoにも次回の実行で送ることをテスト。"""
+        due_soon = self.create(timedelta(hours=1))
+        self.assertEqual(reminders.run_tick(self.now), {'overdue': 0, 'due_soon': 1})
+        overdue = self.create(timedelta(hours=-1))
+        self.assertEqual(reminders.run_tick(self.now), {'overdue': 1, 'due_soon': 0})
+        self.assertEqual([(r.kind, r.todo_id) for r in reminders.outbox],
+                         [('due_soon', due_soon.pk), ('overdue', overdue.pk)])
+        # 期限を変更すると新しい期限に対して改めて送る
+        due_soon.due_date = self.now + timedelta(days=2)
+        due_soon.save()
+        self.assertEqual(reminders.run_tick(self.now), {'overdue': 0, 'due_soon': 1})
+        self.assertEqual(reminders.run_tick(self.now), {'overdue': 0, 'due_soon': 0})
+    
+    def test_sends_once_when_threshold_is_crossed(self):
+        """しきい値を越えた未完了のTodoにだけ、1回だけ送ることをテスト。"""
+        overdue = self.create(timedelta(hours=1))
+        self.create(timedelta(hours=1), completed=True)
+        due_soon = self.create(DUE_SOON_WINDOW + timedelta(hours=1))
+        self.create(DUE_SOON_WINDOW + timedelta(hours=3))
+        later = self.now + timedelta(hours=2)
+        self.assertEqual(reminders.run_tick(later), {'overdue': 1, 'due_soon': 1})
+        self.assertEqual({(r.kind, r.todo_id) for r in reminders.outbox},
+                         {('overdue', overdue.pk), ('due_soon', due_soon.pk)})
+        self.assertEqual(reminders.outbox[0].email, 'test@example.com')
+        self.assertEqual(reminders.run_tick(later), {'overdue': 0, 'due_soon': 0})
+        self.assertEqual(len(reminders.outbox), 2)
+    
+    def test_batches_resume_after_failure(self):
+        """バッチごとに送信済みを記録し、失敗したバッチから再送することをテスト。"""
+        todos = [self.create(timedelta(minutes=10)) for _ in range(3)] + [self.create(timedelta(minutes=20))
+                                                                          for _ in range(2)]
+        later = self.now + timedelta(hours=1)
+        sender = RecordingSender(fail_on=2)
+        with self.assertRaises(RuntimeError):
+            reminders.send_reminders('overdue', later, batch_size=2, sender=sender)
+        self.assertEqual(reminders.send_reminders('overdue', later, batch_size=2, sender=sender), 3)
+        self.assertEqual([len(batch) for batch in sender.batches], [2, 2, 1])
+        sent = [todo_id for batch in sender.batches for _, todo_id in batch]
+        self.assertEqual(sent, [todo.pk for todo in todos])
+    
+    def test_sends_outside_transaction_after_marking(self):
+        """送信済みを記録したトランザクションを終えてから送信し、失敗時は記録を取り消すことをテスト。"""
+        todo = self.create(timedelta(minutes=-10))
+        Todo.objects.filter(pk=todo.pk).update(due_soon_reminded_for=todo.due_date)
+        depth = len(connection.savepoint_ids)
+        observed = []
+        
+        class ObservingSender(reminders.BaseSender):
+            def send_messages(self, reminder_list):
+                observed.append((len(connection.savepoint_ids),
+                                 Todo.objects.filter(pk=todo.pk, overdue_reminded_for__isnull=False).exists()))
+                raise RuntimeError('送信に失敗しました')
+        
+        with self.assertRaises(RuntimeError):
+            reminders.send_reminders('overdue', self.now, sender=ObservingSender())
+        self.assertEqual(observed, [(depth, True)])
+        todo.refresh_from_db()
+        self.assertIsNone(todo.overdue_reminded_for)
+        # 元から送信済みだった期限間近の記録は残す
+        self.assertEqual(todo.due_soon_reminded_for, todo.due_date)
+    
+    def test_edit_keeps_markers_recorded_after_loading(self):
+        """編集の保存が、読み込んだ後に記録された送信済みの期限を上書きしないことをテスト。"""
+        due = (self.now + timedelta(hours=1)).replace(second=0, microsecond=0)
+        todo = Todo.objects.create(title='Todo', user=self.user, due_date=due)
+        full_clean = TodoForm.full_clean
+        
+        def mark_while_editing(form):
+            # フォームがTodoを読み込んだ後、保存する前にスケジューラーが送信した状況を再現する
+            reminders.send_reminders('due_soon', self.now)
+            full_clean(form)
+        
+        self.client.login(username='testuser', password='testpass123')
+        with patch.object(TodoForm, 'full_clean', mark_while_editing):
+            response = self.client.post(reverse('todo_update', args=[todo.pk]), {
+                'title': '編集後', 'description': '',
+                'due_date': timezone.localtime(due).strftime('%Y-%m-%d %H:%M:%S'),
+            })
+        self.assertRedirects(response, reverse('todo_list'))
+        todo.refresh_from_db()
+        self.assertEqual((todo.title, todo.due_soon_reminded_for), ('編集後', due))
+        self.assertEqual(reminders.run_tick(self.now), {'overdue': 0, 'due_soon': 0})
+    
+    def test_pending_query_uses_partial_index(self):
+        """未送信のTodoの問い合わせが種類ごとの部分インデックスを使うことをテスト。"""
+        for kind in reminders.THRESHOLDS:
+            with self.subTest(kind=kind):
+                queryset = reminders._pending(kind, self.now + timedelta(hours=1))[:500]
+                sql, params = queryset.query.sql_with_params()
+                plan = self._explain(sql, params)
+                self.assertIn(f'todo_{kind}_pending_idx', plan)
+                self.assertNotIn('SCAN todo_todo', plan)
+    
+    def test_command_writes_to_file(self):
+        """コマンドを1回実行し、ファイルの送信先に書き出すことをテスト。"""
+        todo = self.create(timedelta(minutes=-30))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'reminders.ndjson')
+            stdout = io.StringIO()
+            with override_settings(TODO_REMINDER_SENDER='todo.reminders.FileSender', TODO_REMINDER_FILE_PATH=path):
+                call_command('run_reminder_scheduler', '--once', stdout=stdout)
+            with open(path, encoding='utf-8') as stream:
+                lines = [json.loads(line) for line in stream]
+        self.assertIn('overdue 1件', stdout.getvalue())
+        self.assertEqual(len(lines), 1)
+        self.assertEqual((lines[0]['kind'], lines[0]['todo_id'], lines[0]['username']),
+                         ('overdue', todo.pk, 'testuser'))
+    
+    def test_command_keeps_running_after_sender_failure(self):
+        """送信先の例外をログに記録し、次の実行で再試行を続けることをテスト。"""
+        stdout = io.StringIO()
+        run_tick = Mock(side_effect=[FileNotFoundError('reminders.ndjson'), {'overdue': 1, 'due_soon': 0},
+                                     KeyboardInterrupt])
+        with patch('todo.management.commands.run_reminder_scheduler.run_tick', run_tick), patch('signal.signal'):
+            with self.assertLogs('todo.management.commands.run_reminder_scheduler', 'ERROR') as logs:
+                call_command('run_reminder_scheduler', '--interval', '0', stdout=stdout)
+        self.assertEqual(run_tick.call_count, 3)
+        self.assertIn('FileNotFoundError', logs.output[0])
+        self.assertIn('overdue 1件', stdout.getvalue())
+    
+    def test_console_sender(self):
+        """コンソールの送信先が1件1行で書き出すことをテスト。"""
+        stream = io.StringIO()
+        reminder = reminders.Reminder('due_soon', 1, self.user.pk, 'testuser', '', '買い物', self.now)
+        reminders.ConsoleSender(stream).send_messages([reminder])
+        self.assertEqual(stream.getvalue(), f'[due_soon] testuser: 買い物（期限: {self.now.isoformat()}）\n')
+
+
+class ProdSettingsTestCase(TestCase):
+    """本番用の設定のテストケース。"""
+    
+    def _load(self, **env):
+        """環境変数を指定して本番用の設定モジュールを読み込み直す。"""
+        env.setdefault('DJANGO_SECRET_KEY', 'test')
+        with patch.dict(os.environ, env):
+            sys.modules.pop('todoproject.settings.prod', None)
+            try:
+                return importlib.import_module('todoproject.settings.prod')
+            finally:
+                sys.modules.pop('todoproject.settings.prod', None)
+    
+    def test_events_disabled_with_multiple_asgi_workers(self):
+        """複数のASGIワーカーでプロセス内のブローカーのままならライブ更新を無効にすることをテスト。"""
+        self.assertFalse(self._load(APP_SERVER='asgi', WEB_CONCURRENCY='4').TODO_EVENTS_ENABLED)
+        self.assertTrue(self._load(APP_SERVER='asgi', WEB_CONCURRENCY='1').TODO_EVENTS_ENABLED)
+        self.assertTrue(self._load(APP_SERVER='wsgi', WEB_CONCURRENCY='4').TODO_EVENTS_ENABLED)
+    
+    def test_events_explicitly_enabled_with_multiple_asgi_workers_is_rejected(self):
+        """複数のASGIワーカーでプロセス内のブローカーのまま明示的に有効にするとエラーになることをテスト。"""
+        with self.assertRaises(ImproperlyConfigured):
+            self._load(APP_SERVER='asgi', WEB_CONCURRENCY='4', TODO_EVENTS_ENABLED='true')
+    
+    def test_postgres_broker_with_multiple_asgi_workers(self):
+        """PostgreSQLでは複数のASGIワーカーでLISTEN/NOTIFYのブローカーに切り替えることをテスト。"""
+        with patch.dict(base_settings.DATABASES['default'], ENGINE='django.db.backends.postgresql'):
+            prod = self._load(APP_SERVER='asgi', WEB_CONCURRENCY='4', TODO_EVENTS_ENABLED='true')
+        self.assertEqual(prod.TODO_EVENT_BROKER, 'todo.broker.PostgresBroker')
+        self.assertTrue(prod.TODO_EVENTS_ENABLED)
+    
+    def test_process_local_list_cache_disabled_with_multiple_workers(self):
+        """複数ワーカーでワーカーごとの一覧キャッシュのままならキャッシュを無効にすることをテスト。"""
+        locmem = 'django.core.cache.backends.locmem.LocMemCache'
+        shared = 'django.core.cache.backends.db.DatabaseCache'
+        with patch.dict(base_settings.CACHES['todo_list'], BACKEND=locmem):
+            self.assertEqual(self._load(WEB_CONCURRENCY='4').CACHES['todo_list']['BACKEND'],
+                             'django.core.cache.backends.dummy.DummyCache')
+            self.assertEqual(self._load(WEB_CONCURRENCY='1').CACHES['todo_list']['BACKEND'], locmem)
+            self.assertEqual(base_settings.CACHES['todo_list']['BACKEND'], locmem)
+        with patch.dict(base_settings.CACHES['todo_list'], BACKEND=shared):
+            self.assertEqual(self._load(WEB_CONCURRENCY='4').CACHES['todo_list']['BACKEND'], shared)
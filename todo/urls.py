@@ -1,13 +1,41 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
-urlpatterns = [
+# ログイン・一覧・切り替え・JSON API・エクスポートは同期版と非同期版を同じURL名で提供する
+sync_urlpatterns = [
     path('', views.todo_list, name='todo_list'),
+    path('toggle/<int:pk>/', views.todo_toggle, name='todo_toggle'),
+    path('card/<int:pk>/', views.todo_card, name='todo_card'),
+    path('api/todos/', api.todo_list_api, name='api_todo_list'),
+    path('api/todos/search/', api.todo_search_api, name='api_todo_search'),
+    path('export/', views.todo_export, name='todo_export'),
+    path('login/', views.login_view, name='login'),
+]
+
+async_urlpatterns = [
+    path('', async_views.todo_list, name='todo_list'),
+    path('toggle/<int:pk>/', async_views.todo_toggle, name='todo_toggle'),
+    path('card/<int:pk>/', async_views.todo_card, name='todo_card'),
+    path('api/todos/', async_views.todo_list_api, name='api_todo_list'),
+    path('api/todos/search/', async_views.todo_search_api, name='api_todo_search'),
+    path('export/', async_views.todo_export, name='todo_export'),
+    path('login/', async_views.login_view, name='login'),
+]
+
+common_urlpatterns = [
     path('create/', views.todo_create, name='todo_create'),
     path('update/<int:pk>/', views.todo_update, name='todo_update'),
     path('delete/<int:pk>/', views.todo_delete, name='todo_delete'),
-    path('toggle/<int:pk>/', views.todo_toggle, name='todo_toggle'),
-    path('login/', views.login_view, name='login'),
+    path('search/', views.todo_search, name='todo_search'),
+    path('import/', views.todo_import, name='todo_import'),
+    path('events/', async_views.todo_events, name='todo_events'),
+    path('api/todos/bulk/', api.todo_bulk_api, name='api_todo_bulk'),
+    path('api/todos/batch/', api.todo_batch_api, name='api_todo_batch'),
+    path('api/todos/stats/', api.todo_stats_api, name='api_todo_stats'),
+    path('api/sync/', api.todo_sync_api, name='api_todo_sync'),
     path('register/', views.register_view, name='register'),
     path('logout/', views.logout_view, name='logout'),
-]
\ No newline at end of file
+]
+
+urlpatterns = (async_urlpatterns if settings.TODO_ASYNC_VIEWS else sync_urlpatterns) + common_urlpatterns
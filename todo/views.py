@@ -4,15 +4,32 @@
 ユーザー認証とTodoのCRUD操作を処理します。
 """
 
+import io
 from typing import Optional
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.db import transaction
+from django.http import (
+    Http404, HttpRequest, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect,
+    JsonResponse, StreamingHttpResponse,
+)
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition, require_GET
+from django.views.decorators.vary import vary_on_cookie
 from .models import Todo
-from .forms import TodoForm
+from .forms import TodoForm, TodoImportForm
+from . import cache as list_cache
+from .conditional import list_etag, list_last_modified
+from .signals import ACTION_TOGGLED, send_todos_changed
+from .export import CONTENT_TYPES, EXPORTERS, FORMAT_CSV
+from .importer import DEFAULT_ENCODING, detect_format, import_todos, iter_records
+from .filters import InvalidFilter, parse_filters
+from .search import parse_page_number, search_todos
+from .stats import get_stats
 
 
 def login_view(request: HttpRequest) -> HttpResponse:
@@ -81,20 +98,47 @@ def logout_view(request: HttpRequest) -> HttpResponseRedirect:
 
 
 @login_required
+@vary_on_cookie
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
 def todo_list(request: HttpRequest) -> HttpResponse:
     """ログイン中のユーザーのTodo一覧を表示するビュー。
     
-    現在のユーザーに属するすべてのTodoを取得し、
-    一覧ページとして表示します。
+    現在のユーザーに属するTodoを ``(created_at, id)`` の降順で
+    キーセットページネーションし、``cursor`` クエリパラメータで
+    指定されたページを表示します。期限ステータスはSQL側で
+    1つの基準時刻を使って計算します。完了状態・期限ステータス・
+    期限日時の範囲での絞り込みと期限順の並び替えは :mod:`todo.filters`
+    のクエリパラメータで指定します。
+    
+    一覧部分の描画結果はユーザーごとにキャッシュされ、Todoが
+    変更されるまではデータベースへの問い合わせを行いません。
+    また、ETag・Last-Modifiedが一致する条件付きGETには描画せずに
+    ``304 Not Modified`` を返します。ヘッダーの件数は集計済みの
+    :class:`~todo.models.TodoStats` を読み込むだけで表示します。
     
     Args:
         request: HTTPリクエストオブジェクト。
         
     Returns:
         Todo一覧ページのレンダリング結果。
+        絞り込みの条件が不正な場合は ``400 Bad Request``。
     """
-    todos = Todo.objects.filter(user=request.user)
-    return render(request, 'todo/todo_list.html', {'todos': todos})
+    try:
+        filters = parse_filters(request.GET)
+    except InvalidFilter as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    def render_items() -> str:
+        page = filters.paginator(Todo.objects.filter(user=request.user)).get_page(request.GET.get('cursor'))
+        return render_to_string('todo/todo_list_items.html', {'todos': page, 'page': page, 'filters': filters},
+                                request)
+
+    list_html = list_cache.get_or_render(request.user.pk, request.GET.urlencode(), render_items)
+    return render(request, 'todo/todo_list.html', {
+        'list_html': mark_safe(list_html),
+        'stats': get_stats(request.user.pk),
+        'filters': filters,
+    })
 
 
 @login_required
@@ -146,7 +190,10 @@ def todo_update(request: HttpRequest, pk: int) -> HttpResponse:
     if request.method == 'POST':
         form = TodoForm(request.POST, instance=todo)
         if form.is_valid():
-            form.save()
+            todo = form.save(commit=False)
+            # 読み込んだ後にリマインダーのスケジューラーが記録した送信済みの期限などを
+            # 上書きしないよう、フォームで編集する列と更新日時だけを保存する
+            todo.save(update_fields=[*TodoForm.Meta.fields, 'updated_at'])
             messages.success(request, 'Todoが更新されました。')
             return redirect('todo_list')
     else:
@@ -160,6 +207,8 @@ def todo_delete(request: HttpRequest, pk: int) -> HttpResponse:
     
     指定されたIDのTodoを取得し、削除確認ページを表示します。
     現在のユーザーが所有するTodoのみ削除可能です。
+    AJAXリクエスト（``X-Requested-With: XMLHttpRequest``）の場合は
+    リダイレクトせずにJSONレスポンスを返します。
     
     Args:
         request: HTTPリクエストオブジェクト。
@@ -167,7 +216,8 @@ def todo_delete(request: HttpRequest, pk: int) -> HttpResponse:
         
     Returns:
         削除確認ページのレンダリング結果、
-        または成功時はTodo一覧ページへのリダイレクト。
+        または成功時はTodo一覧ページへのリダイレクト
+        （AJAXの場合は ``{'deleted': True}`` のJSONレスポンス）。
                      
     Raises:
         Http404: 指定されたTodoが存在しない、または現在のユーザーが所有していない場合。
@@ -175,6 +225,8 @@ def todo_delete(request: HttpRequest, pk: int) -> HttpResponse:
     todo = get_object_or_404(Todo, pk=pk, user=request.user)
     if request.method == 'POST':
         todo.delete()
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'deleted': True})
         messages.success(request, 'Todoが削除されました。')
         return redirect('todo_list')
     return render(request, 'todo/todo_confirm_delete.html', {'todo': todo})
@@ -184,8 +236,12 @@ def todo_delete(request: HttpRequest, pk: int) -> HttpResponse:
 def todo_toggle(request: HttpRequest, pk: int) -> JsonResponse:
     """Todoの完了状態を切り替えるビュー。
     
-    指定されたIDのTodoの完了状態を反転し、
-    JSONレスポンスで新しい状態を返します。
+    指定されたIDのTodoの完了状態を1文のUPDATEで反転し、
+    JSONレスポンスで新しい状態を返します。読み取りと保存を
+    分けないため、複数のタブから同時に切り替えても更新が失われず、
+    タイトルなど他のフィールドを上書きすることもありません。
+    更新と変更通知は1つのトランザクションで行うため、通知の受信側が
+    失敗した場合は切り替えも取り消されます。
     
     Args:
         request: HTTPリクエストオブジェクト。
@@ -199,7 +255,114 @@ def todo_toggle(request: HttpRequest, pk: int) -> JsonResponse:
         Http404: 指定されたTodoが存在しない、または現在のユーザーが所有していない場合。
     """
     if request.method == 'POST':
-        todo = get_object_or_404(Todo, pk=pk, user=request.user)
-        todo.completed = not todo.completed
-        todo.save()
-        return JsonResponse({'completed': todo.completed})
+        with transaction.atomic():
+            completed = Todo.objects.toggle_completed(pk, request.user.pk)
+            if completed is not None:
+                send_todos_changed(request.user.pk, [pk], ACTION_TOGGLED)
+        if completed is None:
+            raise Http404('Todoが見つかりません。')
+        return JsonResponse({'completed': completed})
+
+
+@login_required
+def todo_card(request: HttpRequest, pk: int) -> HttpResponse:
+    """1件のTodoのカード部分だけを描画するビュー。
+    
+    一覧ページのJavaScriptが、完了状態の切り替え後に該当カードだけを
+    差し替えるために使用します。一覧全体を再取得しないため、
+    応答時間はTodoの件数に依存しません。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        pk: 描画するTodoの主キー。
+        
+    Returns:
+        Todoカードの部分テンプレートのレンダリング結果。
+                     
+    Raises:
+        Http404: 指定されたTodoが存在しない、または現在のユーザーが所有していない場合。
+    """
+    todo = get_object_or_404(Todo.objects.with_due_status(), pk=pk, user=request.user)
+    return render(request, 'todo/todo_card.html', {'todo': todo})
+
+
+@login_required
+@require_GET
+def todo_export(request: HttpRequest) -> HttpResponse:
+    """ログイン中のユーザーのTodoをファイルとしてエクスポートするビュー。
+    
+    ``format`` クエリパラメータで 'csv'（既定）または 'ndjson' を指定します。
+    レスポンスは ``StreamingHttpResponse`` で逐次送信するため、
+    Todoの件数に関わらずサーバーのメモリ使用量は一定です
+    （ASGIでは非同期版の :func:`todo.async_views.todo_export` を使用します）。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        エクスポートファイルのストリーミングレスポンス。
+        不正な形式が指定された場合はステータス400のレスポンス。
+    """
+    export_format = request.GET.get('format', FORMAT_CSV)
+    if export_format not in EXPORTERS:
+        return HttpResponseBadRequest('不正なエクスポート形式です。')
+    response = StreamingHttpResponse(
+        EXPORTERS[export_format](request.user.pk),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="todos.{export_format}"'
+    return response
+
+
+@login_required
+def todo_import(request: HttpRequest) -> HttpResponse:
+    """CSV/NDJSONファイルからTodoを一括インポートするビュー。
+    
+    GETリクエストの場合はアップロードフォームを表示し、
+    POSTリクエストの場合はファイルを1行ずつ検証してバッチ単位で登録し、
+    結果（登録件数・エラー行・処理速度）を表示します。
+    文字コードが合わないなどで途中から読み込めなかった場合は、
+    それまでの結果とあわせてファイルのエラーとして理由を表示します。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        インポートフォームのレンダリング結果。
+    """
+    report = None
+    if request.method == 'POST':
+        form = TodoImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            file_format = form.cleaned_data['file_format'] or detect_format(upload.name)
+            if file_format is None:
+                form.add_error('file_format', 'ファイル形式を推定できません。形式を選択してください。')
+            else:
+                encoding = form.cleaned_data['encoding'] or DEFAULT_ENCODING
+                stream = io.TextIOWrapper(upload.file, encoding=encoding, newline='')
+                report = import_todos(request.user, iter_records(stream, file_format))
+                if report.aborted:
+                    form.add_error('file', report.aborted)
+    else:
+        form = TodoImportForm()
+    return render(request, 'todo/todo_import.html', {'form': form, 'report': report})
+
+
+@login_required
+@require_GET
+def todo_search(request: HttpRequest) -> HttpResponse:
+    """ログイン中のユーザーのTodoを全文検索し、結果を表示するビュー。
+    
+    ``q`` クエリパラメータの検索語でタイトルと詳細を検索し、
+    関連度の高い順に ``page`` で指定したページを表示します。
+    
+    Args:
+        request: HTTPリクエストオブジェクト。
+        
+    Returns:
+        検索結果ページのレンダリング結果。
+    """
+    query = request.GET.get('q', '').strip()
+    page = search_todos(request.user.pk, query, parse_page_number(request.GET.get('page')))
+    return render(request, 'todo/todo_search.html', {'query': query, 'page': page, 'todos': page})
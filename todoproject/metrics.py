@@ -0,0 +1,405 @@
+"""リクエストごとのクエリ数・DB時間・テンプレート描画時間・処理時間の計測。
+
+:class:`MetricsMiddleware` はサンプリングしたリクエストについて次の値を
+ビュー名（URL名）ごとに記録します。
+
+- SQLクエリ数とDB時間（各データベース接続の ``execute_wrapper`` で計測）
+- テンプレートの描画時間（:class:`InstrumentedDjangoTemplates` で計測）
+- ミドルウェアから見たリクエスト全体の処理時間
+
+計測値は ``Server-Timing`` レスポンスヘッダーとして返し、プロセス内の
+ヒストグラムに集計して :func:`metrics_view` からPrometheusのテキスト形式で
+公開します。計測中のリクエストは ``contextvars`` で保持するため、
+非同期ビューや ``sync_to_async`` のスレッドで実行されたクエリも
+正しいリクエストに集計されます。サンプリングされなかったリクエストの
+コストは乱数1回とクエリごとのコンテキスト変数の参照だけです。
+
+ヒストグラムはプロセスごとに保持します。複数のワーカープロセスで
+運用する場合、スクレイプごとにいずれか1つのワーカーの値が返ります。
+
+設定:
+    TODO_METRICS_SAMPLE_RATE: 計測するリクエストの割合（0.0〜1.0、既定は1.0）。
+    TODO_METRICS_SERVER_TIMING: ``Server-Timing`` ヘッダーを付けるかどうか（既定はTrue）。
+    TODO_METRICS_TOKEN: 指定した場合、メトリクスの取得に ``Authorization: Bearer <token>`` を要求する。
+    TODO_METRICS_ALLOWED_IPS: トークンなしでメトリクスを取得できる接続元IP（既定はループバックのみ）。
+    TODO_METRICS_COLLECTORS: メトリクス出力に行を追加する関数のパスのリスト
+        （データベース接続とコネクションプールは :func:`collect_database_metrics`）。
+"""
+
+from __future__ import annotations
+
+import hmac
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+from django.template.backends.django import DjangoTemplates
+from django.utils.module_loading import import_string
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+DEFAULT_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+class RequestMetrics:
+    """1つのリクエストの計測値。
+
+    Attributes:
+        queries: 実行したSQLクエリ数。
+        db_time: SQLの実行にかかった合計秒数。
+        template_time: テンプレートの描画にかかった合計秒数。
+    """
+
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self) -> None:
+        """計測値を0で初期化する。"""
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar('todo_request_metrics', default=None)
+
+
+class Histogram:
+    """ラベル付きの累積ヒストグラム（Prometheusのhistogram型）。
+
+    Attributes:
+        name: メトリクス名。
+        help: メトリクスの説明。
+        buckets: バケットの上限値（昇順）。
+    """
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float]) -> None:
+        """空のヒストグラムを作成する。
+
+        Args:
+            name: メトリクス名。
+            help: メトリクスの説明。
+            buckets: バケットの上限値（昇順）。
+        """
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: dict[str, list[float]] = {}
+
+    def observe(self, view: str, value: float) -> None:
+        """観測値を1つ記録する。
+
+        Args:
+            view: ビュー名のラベル。
+            value: 観測値。
+        """
+        with self._lock:
+            # バケットごとの件数、合計、件数
+            series = self._series.setdefault(view, [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> list[str]:
+        """Prometheusのテキスト形式の行を返す。"""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {view: list(values) for view, values in self._series.items()}
+        for view, values in sorted(series.items()):
+            label = _escape_label(view)
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{_format_number(bound)}"}} {count}')
+            lines.append(f'{self.name}_bucket{{view="{label}",le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {_format_number(values[-2])}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {values[-1]}')
+        return lines
+
+    def reset(self) -> None:
+        """記録した値をすべて破棄する。"""
+        with self._lock:
+            self._series.clear()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """リクエストのヒストグラムと、``TODO_METRICS_COLLECTORS`` の収集関数。"""
+
+    def __init__(self) -> None:
+        """ヒストグラムを作成する。"""
+        self.duration = Histogram(
+            'todo_request_duration_seconds', 'ミドルウェアから見たリクエストの処理時間（秒）', DURATION_BUCKETS)
+        self.db_duration = Histogram(
+            'todo_request_db_duration_seconds', 'リクエスト中のSQLの実行時間の合計（秒）', DURATION_BUCKETS)
+        self.template_duration = Histogram(
+            'todo_request_template_duration_seconds', 'リクエスト中のテンプレート描画時間の合計（秒）', DURATION_BUCKETS)
+        self.queries = Histogram(
+            'todo_request_queries', 'リクエスト中に実行したSQLクエリ数', QUERY_COUNT_BUCKETS)
+
+    @property
+    def histograms(self) -> tuple[Histogram, ...]:
+        return (self.duration, self.db_duration, self.template_duration, self.queries)
+
+    def observe(self, view: str, metrics: RequestMetrics, duration: float) -> None:
+        """1つのリクエストの計測値を記録する。"""
+        self.duration.observe(view, duration)
+        self.db_duration.observe(view, metrics.db_time)
+        self.template_duration.observe(view, metrics.template_time)
+        self.queries.observe(view, metrics.queries)
+
+    def render(self) -> str:
+        """すべてのメトリクスをPrometheusのテキスト形式で返す。
+
+        ``settings.TODO_METRICS_COLLECTORS`` に指定した関数が返す行も追加します。
+        """
+        lines: list[str] = []
+        for histogram in self.histograms:
+            lines.extend(histogram.collect())
+        for path in getattr(settings, 'TODO_METRICS_COLLECTORS', ()):
+            lines.extend(import_string(path)())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """ヒストグラムの値をすべて破棄する。"""
+        for histogram in self.histograms:
+            histogram.reset()
+
+
+registry = MetricsRegistry()
+
+# データベースエイリアスごとの、このプロセスで新しく開いた接続の数
+_connections_opened: dict[str, int] = {}
+_connections_lock = threading.Lock()
+
+# psycopg_poolの統計値と、出力するメトリクス名・型・説明・倍率
+POOL_STATS = (
+    ('pool_min', 'todo_db_pool_min_size', 'gauge', 'プールの最小接続数', 1),
+    ('pool_max', 'todo_db_pool_max_size', 'gauge', 'プールの最大接続数', 1),
+    ('pool_size', 'todo_db_pool_size', 'gauge', 'プールが保持している接続数（使用中を含む）', 1),
+    ('pool_available', 'todo_db_pool_available', 'gauge', 'プール内の空き接続数', 1),
+    ('requests_waiting', 'todo_db_pool_requests_waiting', 'gauge', '空き接続を待っている要求数', 1),
+    ('requests_num', 'todo_db_pool_requests_total', 'counter', 'プールへの接続要求数', 1),
+    ('requests_queued', 'todo_db_pool_requests_queued_total', 'counter', '空き接続がなく待たされた要求数', 1),
+    ('requests_wait_ms', 'todo_db_pool_wait_seconds_total', 'counter', '空き接続を待った時間の合計（秒）', 0.001),
+    ('requests_errors', 'todo_db_pool_requests_errors_total', 'counter', 'タイムアウトなどで失敗した要求数', 1),
+    ('connections_num', 'todo_db_pool_connections_opened_total', 'counter', 'プールが開いた接続数', 1),
+)
+
+
+def _execute_wrapper(execute: Callable, sql: str, params: Any, many: bool, context: dict[str, Any]) -> Any:
+    """計測中のリクエストがあればクエリ数と実行時間を記録する。"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def _install_wrapper(connection: Any) -> None:
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+def _on_connection_created(sender: Any, connection: Any, **kwargs: Any) -> None:
+    _install_wrapper(connection)
+    with _connections_lock:
+        _connections_opened[connection.alias] = _connections_opened.get(connection.alias, 0) + 1
+
+
+connection_created.connect(_on_connection_created, dispatch_uid='todoproject_metrics_execute_wrapper')
+
+
+class _TimedTemplate:
+    """描画時間を計測中のリクエストに加算するテンプレートのラッパー。"""
+
+    def __init__(self, template: Any) -> None:
+        self.template = template
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.template, name)
+
+    def render(self, context: Optional[dict[str, Any]] = None, request: Optional[HttpRequest] = None) -> str:
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """テンプレートの描画時間を :class:`MetricsMiddleware` に報告するDjangoテンプレートバックエンド。
+
+    ``render``・``render_to_string`` から描画されるテンプレートが対象です。
+    ``{% include %}`` で読み込まれるテンプレートは呼び出し元の描画時間に含まれます。
+    """
+
+    def from_string(self, template_code: str) -> _TimedTemplate:
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name: str) -> _TimedTemplate:
+        return _TimedTemplate(super().get_template(template_name))
+
+
+def _server_timing(metrics: RequestMetrics, duration: float) -> str:
+    return (
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+        f'tpl;dur={metrics.template_time * 1000:.1f}, '
+        f'total;dur={duration * 1000:.1f}'
+    )
+
+
+class MetricsMiddleware:
+    """サンプリングしたリクエストの計測値を記録し、``Server-Timing`` ヘッダーを付けるミドルウェア。
+
+    同期・非同期のどちらのハンドラーでも動作します。MIDDLEWAREの先頭付近に
+    置くと、他のミドルウェアの処理時間もリクエスト全体の時間に含まれます。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+        """ミドルウェアを初期化する。
+
+        Args:
+            get_response: 次のミドルウェアまたはビューを呼び出す関数。
+        """
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, 'TODO_METRICS_SAMPLE_RATE', 1.0))
+        self.server_timing = getattr(settings, 'TODO_METRICS_SERVER_TIMING', True)
+        # 初期化前に作成済みの接続（同じスレッドのもの）にも計測を組み込む
+        for connection in connections.all(initialized_only=True):
+            _install_wrapper(connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not self._sampled():
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - started)
+
+    def _finish(self, request: HttpRequest, response: HttpResponse,
+                metrics: RequestMetrics, duration: float) -> HttpResponse:
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match is not None else None) or UNRESOLVED_VIEW
+        registry.observe(view, metrics, duration)
+        if self.server_timing:
+            response['Server-Timing'] = _server_timing(metrics, duration)
+        return response
+
+
+def _pool_stats(connection: Any) -> Optional[dict[str, int]]:
+    """接続にコネクションプールが設定されていれば、その統計値を返す。"""
+    if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+        return None
+    pool = getattr(connection, 'pool', None)
+    return pool.get_stats() if pool is not None else None
+
+
+def collect_database_metrics() -> list[str]:
+    """データベース接続とコネクションプールのメトリクスをPrometheusのテキスト形式で返す。
+
+    ``settings.TODO_METRICS_COLLECTORS`` に登録して使用します。新しく開いた
+    接続の数は、永続接続（``CONN_MAX_AGE``）が効いていればリクエスト数に比べて
+    小さくなります。プール（``OPTIONS['pool']``）を設定したエイリアスについては、
+    psycopg_poolの使用状況と空き接続の待ち時間も出力します。
+
+    Returns:
+        メトリクスの行のリスト。
+    """
+    with _connections_lock:
+        opened = dict(_connections_opened)
+    lines = [
+        '# HELP todo_db_connections_opened_total このプロセスで新しく開いたデータベース接続の数',
+        '# TYPE todo_db_connections_opened_total counter',
+    ]
+    lines += [
+        f'todo_db_connections_opened_total{{alias="{_escape_label(alias)}"}} {count}'
+        for alias, count in sorted(opened.items())
+    ]
+
+    pools = {}
+    for connection in connections.all():
+        stats = _pool_stats(connection)
+        if stats is not None:
+            pools[connection.alias] = stats
+    if pools:
+        for key, name, kind, help, scale in POOL_STATS:
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+            lines += [
+                f'{name}{{alias="{_escape_label(alias)}"}} {_format_number(stats.get(key, 0) * scale)}'
+                for alias, stats in sorted(pools.items())
+            ]
+    return lines
+
+
+def _authorized(request: HttpRequest) -> bool:
+    token = getattr(settings, 'TODO_METRICS_TOKEN', '')
+    if token:
+        header = request.headers.get('Authorization', '')
+        return hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+    allowed = getattr(settings, 'TODO_METRICS_ALLOWED_IPS', DEFAULT_ALLOWED_IPS)
+    return request.META.get('REMOTE_ADDR') in allowed
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """集計したメトリクスをPrometheusのテキスト形式で返すビュー。
+
+    Args:
+        request: HTTPリクエストオブジェクト。
+
+    Returns:
+        メトリクスのテキストレスポンス。許可されていない場合はステータス403。
+    """
+    if not _authorized(request):
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
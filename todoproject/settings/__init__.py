@@ -0,0 +1,22 @@
+"""
+Django settings for todoproject project.
+
+設定は環境ごとに分かれています。
+
+- ``base``: すべての環境に共通の設定。
+- ``dev``: 開発用（``runserver``、DEBUG有効）。
+- ``prod``: 本番用（gunicorn/uvicornで起動、DEBUG無効、静的ファイルはWhiteNoiseで配信、
+  秘密鍵などは環境変数から読み込み）。
+
+``DJANGO_SETTINGS_MODULE`` に ``todoproject.settings.dev`` や
+``todoproject.settings.prod`` を直接指定できます。``todoproject.settings``
+（manage.py・wsgi.py・asgi.pyの既定値）を指定した場合は、環境変数
+``DJANGO_ENV`` で選びます（既定は ``dev``）。
+"""
+
+import os
+
+if os.getenv('DJANGO_ENV', 'dev').lower() in ('prod', 'production'):
+    from .prod import *  # noqa: F401,F403
+else:
+    from .dev import *  # noqa: F401,F403
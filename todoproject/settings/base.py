@@ -0,0 +1,308 @@
+"""
+Django settings for todoproject project (common to every environment).
+
+Generated by 'django-admin startproject' using Django 5.2.3.
+Environment specific overrides live in ``dev.py`` and ``prod.py``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+
+from pathlib import Path
+import importlib.util
+import os
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+# prod.py overrides SECRET_KEY and ALLOWED_HOSTS from the environment.
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'django-insecure-3-w2ku@i^zthj4^17wv&w0levc$n4@aeytwfu!_3tkwil!=%db'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'todo',
+]
+
+MIDDLEWARE = [
+    'todoproject.metrics.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'todoproject.urls'
+
+TEMPLATES = [
+    {
+        # 描画時間をMetricsMiddlewareに報告するDjangoTemplatesのサブクラス
+        'BACKEND': 'todoproject.metrics.InstrumentedDjangoTemplates',
+        'DIRS': [BASE_DIR / 'templates'],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'todoproject.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB', 'todoapp'),
+        'USER': os.getenv('POSTGRES_USER', 'todouser'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'todopass'),
+        'HOST': os.getenv('POSTGRES_HOST', 'db'),
+        'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        # 接続をリクエストをまたいで再利用する秒数（0でリクエストごとに接続し直す）。
+        # ヘルスチェックを有効にすると、再利用する前に切断された接続を検出して張り直す
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true',
+    }
+}
+
+# psycopg 3のコネクションプール（Django 5.1以降、``uv sync --extra pool`` が必要）。
+# プールはワーカープロセスごとに作成される。プールと永続接続は併用できないため、
+# 有効にした場合はCONN_MAX_AGEを0にする
+if os.getenv('DB_POOL', 'False').lower() == 'true':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # 空き接続を待つ最大秒数（超えるとリクエストはエラーになる）
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        },
+    }
+
+# SQLiteをテスト用に使用（オーバーライド可能）
+if 'test' in sys.argv or os.getenv('USE_SQLITE_FOR_TESTS', 'False').lower() == 'true':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # ベンチマークなど複数スレッドから同じデータベースを使う場合はファイルを指定する
+        'NAME': os.getenv('SQLITE_PATH', ':memory:'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true',
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Todo一覧の描画結果キャッシュ。TODO_LIST_CACHE_BACKENDで任意のDjangoキャッシュ
+# バックエンド（例: django.core.cache.backends.filebased.FileBasedCache）に差し替え可能。
+# 複数プロセスで運用する場合はプロセス間で共有されるバックエンドを指定すること。
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'todo_list': {
+        'BACKEND': os.getenv('TODO_LIST_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('TODO_LIST_CACHE_LOCATION', 'todo-list'),
+        # 期限ステータスは時刻で変わるため、描画結果の寿命を短めに保つ
+        'TIMEOUT': int(os.getenv('TODO_LIST_CACHE_TIMEOUT', '60')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('TODO_LIST_CACHE_MAX_ENTRIES', '1000')),
+            'CULL_FREQUENCY': int(os.getenv('TODO_LIST_CACHE_CULL_FREQUENCY', '3')),
+        },
+    },
+    # セッションのキャッシュ（TODO_SESSION_MODEがcached_db・write_behindの場合に使用）。
+    # ログアウトを全プロセスに反映するため、複数プロセスでは共有されるバックエンドを指定すること
+    'sessions': {
+        'BACKEND': os.getenv('TODO_SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('TODO_SESSION_CACHE_LOCATION', 'todo-sessions'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('TODO_SESSION_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+}
+
+TODO_LIST_CACHE_ALIAS = 'todo_list'
+
+
+# Sessions and authentication
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+
+# セッションの保存方式（TODO_SESSION_MODE）
+#   db: データベースのみ（Djangoの既定。リクエストごとにdjango_sessionを読む）
+#   cached_db: キャッシュから読み、書き込みはキャッシュとデータベースの両方に同期的に行う
+#   write_behind: キャッシュから読み、データベースへはまとめて遅延して書き込む（todo.sessions）
+TODO_SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'write_behind': 'todo.sessions',
+}
+TODO_SESSION_MODE = os.getenv('TODO_SESSION_MODE', 'db').lower()
+if TODO_SESSION_MODE not in TODO_SESSION_ENGINES:
+    raise ImproperlyConfigured(
+        f'TODO_SESSION_MODE は {", ".join(TODO_SESSION_ENGINES)} のいずれかを指定してください。'
+    )
+SESSION_ENGINE = TODO_SESSION_ENGINES[TODO_SESSION_MODE]
+SESSION_CACHE_ALIAS = 'sessions'
+TODO_SESSION_WRITE_BEHIND_DELAY = float(os.getenv('TODO_SESSION_WRITE_BEHIND_DELAY', '5'))
+TODO_SESSION_WRITE_BEHIND_BATCH = int(os.getenv('TODO_SESSION_WRITE_BEHIND_BATCH', '100'))
+
+# ログイン中のユーザーをプロセス内にTTL秒だけキャッシュする（0で無効）。
+# パスワードの変更やユーザーの無効化が他のプロセスに反映されるまで最大でTTL秒かかる
+AUTHENTICATION_BACKENDS = ['todo.auth_backends.CachedModelBackend']
+TODO_AUTH_USER_CACHE_TTL = float(os.getenv('TODO_AUTH_USER_CACHE_TTL', '60'))
+TODO_AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv('TODO_AUTH_USER_CACHE_MAX_ENTRIES', '10000'))
+
+# ASGIサーバーで動かす場合は一覧・切り替え・JSON APIに非同期ビューを使用する
+TODO_ASYNC_VIEWS = os.getenv('TODO_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# ライブ更新（Server-Sent Events）のイベント配信。InProcessBrokerは同じプロセス内の
+# 購読者にしか届かないため、複数ワーカーではtodo.broker.PostgresBroker（LISTEN/NOTIFY）を使うこと。
+TODO_EVENT_BROKER = os.getenv('TODO_EVENT_BROKER', 'todo.broker.InProcessBroker')
+# 偽にするとイベントのビューが204を返し、一覧ページはライブ更新を行わない
+TODO_EVENTS_ENABLED = os.getenv('TODO_EVENTS_ENABLED', 'True').lower() == 'true'
+TODO_EVENTS_HEARTBEAT = int(os.getenv('TODO_EVENTS_HEARTBEAT', '15'))
+
+# リクエストの計測（todoproject.metrics）。本番ではサンプリング率を下げて常時有効にできる
+TODO_METRICS_SAMPLE_RATE = float(os.getenv('TODO_METRICS_SAMPLE_RATE', '1.0'))
+TODO_METRICS_SERVER_TIMING = os.getenv('TODO_METRICS_SERVER_TIMING', 'True').lower() == 'true'
+TODO_METRICS_TOKEN = os.getenv('TODO_METRICS_TOKEN', '')
+TODO_METRICS_COLLECTORS = [
+    'todo.cache.collect_metrics',
+    'todo.auth_backends.collect_metrics',
+    'todoproject.metrics.collect_database_metrics',
+]
+
+# 差分同期の変更履歴の保持日数。これより古い同期トークンには全件を返す
+TODO_SYNC_RETENTION_DAYS = int(os.getenv('TODO_SYNC_RETENTION_DAYS', '30'))
+
+# 期限のリマインダー（run_reminder_scheduler）。送信先は ConsoleSender / FileSender / MemorySender、
+# または todo.reminders.BaseSender を実装したクラスのパス
+TODO_REMINDER_SENDER = os.getenv('TODO_REMINDER_SENDER', 'todo.reminders.ConsoleSender')
+TODO_REMINDER_FILE_PATH = os.getenv('TODO_REMINDER_FILE_PATH', str(BASE_DIR / 'reminders.ndjson'))
+TODO_REMINDER_INTERVAL = float(os.getenv('TODO_REMINDER_INTERVAL', '60'))
+TODO_REMINDER_BATCH_SIZE = int(os.getenv('TODO_REMINDER_BATCH_SIZE', '500'))
+
+# テストでは一覧キャッシュとユーザーのキャッシュを無効化（キャッシュのテストは個別に設定を上書きする）
+if 'test' in sys.argv:
+    CACHES['todo_list'] = {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+    TODO_AUTH_USER_CACHE_TTL = 0
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.2/topics/auth/passwords/
+
+# 新しく保存するパスワードハッシュの方式（TODO_PASSWORD_HASHER: argon2 / scrypt / pbkdf2）。
+# 他の方式のハッシュも検証でき、ログインに成功した時点で選んだ方式に書き換えられる（todo.hashers）
+TODO_PASSWORD_HASHER_PROFILES = {
+    'argon2': 'todo.hashers.Argon2PasswordHasher',
+    'scrypt': 'todo.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+TODO_PASSWORD_HASHER = os.getenv('TODO_PASSWORD_HASHER', 'pbkdf2').lower()
+if TODO_PASSWORD_HASHER not in TODO_PASSWORD_HASHER_PROFILES:
+    raise ImproperlyConfigured(
+        f'TODO_PASSWORD_HASHER は {", ".join(TODO_PASSWORD_HASHER_PROFILES)} のいずれかを指定してください。'
+    )
+if TODO_PASSWORD_HASHER == 'argon2' and importlib.util.find_spec('argon2') is None:
+    raise ImproperlyConfigured('TODO_PASSWORD_HASHER=argon2 には argon2-cffi が必要です（uv sync --extra argon2）。')
+PASSWORD_HASHERS = [TODO_PASSWORD_HASHER_PROFILES[TODO_PASSWORD_HASHER]] + [
+    path for path in [
+        *TODO_PASSWORD_HASHER_PROFILES.values(),
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    ]
+    if path != TODO_PASSWORD_HASHER_PROFILES[TODO_PASSWORD_HASHER]
+]
+
+# Argon2idのパラメータ（既定はOWASPの推奨値: 19MiB、2回、並列度1）
+TODO_ARGON2_TIME_COST = int(os.getenv('TODO_ARGON2_TIME_COST', '2'))
+TODO_ARGON2_MEMORY_COST = int(os.getenv('TODO_ARGON2_MEMORY_COST', '19456'))  # KiB
+TODO_ARGON2_PARALLELISM = int(os.getenv('TODO_ARGON2_PARALLELISM', '1'))
+# scryptのパラメータ（既定はDjangoと同じ: N=2**14、r=8、p=5）
+TODO_SCRYPT_WORK_FACTOR = int(os.getenv('TODO_SCRYPT_WORK_FACTOR', str(2 ** 14)))
+TODO_SCRYPT_BLOCK_SIZE = int(os.getenv('TODO_SCRYPT_BLOCK_SIZE', '8'))
+TODO_SCRYPT_PARALLELISM = int(os.getenv('TODO_SCRYPT_PARALLELISM', '5'))
+
+# 非同期のログインでパスワードのハッシュを計算するプロセス数（ワーカープロセスごと、0でスレッドで計算）
+TODO_PASSWORD_HASH_WORKERS = int(os.getenv('TODO_PASSWORD_HASH_WORKERS', '0'))
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'ja'
+
+TIME_ZONE = 'Asia/Tokyo'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+LOGIN_URL = '/login/'
+LOGIN_REDIRECT_URL = '/'
+LOGOUT_REDIRECT_URL = '/login/'
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,11 @@
+"""
+Development settings for todoproject project.
+
+``manage.py runserver`` で使用する開発用の設定です。DEBUGが有効な間は
+実行したSQLがすべて ``connection.queries`` に保持されるため、
+負荷試験には使用しないでください。
+"""
+
+from .base import *  # noqa: F401,F403
+
+DEBUG = True
@@ -0,0 +1,96 @@
+"""
+Production settings for todoproject project.
+
+gunicorn（``gunicorn.conf.py``）で起動する本番用の設定です。
+``todoproject.wsgi`` は同期（スレッド）ワーカー、``todoproject.asgi`` は
+uvicornワーカーで動かします。静的ファイルはビルド時に ``STATIC_ROOT`` へ
+集め、WhiteNoiseで各ワーカーから配信します。
+
+必須の環境変数:
+
+- ``DJANGO_SECRET_KEY``
+- ``DJANGO_ALLOWED_HOSTS``（カンマ区切り）
+"""
+
+import multiprocessing
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+from .base import CACHES, DATABASES, MIDDLEWARE, TODO_EVENT_BROKER
+
+DEBUG = False
+
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', '')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('本番環境ではDJANGO_SECRET_KEYを設定してください。')
+
+ALLOWED_HOSTS = [host.strip() for host in os.getenv('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+CSRF_TRUSTED_ORIGINS = [
+    origin.strip() for origin in os.getenv('DJANGO_CSRF_TRUSTED_ORIGINS', '').split(',') if origin.strip()
+]
+
+# 静的ファイルへのリクエストがセッション・認証・CSRFを通らないよう、
+# SecurityMiddlewareの直後でWhiteNoiseが応答する
+MIDDLEWARE = list(MIDDLEWARE)
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        # ハッシュ付きのファイル名で保存し、gzip/brotliで事前圧縮する。
+        # ハッシュ付きのファイルはブラウザに1年間キャッシュさせる
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# HTTPSはgunicornの手前のリバースプロキシで終端することを想定する
+if os.getenv('DJANGO_SECURE_PROXY_SSL_HEADER', 'False').lower() == 'true':
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = os.getenv('DJANGO_SECURE_COOKIES', 'False').lower() == 'true'
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+
+# gunicorn.conf.py と同じ既定値でワーカーの構成を求める
+app_server = os.getenv('APP_SERVER', 'wsgi').lower()
+web_workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# 一覧キャッシュの無効化に使うバージョン番号はキャッシュに保持するため、ワーカーごとの
+# LocMemCacheでは他のワーカーが処理した変更で無効化されず、古い一覧や304を返してしまう。
+# 共有されるバックエンド（TODO_LIST_CACHE_BACKEND）を指定していなければキャッシュを無効にする
+if web_workers > 1 and CACHES['todo_list']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+    CACHES = dict(CACHES, todo_list={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+
+# InProcessBrokerは同じワーカーの購読者にしか配信できず、複数のASGIワーカーでは
+# 他のワーカーが処理した変更が届かない。PostgreSQLならLISTEN/NOTIFYでワーカー間に
+# 配信するブローカーに切り替え、それ以外ではライブ更新を無効にして一覧の再読み込みに任せる
+if app_server == 'asgi' and web_workers > 1 and TODO_EVENT_BROKER == 'todo.broker.InProcessBroker':
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+        TODO_EVENT_BROKER = 'todo.broker.PostgresBroker'
+    else:
+        if os.getenv('TODO_EVENTS_ENABLED', '').lower() == 'true':
+            raise ImproperlyConfigured(
+                '複数のASGIワーカーでライブ更新を有効にする場合は、TODO_EVENT_BROKERに'
+                'プロセス間で共有されるブローカーを指定してください。'
+            )
+        TODO_EVENTS_ENABLED = False
+
+# 本番ではリクエストの計測をサンプリングしてオーバーヘッドを抑える
+TODO_METRICS_SAMPLE_RATE = float(os.getenv('TODO_METRICS_SAMPLE_RATE', '0.1'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.getenv('DJANGO_LOG_LEVEL', 'WARNING'),
+    },
+}